@@ -1,5 +1,12 @@
 from functions import *
 import streamlit as st
+import concurrent.futures
+import io
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
 
 # Configuration de la page
 st.set_page_config(
@@ -10,6 +17,13 @@ st.set_page_config(
 
 # Définition des list_of_list
 list_of_list = []
+# Séquences à écarter de toutes les générations et recherches (liste d'exclusion chargée)
+exclusion = None
+
+@st.cache_resource(max_entries=8)
+def exclusion_cache(identifiant, empreinte, _contenu, _bibliotheque):
+    """Ensemble d'exclusion analysé une seule fois par fichier et par bibliothèque"""
+    return lire_exclusion(_contenu, _bibliotheque)
 
 # Interface Streamlit
 st.markdown("<h1 style='text-align: center;color:grey;'>Peptide Sequence Explorer </h1>",unsafe_allow_html=True)
@@ -19,7 +33,7 @@ st.markdown("---")
 # Sidebar avec informations
 with st.sidebar:
     st.header("Upload your dataset 📥")
-    uploaded_file = st.file_uploader("Upload data", type = ["txt","csv","tsv"],label_visibility = "collapsed")
+    uploaded_file = st.file_uploader("Upload data", type = ["txt","csv","tsv",EXTENSION_BINAIRE[1:]],label_visibility = "collapsed")
     
     # Initialiser session_state
     if 'is_valid' not in st.session_state:
@@ -27,14 +41,11 @@ with st.sidebar:
         st.session_state.list_of_list = []
 
     if uploaded_file is not None:
-        valid,message = valider_fichier_sequences(uploaded_file)
-        if valid:
+        # Analyse mémorisée par empreinte du contenu : gratuite lors des réexécutions
+        bibliotheque, message = charger_bibliotheque(uploaded_file.getvalue())
+        if bibliotheque is not None:
             st.session_state.is_valid = True
-            uploaded_file.seek(0)
-            dataframe = pd.read_table(uploaded_file,header=None)
-            for index, row in dataframe.iterrows():
-                row = re.findall(r"[A-Za-z0-9]+","".join(row))
-                list_of_list.append(row)
+            list_of_list = bibliotheque
             st.session_state.list_of_list = list_of_list
         else:
             st.error(message)
@@ -51,6 +62,39 @@ with st.sidebar:
     else :
         st.metric("Total number of sequences", f"{total:,}")
         st.metric("Peptide length",f"{len(list_of_list)} amino acids")
+        if list_of_list.codes is not None:
+            st.metric("Stored sequences (compiled library)", f"{len(list_of_list.codes):,}")
+
+    if st.session_state.is_valid:
+        # Séquences déjà synthétisées ou testées : jamais générées ni proposées
+        st.header("Exclusion list 🚫")
+        fichier_exclusion = st.file_uploader(
+            "Sequences to exclude (one per line) or a saved exclusion set",
+            type=["txt", "csv", EXTENSION_EXCLUSION[1:]],
+            key="exclusion_file"
+        )
+        if fichier_exclusion is not None:
+            try:
+                exclusion, n_ignorees = exclusion_cache(fichier_exclusion.file_id, empreinte_alphabets(list_of_list),
+                                                        fichier_exclusion.getvalue(), list_of_list)
+                st.metric("Excluded sequences", f"{len(exclusion):,}")
+                if n_ignorees:
+                    st.caption(f"{n_ignorees:,} line(s) not in the library were ignored.")
+                if not fichier_exclusion.name.endswith(EXTENSION_EXCLUSION):
+                    fichier_compact = io.BytesIO()
+                    exclusion.sauvegarder(fichier_compact)
+                    st.download_button(
+                        label="💾 Save as compact exclusion set",
+                        data=fichier_compact.getvalue(),
+                        file_name=f"exclusion{EXTENSION_EXCLUSION}",
+                        mime="application/octet-stream"
+                    )
+            except ValueError as e:
+                st.error(f"❌ {e}")
+                exclusion = None
+    
+    # pH utilisé pour la charge nette dans les tableaux, les exports et l'analyse
+    ph = st.number_input("pH (net charge)", min_value=0.0, max_value=14.0, value=7.0, step=0.1)
     
     st.markdown("---")
     if len(list_of_list) == 0 :
@@ -64,11 +108,13 @@ with st.sidebar:
             st.write(", ".join(pos))
 
 # Onglets principaux
-tab1, tab2, tab3, tab4 = st.tabs([
+tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
     "🎲 Random Sequences ", 
     "📋 First Sequences", 
     "🔍 Motif-based search",
-    "📊 Properties"
+    "📊 Properties",
+    "📈 Library profile",
+    "🏆 Top scores"
 ])
 
 if total < 1000000 : 
@@ -79,6 +125,290 @@ if total < 100 :
     value=total
 else :
     value=100
+# Les exports sont écrits par blocs : ils peuvent dépasser la limite d'affichage
+maxexport = min(total, 10000000)
+
+# Sélection diversifiée : coût quadratique en nombre de séquences
+MAX_DIVERSE = 50000
+# Recherche des plus proches voisins en lot : nombre maximal de requêtes
+MAX_REQUETES_VOISINS = 10000
+# Tâches en arrière-plan : threads partagés par tout le serveur, tâches simultanées par session,
+# intervalle de rafraîchissement de l'avancement (s) et nombre de résultats partiels affichés
+MAX_TACHES_SERVEUR = 4
+MAX_TACHES_SESSION = 2
+# Processus d'un parcours exhaustif : le budget du serveur (un processus par cœur) est partagé
+# entre ses tâches simultanées
+MAX_PROCESSUS_TACHE = max(1, (os.cpu_count() or 1) // MAX_TACHES_SERVEUR)
+INTERVALLE_SUIVI = 0.5
+APERCU_TACHE = 1000
+
+# Exports des résultats : répertoire dédié, fichiers supprimés DUREE_EXPORTS secondes
+# après leur dernière écriture (sessions fermées sans nouvelle recherche)
+REPERTOIRE_EXPORTS = os.path.join(tempfile.gettempdir(), "psexplorer_exports")
+DUREE_EXPORTS = 3600
+
+NOMS_FORMATS = {'csv': "CSV", 'csv.gz': "Compressed CSV (gzip)", 'parquet': "Parquet",
+                'onehot.npy': "One-hot features (NumPy)", 'descriptors.npy': "Residue descriptors (NumPy)"}
+
+@st.cache_resource(ttl=DUREE_EXPORTS // 4)
+def nettoyer_exports():
+    """Supprime les exports expirés ; exécuté au plus une fois par quart de DUREE_EXPORTS pour tout le serveur"""
+    limite = time.time() - DUREE_EXPORTS
+    for entree in os.scandir(REPERTOIRE_EXPORTS) if os.path.isdir(REPERTOIRE_EXPORTS) else []:
+        try:
+            if entree.stat().st_mtime < limite:
+                os.remove(entree.path)
+        except OSError:
+            pass  # fichier supprimé entre-temps par une autre session
+
+def nouvel_export(format_export):
+    """Chemin d'un nouveau fichier d'export dans REPERTOIRE_EXPORTS"""
+    os.makedirs(REPERTOIRE_EXPORTS, exist_ok=True)
+    fd, chemin = tempfile.mkstemp(suffix=FORMATS_EXPORT[format_export][0], dir=REPERTOIRE_EXPORTS)
+    os.close(fd)
+    return chemin
+
+nettoyer_exports()
+
+def bouton_fichier(chemin, format_export, nom_fichier):
+    """Propose au téléchargement un fichier d'export déjà écrit"""
+    extension, mime = FORMATS_EXPORT[format_export]
+    if chemin is None or not os.path.exists(chemin):
+        st.info("The export file has expired, run the operation again to download it")
+        return
+    with open(chemin, 'rb') as f:
+        st.download_button(
+            label=f"📥 Export as {NOMS_FORMATS[format_export]}",
+            data=f,
+            file_name=nom_fichier + extension,
+            mime=mime
+        )
+
+def bouton_export(lots, format_export, nom_fichier, premier=1, colonnes=None):
+    """Écrit l'export par blocs dans un fichier temporaire puis le propose au téléchargement
+    colonnes : {nom: valeurs} exportées avec les séquences (voir exporter_sequences)"""
+    chemin = exporter_sequences(lots, format_export, premier, proprietes=True, ph=ph, colonnes=colonnes)
+    bouton_fichier(chemin, format_export, nom_fichier)
+    os.remove(chemin)
+
+def oublier_resultats():
+    """Oublie les résultats de la dernière recherche par motif et supprime leur export"""
+    precedents = st.session_state.pop("resultats_motif", None)
+    if precedents is not None and precedents['export'] is not None and os.path.exists(precedents['export']):
+        os.remove(precedents['export'])
+
+def memoriser_resultats(sequences, premier, n_match, mode, motif, export, format_export, nom_fichier):
+    """Conserve les résultats d'une recherche par motif d'une réexécution à l'autre
+    L'export a été écrit par la tâche de recherche"""
+    oublier_resultats()
+    st.session_state.resultats_motif = {
+        'sequences': sequences,
+        'premier': premier,
+        'n_match': n_match,
+        'mode': mode,
+        'motif': motif,
+        'export': export,
+        'format': format_export,
+        'nom_fichier': nom_fichier,
+    }
+    st.session_state.page_motif = 1
+
+def afficher_resultats_motif(mode):
+    """Affiche une page des résultats de la dernière recherche par motif
+    Seules les séquences de la page sont colorées, mises en forme et envoyées au navigateur"""
+    resultats = st.session_state.get("resultats_motif")
+    if resultats is None or resultats['mode'] != mode:
+        return
+    sequences, premier = resultats['sequences'], resultats['premier']
+    if resultats['n_match'] is not None:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Matching sequences", f"{resultats['n_match']:,}")
+        col2.metric("Total number of sequences", f"{total:,}")
+        col3.metric("Share of the library", f"{100 * resultats['n_match'] / total:.3g} %")
+    if not sequences:
+        st.warning("⚠️ No sequence found for this motif")
+        return
+    st.success(f"✅ {len(sequences)} sequence(s) find")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        taille_page = st.selectbox("Rows per page", [50, 100, 500, 1000, 5000], index=1, key="taille_page_motif")
+    n_pages = -(-len(sequences) // taille_page)
+    # Le nombre de pages change avec la taille de page : on reste dans les bornes
+    if st.session_state.get("page_motif", 1) > n_pages:
+        st.session_state.page_motif = n_pages
+    with col2:
+        page = st.number_input(f"Page (1 to {n_pages:,})", min_value=1, max_value=n_pages, key="page_motif")
+    debut = (page - 1) * taille_page
+    lot = sequences[debut:debut + taille_page]
+
+    # Construction d’un seul DataFrame avec HTML, pour la page affichée uniquement
+    surligner = highlight_motif if mode == "Fix position" else highlight_motif_regex
+    df = pd.DataFrame({'N°': range(premier + debut, premier + debut + len(lot)),
+                       'Sequence': [surligner(seq, resultats['motif']) for seq in lot]})
+    df = pd.concat([df, calculer_proprietes_lot(lot, ph)], axis=1)
+
+    # Affichage avec HTML (motifs en rouge)
+    table_html = df.to_html(escape=False,
+                            index=False,
+                            justify="left").replace('<table', '<table style="margin: 0; width:100%;border-collapse: collapse;"')
+    html_block = f"""
+    <div style="
+        width: 100%;
+        max-height: 600px;
+        heigth : auto;
+        overflow-y: scroll;
+        overflow-x: auto;
+        padding: 0;
+        margin: 0 0 20px 0;
+    ">
+        {table_html}
+    </div>
+    """
+    st.markdown(html_block, unsafe_allow_html=True)
+
+    # Export : séquences brutes, sans le HTML de coloration
+    bouton_fichier(resultats['export'], resultats['format'], resultats['nom_fichier'])
+
+def oublier_sequences(cle):
+    """Oublie les séquences générées par un onglet et supprime leur export"""
+    precedents = st.session_state.pop(f"resultats_{cle}", None)
+    if precedents is not None and precedents['export'] is not None and os.path.exists(precedents['export']):
+        os.remove(precedents['export'])
+
+def memoriser_sequences(cle, sequences, premier, export, n_export, format_export, nom_fichier, distances=None):
+    """Conserve les séquences affichées par un onglet d'une réexécution à l'autre
+    L'export (n_export séquences) a été écrit par la tâche ; seules les séquences affichées restent en mémoire"""
+    oublier_sequences(cle)
+    st.session_state[f"resultats_{cle}"] = {
+        'sequences': sequences,
+        'premier': premier,
+        'n_export': n_export,
+        'export': export,
+        'format': format_export,
+        'nom_fichier': nom_fichier,
+        'distances': distances,
+    }
+
+def afficher_sequences(cle):
+    """Affiche les séquences générées par un onglet (seules les premières sont affichées)"""
+    resultats = st.session_state.get(f"resultats_{cle}")
+    if resultats is None:
+        return
+    sequences, premier = resultats['sequences'], resultats['premier']
+    st.success(f"✅ {resultats['n_export']} sequences generated")
+    if resultats['distances'] is not None and resultats['distances'][0] is not None:
+        distance_min, distance_moyenne = resultats['distances']
+        col1, col2 = st.columns(2)
+        col1.metric("Minimum pairwise distance", f"{distance_min} / {len(list_of_list)}")
+        col2.metric("Mean pairwise distance", f"{distance_moyenne:.2f} / {len(list_of_list)}")
+    n_affiches = min(len(sequences), maxvalue)
+    if resultats['n_export'] > n_affiches:
+        st.info(f"Only the first {n_affiches:,} sequences are displayed, the export contains all {resultats['n_export']:,}")
+
+    # Affichage en DataFrame (seules les premières séquences sont affichées)
+    df = sequences[:n_affiches].to_pandas(index=pd.RangeIndex(premier, premier + n_affiches, name='N°'))
+    df = df.join(calculer_proprietes_lot(sequences[:n_affiches], ph).set_index(df.index))
+    st.dataframe(df, width='stretch')
+    bouton_fichier(resultats['export'], resultats['format'], resultats['nom_fichier'])
+
+@st.cache_resource
+def executeur_taches():
+    """Exécuteur partagé par toutes les sessions du serveur : son nombre de threads borne
+    les tâches exécutées en même temps, les suivantes attendent un thread libre"""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=MAX_TACHES_SERVEUR, thread_name_prefix="psexplorer")
+
+def lancer_tache(cle, construire, terminer, format_export=None, premier=1, garder=None):
+    """Soumet la tâche d'un onglet à l'exécuteur partagé (la précédente du même onglet est annulée)
+    construire() crée la tâche ; terminer(tache) conserve ses résultats une fois terminée ou annulée
+    format_export : la tâche écrit elle-même son export (tache.export), en ne gardant en mémoire
+    que ses garder premières séquences"""
+    taches = st.session_state.setdefault("taches", {})
+    actives = [c for c, (tache, _) in taches.items() if tache.active and c != cle]
+    if len(actives) >= MAX_TACHES_SESSION:
+        st.error(f"❌ {len(actives)} operations already running in this session, cancel one or wait for it to finish")
+        return
+    if cle in taches:
+        taches[cle][0].annuler()
+    try:
+        tache = construire()
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    if format_export is not None:
+        tache.exporter(format_export, premier, proprietes=True, ph=ph, destination=nouvel_export(format_export), garder=garder)
+    taches[cle] = (tache.soumettre(executeur_taches()), terminer)
+
+def suivre_tache(cle):
+    """Avancement de la tâche d'un onglet, rafraîchi tant qu'elle s'exécute, avec un bouton
+    d'annulation et un aperçu des premiers résultats ; ses résultats sont conservés à la fin"""
+    tache, terminer = st.session_state.get("taches", {}).get(cle, (None, None))
+    if tache is None:
+        return
+
+    @st.fragment(run_every=INTERVALLE_SUIVI if tache.active else None)
+    def avancement():
+        if tache.etat == 'failed':
+            st.error(f"❌ {tache.erreur}")
+            return
+        if not tache.active:
+            del st.session_state.taches[cle]
+            terminer(tache)
+            st.rerun()
+        if tache.etat == 'queued':
+            st.info("⏳ Waiting for a free worker (other operations are running on the server)...")
+        st.progress(tache.fraction(), text=f"{tache.avancement:,} / {tache.a_faire:,} {tache.unite} · "
+                                           f"{tache.n_resultats:,} result(s) so far")
+        st.button("⏹ Cancel", key=f"annuler_{cle}", on_click=tache.annuler)
+        if tache.n_resultats:
+            st.dataframe(tache.resultats(APERCU_TACHE).to_pandas(index=pd.RangeIndex(1, min(tache.n_resultats, APERCU_TACHE) + 1, name='N°')),
+                         width='stretch', height=250)
+
+    avancement()
+
+def options_voisins(cle):
+    """Nombre de voisins et distance choisis pour la recherche des plus proches séquences"""
+    col1, col2 = st.columns(2)
+    with col1:
+        k_voisins = st.number_input("Number of neighbors", min_value=1, max_value=1000, value=10, key=f"k_voisins_{cle}")
+    with col2:
+        mesure_voisins = st.radio("Distance", MESURES_VOISINS, horizontal=True, key=f"mesure_voisins_{cle}",
+                                  help="Hamming: number of different positions. BLOSUM62: highest substitution score.")
+    return k_voisins, mesure_voisins
+
+def saisir_contraintes(suffixe=""):
+    """Fenêtres min/max facultatives sur les propriétés : {propriété: (min, max)}"""
+    with st.expander("🎯 Property constraints (optional)"):
+        st.caption("Only sequences whose properties fall in every window are returned and counted. "
+                   "Windows apply to the values shown in the result tables, with the same rounding.")
+        proprietes_contraintes = st.multiselect(
+            "Constrained properties",
+            PROPRIETES_PROFIL,
+            key=f"proprietes_contraintes{suffixe}",
+            disabled=not st.session_state.is_valid
+        )
+        contraintes = {}
+        for propriete in proprietes_contraintes:
+            pas = 1 if propriete in ['Hydrophobics', 'Charged', 'Polars', 'Glycines'] else 0.01
+            col1, col2 = st.columns(2)
+            with col1:
+                minimum = st.number_input(f"{propriete} min", value=None, step=pas,
+                                          placeholder="No minimum", key=f"contrainte_min_{propriete}{suffixe}")
+            with col2:
+                maximum = st.number_input(f"{propriete} max", value=None, step=pas,
+                                          placeholder="No maximum", key=f"contrainte_max_{propriete}{suffixe}")
+            contraintes[propriete] = (minimum, maximum)
+    return contraintes
+
+@st.cache_data(max_entries=64)
+def distribution_cache(empreinte, propriete, ph, _bibliotheque):
+    """Distribution exacte d'une propriété, mémorisée entre deux réexécutions du script
+    (la bibliothèque est identifiée par l'empreinte de son fichier)
+    Retourne (distribution, None) ou (None, message) : les échecs sont aussi mémorisés"""
+    try:
+        return distribution_propriete(_bibliotheque, propriete, ph), None
+    except ValueError as e:
+        return None, str(e)
 
 
 # Tab 1: Sequences aléatoires
@@ -86,73 +416,121 @@ with tab1:
     st.header("Generation of random sequences")
     if not st.session_state.is_valid:
         st.info("*Please upload a valid file in the sidebar to use this feature*")
-    n_random = st.number_input(
-        "Number of sequences to generate",
-        min_value=1,
-        max_value=maxvalue,
-        value=value,
-        step=10,
-        disabled=not st.session_state.is_valid
+    # Tirage uniforme, ou sélection de séquences aussi éloignées que possible (distance de Hamming)
+    echantillonnage = st.radio(
+        "Sampling",
+        ["Uniform", "Diverse (max-min)", "Diverse (balanced design)"],
+        horizontal=True,
+        key="sampling_random",
+        disabled=not st.session_state.is_valid,
+        help="Max-min picks, among 4× more uniform candidates, each sequence as far as possible from the ones already chosen. "
+             "The balanced design uses every option equally often at each position."
     )
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        n_random = st.number_input(
+            "Number of sequences to generate",
+            min_value=1,
+            max_value=maxexport,
+            value=value,
+            step=10,
+            disabled=not st.session_state.is_valid
+        )
+    with col2:
+        # Graine optionnelle pour un tirage reproductible
+        seed_random = st.number_input(
+            "Seed (optional)",
+            min_value=0,
+            value=None,
+            step=1,
+            key="seed_random",
+            disabled=not st.session_state.is_valid
+        )
+    with col3:
+        format_random = st.selectbox(
+            "Export format",
+            list(FORMATS_EXPORT),
+            format_func=NOMS_FORMATS.get,
+            key="format_random",
+            disabled=not st.session_state.is_valid
+        )
     
-    if st.button("🎲 Generate", key="gen_random",disabled=not st.session_state.is_valid):
-        with st.spinner("Generation in progress..."):
-            sequences = generer_aleatoires(n_random,list_of_list)
-            
-            st.success(f"✅ {len(sequences)} sequences generated")
-            
-            # Affichage en DataFrame
-            df = pd.DataFrame({
-                'Sequence': sequences
-                }, index=range(1, len(sequences) + 1))
-            df.index.name = 'N°'
-            st.dataframe(df, width='stretch')
-            
-            # Bouton de téléchargement
-            csv = df.to_csv(index=True)
-            st.download_button(
-                label="📤 Export as CSV",
-                data=csv,
-                file_name="random_sequences.csv",
-                mime="text/csv"
-            )
+    diversifie = echantillonnage != "Uniform"
+    if diversifie and n_random > MAX_DIVERSE:
+        st.warning(f"⚠️ Diverse sampling is limited to {MAX_DIVERSE:,} sequences")
+
+    if st.button("🎲 Generate", key="gen_random",disabled=not st.session_state.is_valid or (diversifie and n_random > MAX_DIVERSE)):
+        oublier_sequences("random")
+        if not diversifie:
+            construire = lambda: tache_aleatoires(n_random, list_of_list, seed_random, exclusion=exclusion)
+        else:
+            methode = 'maxmin' if echantillonnage == "Diverse (max-min)" else 'equilibre'
+            construire = lambda: tache_diversifiees(n_random, list_of_list, seed_random, methode, exclusion=exclusion)
+
+        def terminer(tache, format_random=format_random, diversifie=diversifie):
+            memoriser_sequences("random", tache.resultats(), 1, tache.export, tache.n_resultats, format_random,
+                                "random_sequences", tache.details if diversifie else None)
+
+        lancer_tache("random", construire, terminer, format_random, garder=maxvalue)
+
+    # Avancement de la génération en cours, puis séquences générées (conservées entre les réexécutions)
+    suivre_tache("random")
+    afficher_sequences("random")
 
 # Tab 2: Premières sequences
 with tab2:
     st.header("First sequences (alphabetic order)")
     if not st.session_state.is_valid:
         st.info("*Please upload a valid file in the sidebar to use this feature*")
-    n_first = st.number_input(
-        "Number of sequences to display",
-        min_value=1,
-        max_value=maxvalue,
-        value=value,
-        step=10,
-        key="n_first",
-        disabled=not st.session_state.is_valid
-    )
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        n_first = st.number_input(
+            "Number of sequences to display",
+            min_value=1,
+            max_value=maxexport,
+            value=value,
+            step=10,
+            key="n_first",
+            disabled=not st.session_state.is_valid
+        )
+    with col2:
+        # Rang de départ : permet de parcourir la bibliothèque page par page
+        start_first = st.number_input(
+            "Start at rank",
+            min_value=1,
+            max_value=max(1, min(total, 2**53 - 1)),
+            value=1,
+            step=n_first,
+            key="start_first",
+            disabled=not st.session_state.is_valid
+        )
+    with col3:
+        format_first = st.selectbox(
+            "Export format",
+            list(FORMATS_EXPORT),
+            format_func=NOMS_FORMATS.get,
+            key="format_first",
+            disabled=not st.session_state.is_valid
+        )
     
     if st.button("📋 Generate", key="gen_first",disabled=not st.session_state.is_valid):
-        with st.spinner("Generation in progress..."):
-            sequences = generer_premieres(n_first,list_of_list)
-            
-            st.success(f"✅ {len(sequences)} sequences generated")
-            
-             # Affichage en DataFrame
-            df = pd.DataFrame({
-                'Sequence': sequences
-                }, index=range(1, len(sequences) + 1))
-            df.index.name = 'N°'
-            st.dataframe(df, width='stretch')
-            
-            csv = df.to_csv(index=True)
-            st.download_button(
-                label="📥 Export as CSV",
-                data=csv,
-                file_name=f"first_{n_first}_sequences.csv",
-                mime="text/csv"
+        oublier_sequences("first")
+        n_first = min(n_first, compter_libres(list_of_list, exclusion, start_first - 1))
+
+        # La tâche écrit toutes les séquences dans l'export, seules les premières restent en mémoire (affichage)
+        def terminer(tache, start_first=start_first, format_first=format_first):
+            n_export = tache.n_resultats
+            memoriser_sequences(
+                "first", tache.resultats(), start_first, tache.export, n_export, format_first,
+                f"first_{n_export}_sequences" if start_first == 1 else f"sequences_{start_first}_to_{start_first + n_export - 1}"
             )
 
+        lancer_tache("first", lambda: tache_premieres(n_first, list_of_list, start_first - 1, exclusion=exclusion), terminer,
+                     format_first, premier=start_first, garder=maxvalue)
+
+    suivre_tache("first")
+    afficher_sequences("first")
+
 # Tab 3: Recherche par motif
 with tab3:
     st.header("Motif-based search")
@@ -169,16 +547,17 @@ with tab3:
         st.info(f"""
         **Instructions:**
         - Use `'-'` as a wildcard character to represent any amino acid
-        - The length must be exactly {len(list_of_list)} characters
+        - Use `[KR]` for "K or R" and `[^P]` for "anything but P" at a single position
+        - The motif must describe exactly {len(list_of_list)} positions
         - Example: `A--R---K-------` finds all  sequences starting with A, with R in position 4 and K in the position 8
+        - Example: `---[KR]--[^P]--------` finds all sequences with K or R in position 4 and no P in position 7
         """)
 
         col1, col2 = st.columns([3, 1])
         with col1:
             motif = st.text_input(
-                f"Enter your motif ({len(list_of_list)} characters)",
+                f"Enter your motif ({len(list_of_list)} positions)",
                 value="-"*len(list_of_list),
-                max_chars=len(list_of_list),
                 disabled=not st.session_state.is_valid
             ).upper()
         
@@ -191,64 +570,58 @@ with tab3:
                 disabled=not st.session_state.is_valid
             )
         
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            random_motif = st.checkbox(
+                "Random sample of matches (instead of the first ones)",
+                key="random_motif",
+                disabled=not st.session_state.is_valid
+            )
+        with col2:
+            # Pagination dans les correspondances (ordre alphabétique)
+            start_motif = st.number_input(
+                "Start at match",
+                min_value=1,
+                max_value=max(1, min(total, 2**53 - 1)),
+                value=1,
+                step=max_results,
+                key="start_motif",
+                disabled=not st.session_state.is_valid or random_motif
+            )
+        with col3:
+            format_motif = st.selectbox(
+                "Export format",
+                list(FORMATS_EXPORT),
+                format_func=NOMS_FORMATS.get,
+                key="format_motif",
+                disabled=not st.session_state.is_valid
+            )
+        
+        # Contraintes optionnelles sur les propriétés (fenêtres min/max)
+        contraintes = saisir_contraintes()
+
         if st.button("🔍 Search", key="search_motif",disabled=not st.session_state.is_valid):
-            if len(motif) != len(list_of_list):
-                st.error(f"❌ The motif must contains exactly {len(list_of_list)} characters !")
+            oublier_resultats()
+            if len(decouper_motif(motif)) != len(list_of_list):
+                st.error(f"❌ The motif must describe exactly {len(list_of_list)} positions !")
             else:
-                errors = []
-                for i, char in enumerate(motif):
-                    if char != '-':
-                        if char not in [x.upper() for x in list_of_list[i]]:
-                            errors.append(f"Position {i+1}: '{char}' is not valid at this position. Options avalaible: {', '.join(list_of_list[i])}")
+                _, errors = analyser_motif(motif, list_of_list)
                 if errors:
                     st.error("❌ Invalid motif !")
                     for error in errors:
                         st.warning(error)
-                else :  
-                    with st.spinner("Search in progress..."):
-                        sequences = chercher_motif(motif, max_results,list_of_list)
-                        if sequences:
-                            st.success(f"✅ {len(sequences)} sequence(s) find")
-                            # Construction d’un seul DataFrame avec HTML
-                            sequences_colored = [highlight_motif(seq, motif) for seq in sequences]
-
-                            df = pd.DataFrame({'N°':range(1, len(sequences)+1),
-                                               'Sequence': sequences_colored})
-                            
-                            # Affichage avec HTML (motifs en rouge)
-                            max_height = 600
-                            table_html = df.to_html(escape=False, 
-                                                    index=False,
-                                                    justify="left").replace('<table', '<table style="margin: 0; width:100%;border-collapse: collapse;"')
-                            html_block = f"""
-                            <div style="
-                                width: 100%;
-                                max-height: 600px;
-                                heigth : auto;
-                                overflow-y: scroll;
-                                overflow-x: auto;
-                                padding: 0;
-                                margin: 0 0 20px 0;
-                            ">
-                                {table_html}
-                            </div>
-                            """
-                            st.markdown(html_block, unsafe_allow_html=True)
-
-                            # Export CSV : nettoyer le HTML en retirant les balises avant export
-                            df_csv = pd.DataFrame({'Sequence': sequences}, 
-                                index=range(1, len(sequences) + 1))
-                            df_csv.index.name = 'N°'
-                            
-                            csv = df_csv.to_csv(index=True)
-                            st.download_button(
-                                label="📥 Export as CSV",
-                                data=csv,
-                                file_name=f"sequences_motif_{motif}.csv",
-                                mime="text/csv"
-                            )
-                        else:
-                            st.warning("⚠️ No sequence found for this motif")
+                else :
+                    premier = 1 if random_motif else start_motif
+
+                    # Nombre exact de correspondances dans toute la bibliothèque : details de la tâche
+                    def terminer(tache, premier=premier, motif=motif, format_motif=format_motif):
+                        memoriser_resultats(tache.resultats(), premier, tache.details, "Fix position", motif,
+                                            tache.export, format_motif, f"sequences_motif_{motif}")
+
+                    lancer_tache("motif", lambda: tache_motif(motif, max_results, list_of_list, aleatoire=random_motif,
+                                                              offset=start_motif - 1, contraintes=contraintes, ph=ph,
+                                                              exclusion=exclusion),
+                                 terminer, format_motif, premier=premier)
     else:  # Mode regex
         st.info("""
                 **Instructions:**
@@ -280,50 +653,53 @@ with tab3:
                 disabled=not st.session_state.is_valid
             )
 
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            random_regex = st.checkbox(
+                "Random sample of matches (instead of the first ones)",
+                key="random_regex",
+                disabled=not st.session_state.is_valid
+            )
+        with col2:
+            format_regex = st.selectbox(
+                "Export format",
+                list(FORMATS_EXPORT),
+                format_func=NOMS_FORMATS.get,
+                key="format_regex",
+                disabled=not st.session_state.is_valid
+            )
+
+        # Parcours exhaustif (motifs contenant d'autres caractères regex que des lettres et des *)
+        with st.expander("⚙️ Exhaustive scan settings"):
+            st.caption("Only used for motifs with regex syntax beyond letters and `*` (e.g. `*[KR]{3}*`): "
+                       "the library is split into contiguous shards scanned in parallel, results are identical to a serial scan.")
+            col1, col2 = st.columns(2)
+            with col1:
+                n_workers = st.number_input("Worker processes", min_value=1, max_value=MAX_PROCESSUS_TACHE,
+                                            value=1, key="n_workers",
+                                            help=f"At most {MAX_PROCESSUS_TACHE}: the server's cores are shared "
+                                                 f"by its {MAX_TACHES_SERVEUR} simultaneous jobs")
+            with col2:
+                taille_tranche = st.number_input("Shard size (sequences)", min_value=1000, max_value=100000000,
+                                                 value=1000000, step=100000, key="taille_tranche")
+
         if st.button("🔍 Search", key="search_motif",disabled=not st.session_state.is_valid):
-            with st.spinner("Search in progress..."):
-                sequences = chercher_regex_motif(pattern, max_results_regex,list_of_list)
-                if sequences:
-                    st.success(f"✅ {len(sequences)} sequence(s) find")
-                    # Construction d’un seul DataFrame avec HTML
-                    sequences_colored = [highlight_motif_regex(seq, pattern) for seq in sequences]
-                    df = pd.DataFrame({'N°':range(1, len(sequences)+1),
-                                       'Sequence': sequences_colored})
-                            
-                    # Affichage avec HTML (motifs en rouge)
-                    max_height = 600
-                    table_html = df.to_html(escape=False, 
-                                            index=False,
-                                            justify="left").replace('<table', '<table style="margin: 0; width:100%;border-collapse: collapse;"')
-                    html_block = f"""
-                    <div style="
-                    width: 100%;
-                    max-height: 600px;
-                    heigth : auto;
-                    overflow-y: scroll;
-                    overflow-x: auto;
-                    padding: 0;
-                    margin: 0 0 20px 0;
-                    ">
-                    {table_html}
-                    </div>
-                    """
-                    st.markdown(html_block, unsafe_allow_html=True)
-                            
-                    # Export CSV : nettoyer le HTML en retirant les balises avant export
-                    df_csv = pd.DataFrame({'Sequence': sequences}, 
-                                          index=range(1, len(sequences) + 1))
-                    df_csv.index.name = 'N°'
-                    
-                    csv = df_csv.to_csv(index=True)
-                    st.download_button(
-                        label="📥 Export as CSV",
-                        data=csv,
-                        file_name=f"sequences_motif_{pattern}.csv",
-                        mime="text/csv"
-                    )
-                else:
-                    st.warning("⚠️ No sequence found for this motif")
+            oublier_resultats()
+
+            # Nombre exact de correspondances (indisponible pour les regex non compilables)
+            def terminer(tache, pattern=pattern, format_regex=format_regex):
+                memoriser_resultats(tache.resultats(), 1, tache.details, "Flexible position", pattern,
+                                    tache.export, format_regex, f"sequences_motif_{pattern}")
+
+            lancer_tache("motif", lambda: tache_regex_motif(pattern, max_results_regex, list_of_list, aleatoire=random_regex,
+                                                            n_workers=n_workers, taille_tranche=taille_tranche,
+                                                            exclusion=exclusion),
+                         terminer, format_regex)
+
+    # Avancement de la recherche en cours, puis page demandée des résultats de la dernière
+    # recherche (conservés entre les réexécutions)
+    suivre_tache("motif")
+    afficher_resultats_motif(search_mode)
 
         
 # Tab 4: Analyse de propriétés
@@ -350,6 +726,20 @@ with tab4:
                     valid = False
                     st.error(f"❌ '{aa}' is not valid in position {i+1}. Options: {', '.join(list_of_list[i])}")
                     break
+
+            if not valid:
+                # Séquences les plus proches dans la bibliothèque, exactes et sans parcours
+                st.subheader("Nearest library members:")
+                k_voisins, mesure_voisins = options_voisins("single")
+                try:
+                    voisins, distances, scores = plus_proches(seq_input, k_voisins, list_of_list, mesure_voisins, exclusion)
+                    df_voisins = pd.DataFrame({'Sequence': voisins.sequences(), 'Distance': distances},
+                                              index=pd.RangeIndex(1, len(voisins) + 1, name='N°'))
+                    if scores is not None:
+                        df_voisins['BLOSUM62 score'] = scores
+                    st.dataframe(df_voisins, width='stretch')
+                except ValueError as e:
+                    st.error(f"❌ {e}")
             
             if valid:
                 st.success("✅ Valid sequence!")
@@ -359,7 +749,7 @@ with tab4:
                 st.code(seq_input, language=None)
                 
                 # Calculer et afficher les propriétés
-                props = calculer_proprietes(seq_input)
+                props = calculer_proprietes(seq_input, ph)
                 
                 st.subheader("Sequence properties:")
                 
@@ -374,6 +764,12 @@ with tab4:
                 with col3:
                     st.metric("Polars amino acid", f"{props['Polars']}/{len(list_of_list)}")
                 
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Molecular weight", f"{props['Molecular weight']:.2f} Da")
+                col2.metric(f"Net charge (pH {ph:.1f})", f"{props['Net charge']:+.2f}")
+                col3.metric("GRAVY", f"{props['GRAVY']:.3f}")
+                col4.metric("Isoelectric point (pI)", f"{props['pI']:.2f}")
+                
                 # Visualisation de la composition
                 st.subheader("Amino acids composition:")
                 aa_counts = {}
@@ -387,7 +783,221 @@ with tab4:
                 
                 st.bar_chart(df_comp.set_index('Amino acid'))
 
+    st.divider()
+    st.subheader("Mutational neighborhood")
+    st.markdown("All library members within a given number of mutations (Hamming distance) of a parent sequence, "
+                "by increasing distance. The parent does not need to belong to the library.")
+    parent = st.text_input(
+        "Parent sequence",
+        value="",
+        max_chars=len(list_of_list),
+        key="parent_voisinage",
+        disabled=not st.session_state.is_valid
+    ).upper()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        rayon = st.number_input("Maximum mutations", min_value=0, max_value=max(2, len(list_of_list)), value=2,
+                                key="rayon_voisinage", disabled=not st.session_state.is_valid)
+    with col2:
+        n_voisinage = st.number_input("Max results", min_value=1, max_value=max(1, maxexport), value=max(1, value),
+                                      step=10, key="n_voisinage", disabled=not st.session_state.is_valid)
+    with col3:
+        format_voisinage = st.selectbox(
+            "Export format",
+            list(FORMATS_EXPORT),
+            format_func=NOMS_FORMATS.get,
+            key="format_voisinage",
+            disabled=not st.session_state.is_valid
+        )
+    motif_voisinage = st.text_input(
+        "Motif filter (optional, fixed position syntax)",
+        value="-" * len(list_of_list),
+        key="motif_voisinage",
+        disabled=not st.session_state.is_valid
+    ).upper()
+    contraintes_voisinage = saisir_contraintes("_voisinage")
+
+    if st.button("🧬 Enumerate neighborhood", key="search_neighborhood", disabled=not st.session_state.is_valid):
+        oublier_sequences("voisinage")
+        st.session_state.pop("comptes_voisinage", None)
+        if len(parent) != len(list_of_list):
+            st.error(f"❌ The parent must contain exactly {len(list_of_list)} characters")
+        elif len(decouper_motif(motif_voisinage)) != len(list_of_list):
+            st.error(f"❌ The motif must describe exactly {len(list_of_list)} positions !")
+        else:
+            # La tâche écrit tous les voisins dans l'export, seuls les premiers restent en mémoire (affichage)
+            def terminer(tache, parent=parent, rayon=rayon, format_voisinage=format_voisinage):
+                st.session_state.comptes_voisinage = tache.details
+                memoriser_sequences("voisinage", tache.resultats(), 1, tache.export, tache.n_resultats,
+                                    format_voisinage, f"neighborhood_{parent}_{rayon}")
+
+            lancer_tache("voisinage", lambda: tache_voisinage(parent, rayon, n_voisinage, list_of_list,
+                                                              motif_voisinage, contraintes_voisinage, ph, exclusion=exclusion),
+                         terminer, format_voisinage, garder=maxvalue)
+
+    suivre_tache("voisinage")
+    comptes_voisinage = st.session_state.get("comptes_voisinage")
+    if comptes_voisinage is not None:
+        # Nombre exact de membres de la bibliothèque à chaque distance du parent
+        st.dataframe(pd.DataFrame({'Mutations': range(len(comptes_voisinage)), 'Library members': comptes_voisinage})
+                     .set_index('Mutations').T, width='stretch')
+    afficher_sequences("voisinage")
+
+    st.divider()
+    st.subheader("Bulk check")
+    st.markdown("Upload a list of sequences (one per line) to check which ones belong to the library and their rank.")
+    bulk_file = st.file_uploader(
+        "Sequences file (.txt)",
+        type=['txt', 'csv'],
+        key="bulk_file",
+        disabled=not st.session_state.is_valid
+    )
+    if bulk_file is not None and st.session_state.is_valid:
+        with st.spinner("Checking sequences..."):
+            df_check = verifier_sequences(bulk_file.getvalue(), list_of_list, exclusion)
+        n_dans = int(df_check['In library'].sum())
+        n_longueur = int(df_check['Error'].str.startswith('Length').sum())
 
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Sequences", f"{len(df_check):,}")
+        col2.metric("In library", f"{n_dans:,}")
+        col3.metric("Not in library", f"{len(df_check) - n_dans:,}")
+        col4.metric("Wrong length", f"{n_longueur:,}")
+
+        echecs = df_check['Invalid position'].dropna()
+        if len(echecs) > 0:
+            st.markdown("**Sequences rejected at each position:**")
+            st.bar_chart(
+                echecs.astype(int).value_counts()
+                .reindex(range(1, len(list_of_list) + 1), fill_value=0)
+                .rename_axis('Position').rename('Sequences')
+            )
+
+        # Plus proches voisins des séquences de bonne longueur absentes de la bibliothèque
+        requetes = df_check.loc[~df_check['In library'] & df_check['Invalid position'].notna(), 'Sequence']
+        if len(requetes) > 0:
+            with st.expander(f"🧭 Nearest library members of the {len(requetes):,} sequences not in the library"):
+                k_voisins, mesure_voisins = options_voisins("bulk")
+                if len(requetes) > MAX_REQUETES_VOISINS:
+                    st.caption(f"Only the first {MAX_REQUETES_VOISINS:,} sequences are searched.")
+                if st.button("🧭 Find nearest members", key="search_neighbors"):
+                    with st.spinner("Searching nearest members..."):
+                        df_voisins = plus_proches_lot(requetes.iloc[:MAX_REQUETES_VOISINS], k_voisins, list_of_list, mesure_voisins, exclusion)
+                    st.dataframe(df_voisins.head(maxvalue), width='stretch')
+                    st.download_button(
+                        label="📥 Export as CSV",
+                        data=df_voisins.to_csv(index=False).encode('utf-8'),
+                        file_name="nearest_members.csv",
+                        mime="text/csv",
+                        key="export_neighbors"
+                    )
+
+        df_check.index = pd.RangeIndex(1, len(df_check) + 1, name='N°')
+        st.dataframe(df_check.head(maxvalue), width='stretch')
+        if len(df_check) > maxvalue:
+            st.caption(f"First {maxvalue:,} rows shown, the export contains all of them.")
+        st.download_button(
+            label="📥 Export as CSV",
+            data=df_check.to_csv().encode('utf-8'),
+            file_name="bulk_check.csv",
+            mime="text/csv"
+        )
+
+
+# Tab 5: Profil de la bibliothèque
+with tab5:
+    st.header("Library profile")
+    if not st.session_state.is_valid:
+        st.info("*Please upload a valid file in the sidebar to use this feature*")
+    else:
+        st.info("""
+        Exact distribution of a property over **all** the sequences of the library, computed without enumerating them.
+        Values are rounded as in the result tables (0.01 for molecular weight and net charge, 0.001 for GRAVY).
+        """)
+        propriete = st.selectbox("Property", PROPRIETES_PROFIL, key="profile_property")
+        distribution, erreur = distribution_cache(list_of_list.empreinte, propriete, ph, list_of_list)
+        if erreur:
+            st.error(f"❌ {erreur}")
+        else:
+            resume = resumer_distribution(distribution)
+        
+            for col, (nom, valeur) in zip(st.columns(len(resume)), resume.items()):
+                col.metric(nom, f"{valeur:.4g}")
+        
+            # Histogramme (regroupé en 100 classes au plus pour l'affichage)
+            valeurs = distribution['Value'].to_numpy()
+            comptes = distribution['Count'].to_numpy(dtype=np.float64)
+            if len(valeurs) > 100:
+                comptes, bornes = np.histogram(valeurs, bins=100, weights=comptes)
+                valeurs = np.round((bornes[:-1] + bornes[1:]) / 2, 3)
+            st.bar_chart(pd.DataFrame({'Value': valeurs, 'Sequences': comptes}).set_index('Value'))
+        
+            # Nombre exact de séquences dans une fenêtre de valeurs
+            col1, col2 = st.columns(2)
+            with col1:
+                minimum = st.number_input("Minimum", value=resume['Min'], key=f"profile_min_{propriete}")
+            with col2:
+                maximum = st.number_input("Maximum", value=resume['Max'], key=f"profile_max_{propriete}")
+            n_window = compter_intervalle(distribution, minimum, maximum)
+            col1, col2 = st.columns(2)
+            col1.metric("Sequences in this range", f"{n_window:,}")
+            col2.metric("Share of the library", f"{100 * n_window / total:.3g} %")
+
+with tab6:
+    st.header("Top-scoring sequences (position-specific score matrix)")
+    if not st.session_state.is_valid:
+        st.info("*Please upload a valid file in the sidebar to use this feature*")
+    else:
+        st.info(f"""
+        **Instructions:**
+        - Upload a score matrix with a header line of amino acids and one line of scores per position ({len(list_of_list)} lines)
+        - Columns can be separated by tabs, commas, semicolons or spaces, and each line may start with a position label
+        - The score of a sequence is the sum of the scores of its residues; the best sequences are returned in decreasing score order, without enumerating the library
+        """)
+        fichier_pssm = st.file_uploader("Upload score matrix", type=["txt", "csv", "tsv"], key="pssm_file")
+        if fichier_pssm is not None:
+            pssm, message = lire_pssm(fichier_pssm, list_of_list)
+            if pssm is None:
+                st.error(message)
+            else:
+                col1, col2, col3 = st.columns([2, 1, 1])
+                with col1:
+                    mode_pssm = st.radio("Motif filter", ["None", "Fix position", "Flexible position"],
+                                         horizontal=True, key="mode_pssm")
+                with col2:
+                    k_pssm = st.number_input("Number of sequences", min_value=1, max_value=maxvalue,
+                                             value=value, key="k_pssm")
+                with col3:
+                    format_pssm = st.selectbox("Export format", list(FORMATS_EXPORT),
+                                               format_func=NOMS_FORMATS.get, key="format_pssm")
+                motif_pssm = None
+                if mode_pssm != "None":
+                    motif_pssm = st.text_input(
+                        "Motif (fixed: '-', letters, [KR], [^P] ; flexible: letters and '*')",
+                        value="-" * len(list_of_list) if mode_pssm == "Fix position" else "*",
+                        key="motif_pssm"
+                    ).upper()
+                
+                if st.button("🏆 Find best sequences", key="search_pssm"):
+                    if mode_pssm == "Fix position" and len(decouper_motif(motif_pssm)) != len(list_of_list):
+                        st.error(f"❌ The motif must describe exactly {len(list_of_list)} positions !")
+                        st.stop()
+                    try:
+                        with st.spinner("Search in progress..."):
+                            sequences, scores = meilleures_sequences(pssm, k_pssm, list_of_list, motif_pssm,
+                                                                     flexible=mode_pssm == "Flexible position", exclusion=exclusion)
+                    except ValueError as e:
+                        st.error(f"❌ {e}")
+                        st.stop()
+                    if sequences:
+                        st.success(f"✅ {len(sequences)} sequence(s) found")
+                        df = sequences.to_pandas(index=pd.RangeIndex(1, len(sequences) + 1, name='N°'))
+                        df['Score'] = scores
+                        df = df.join(calculer_proprietes_lot(sequences, ph).set_index(df.index))
+                        st.dataframe(df, width='stretch')
+                        bouton_export([sequences], format_pssm, "top_scoring_sequences", colonnes={'Score': scores})
+                    else:
+                        st.warning("⚠️ No sequence found for this motif")
 
 # Footer
 st.markdown("---")
@@ -1,96 +1,1001 @@
-import streamlit as st
 import itertools
+import functools
+import collections
+import concurrent.futures
+import multiprocessing
+import heapq
 import random
 import re
 import pandas as pd
+import numpy as np
+import io
 from io import StringIO
 import math
+import sys
+import os
+import gzip
+import hashlib
+import json
+import mmap
+import struct
+import threading
+import tempfile
+import contextlib
 
-def valider_fichier_sequences(uploaded_file):
-    """
-    Valide le format du fichier de séquences
-    Retourne (valid, positions, error_message)
-    """
+ACIDES_AMINES = 'ACDEFGHIKLMNPQRSTVWY'  # 20 acides aminés standards
+
+def _analyser_fichier(contenu):
+    """Lit et valide un fichier de positions en une seule passe
+    Retourne (alphabets, message) avec alphabets = None si le fichier est invalide"""
     try:
         # Lire le fichier ligne par ligne
-        content = uploaded_file.getvalue().decode('utf-8')
-        lines = [line.strip() for line in content.split('\n') if line.strip()]
-        
+        lines = [line.strip() for line in contenu.decode('utf-8').split('\n') if line.strip()]
+
         # Vérification 1: Nombre de lignes
         if len(lines) == 0:
-            return False, "❌ Empty file"
+            return None, "❌ Empty file"
         # Vérification 2: Format de chaque ligne
         positions = []
-        acides_amines_valides = set('ACDEFGHIKLMNPQRSTVWY')  # 20 acides aminés standards
-        
         for i, line in enumerate(lines, 1):
-            line = re.findall(r"[A-Za-z0-9]+","".join(line))
-            aa_list = [aa.strip().upper() for aa in line]
+            aa_list = [aa.upper() for aa in re.findall(r"[A-Za-z0-9]+", line)]
             if len(aa_list) == 0:
-                return False, f"❌ Line {i}: No amino acid found"
+                return None, f"❌ Line {i}: No amino acid found"
             # Vérifier que ce sont bien des acides aminés valides (1 lettre)
             for aa in aa_list:
                 if len(aa) != 1:
-                    return False, f"❌ Line {i}: '{aa}' is not an amino acid valid (1 letter required only)"
-                if aa not in acides_amines_valides:
-                    return False, f"❌ Line {i}: '{aa}' is not an amino acid"
-            
+                    return None, f"❌ Line {i}: '{aa}' is not an amino acid valid (1 letter required only)"
+                if aa not in ACIDES_AMINES:
+                    return None, f"❌ Line {i}: '{aa}' is not an amino acid"
+
             # Vérifier qu'il n'y a pas de doublons dans la même position
             if len(aa_list) != len(set(aa_list)):
-                return False, f"❌ Line {i}: Duplicates for the same position "
-            positions.append(aa_list)        
-        return True,"✅ Valid file"
+                return None, f"❌ Line {i}: Duplicates for the same position "
+            positions.append(tuple(aa_list))
+        return tuple(positions), "✅ Valid file"
     except Exception as e:
-        return False, f"❌ Error reading the file: {str(e)}"
+        return None, f"❌ Error reading the file: {str(e)}"
+
+class Bibliotheque(tuple):
+    """Bibliothèque analysée une fois pour toutes : tuple immuable des alphabets de chaque position,
+    accompagné des valeurs qui en dérivent (multiplicateurs du rang, nombre total de séquences,
+    tables de correspondance par position). S'utilise partout où une liste de listes est attendue"""
+
+    def __new__(cls, alphabets, empreinte=None, tables=None, codes=None):
+        self = super().__new__(cls, (tuple(pos) for pos in alphabets))
+        tables = dict(tables or {})
+        if 'lettres' not in tables:
+            largeur = max((len(pos) for pos in self), default=1)
+            # Table (positions x choix) des codes ASCII de chaque choix
+            lettres = np.full((len(self), largeur), ord('-'), dtype=np.uint8)
+            # Table inverse (positions x 256) : indice du choix pour chaque code ASCII, -1 si absent
+            inverse = np.full((len(self), 256), -1, dtype=np.int16)
+            for pos_idx, pos in enumerate(self):
+                lettres[pos_idx, :len(pos)] = [ord(aa) for aa in pos]
+                inverse[pos_idx, lettres[pos_idx, :len(pos)]] = np.arange(len(pos))
+            lettres.flags.writeable = False
+            inverse.flags.writeable = False
+            tables['lettres'], tables['inverse'] = lettres, inverse
+        multiplicateurs = [1] * len(self)
+        for i in range(len(self) - 2, -1, -1):
+            multiplicateurs[i] = multiplicateurs[i + 1] * len(self[i + 1])
+        attributs = {
+            'empreinte': empreinte,
+            'multiplicateurs': tuple(multiplicateurs),
+            'total': multiplicateurs[0] * len(self[0]) if len(self) else 1,
+            'table_lettres': tables['lettres'],
+            'table_inverse': tables['inverse'],
+            # Tables de propriétés (positions x choix), remplies à la première utilisation
+            # ou lues depuis un fichier compilé
+            'tables': tables,
+            # Bloc facultatif de séquences déjà encodées (matrice d'indices de choix)
+            'codes': codes,
+        }
+        for nom, valeur in attributs.items():
+            object.__setattr__(self, nom, valeur)
+        return self
+
+    def __setattr__(self, nom, valeur):
+        raise AttributeError("Bibliotheque is immutable")
+
+    def __reduce__(self):
+        return (Bibliotheque, (tuple(self), self.empreinte))
+
+    def __repr__(self):
+        return f"Bibliotheque({len(self)} positions, {self.total:,} sequences)"
+
+# Format binaire compilé : signature, version, longueur de l'en-tête JSON, en-tête, puis les
+# tableaux NumPy alignés sur 64 octets (lisibles directement depuis un fichier projeté en mémoire)
+SIGNATURE_BINAIRE = b'PSXLIB\x00\x00'
+VERSION_BINAIRE = 1
+EXTENSION_BINAIRE = '.psxlib'
+
+def bibliotheque_vers_texte(bibliotheque):
+    """Fichier de positions texte équivalent à la bibliothèque (une ligne par position)"""
+    return "".join("/".join(pos) + "\n" for pos in bibliotheque)
+
+def compiler_bibliotheque(bibliotheque, chemin, codes=None):
+    """Écrit la bibliothèque au format binaire compilé : alphabets, multiplicateurs, tables de
+    correspondance (lettres, inverse, propriétés) et, facultativement, un bloc de séquences encodées"""
+    if not isinstance(bibliotheque, Bibliotheque):
+        bibliotheque = Bibliotheque(bibliotheque)
+    # Une séquence suffit à remplir les tables de propriétés utilisées par calculer_proprietes_lot
+    calculer_proprietes_lot(EnsembleSequences(np.zeros((1, len(bibliotheque)), dtype=np.uint8), bibliotheque))
+    tableaux = dict(bibliotheque.tables)
+    if codes is not None:
+        tableaux['codes'] = np.ascontiguousarray(codes, dtype=np.uint8).reshape(-1, len(bibliotheque))
+
+    entete = {
+        'positions': ["".join(pos) for pos in bibliotheque],
+        'multiplicateurs': [str(m) for m in bibliotheque.multiplicateurs],
+        'total': str(bibliotheque.total),
+        'empreinte': bibliotheque.empreinte,
+        'tableaux': {},
+    }
+    # Les décalages dépendent de la taille de l'en-tête : on la majore avant de placer les tableaux
+    decalage = 0
+    for nom, tableau in tableaux.items():
+        entete['tableaux'][nom] = {'dtype': tableau.dtype.str, 'shape': list(tableau.shape), 'offset': decalage}
+        decalage += -(-tableau.nbytes // 64) * 64
+    brut = json.dumps(entete).encode('utf-8')
+    debut = -(-(16 + len(brut) + 32 * len(tableaux) + 64) // 64) * 64
+    for description in entete['tableaux'].values():
+        description['offset'] += debut
+    brut = json.dumps(entete).encode('utf-8')
+    assert 16 + len(brut) <= debut
+
+    with open(chemin, 'wb') as f:
+        f.write(SIGNATURE_BINAIRE)
+        f.write(struct.pack('<II', VERSION_BINAIRE, len(brut)))
+        f.write(brut)
+        for nom, tableau in tableaux.items():
+            f.write(b'\x00' * (entete['tableaux'][nom]['offset'] - f.tell()))
+            f.write(np.ascontiguousarray(tableau).tobytes())
+
+def _lire_binaire(tampon, empreinte=None):
+    """Reconstruit une bibliothèque depuis un tampon au format compilé (octets ou mmap)
+    Les tableaux sont des vues en lecture seule sur le tampon : aucune copie"""
+    if bytes(tampon[:8]) != SIGNATURE_BINAIRE:
+        raise ValueError("Not a compiled library file")
+    version, longueur = struct.unpack('<II', bytes(tampon[8:16]))
+    if version > VERSION_BINAIRE:
+        raise ValueError(f"Compiled library version {version} is not supported (maximum {VERSION_BINAIRE})")
+    entete = json.loads(bytes(tampon[16:16 + longueur]).decode('utf-8'))
+    tableaux = {}
+    for nom, description in entete['tableaux'].items():
+        dtype = np.dtype(description['dtype'])
+        forme = tuple(description['shape'])
+        tableau = np.frombuffer(tampon, dtype=dtype, count=math.prod(forme), offset=description['offset'])
+        tableaux[nom] = tableau.reshape(forme)
+    codes = tableaux.pop('codes', None)
+    bibliotheque = Bibliotheque(entete['positions'], entete['empreinte'] or empreinte, tableaux, codes)
+    if [str(m) for m in bibliotheque.multiplicateurs] != entete['multiplicateurs']:
+        raise ValueError("Corrupted compiled library file")
+    return bibliotheque
+
+def ouvrir_bibliotheque(chemin):
+    """Charge un fichier de positions texte ou compilé depuis le disque
+    Les fichiers compilés sont projetés en mémoire (mmap) : les processus qui ouvrent le même
+    fichier partagent ses pages et le chargement ne lit que l'en-tête
+    Retourne (bibliotheque, message) avec bibliotheque = None si le fichier est invalide"""
+    with open(chemin, 'rb') as f:
+        if f.read(len(SIGNATURE_BINAIRE)) != SIGNATURE_BINAIRE:
+            f.seek(0)
+            return charger_bibliotheque(f.read())
+        projection = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _lire_binaire(projection), "✅ Valid compiled library"
+    except (ValueError, KeyError, TypeError) as e:
+        return None, f"❌ Invalid compiled library: {e}"
+
+# Bibliothèques déjà analysées, indexées par l'empreinte SHA-256 du fichier (les plus anciennes
+# sont évincées) : partagées par toutes les sessions et réexécutions du script
+_BIBLIOTHEQUES = collections.OrderedDict()
+_BIBLIOTHEQUES_MAX = 32
+_BIBLIOTHEQUES_VERROU = threading.Lock()
+
+def charger_bibliotheque(contenu):
+    """Retourne (bibliotheque, message) pour le contenu (octets) d'un fichier de positions, texte
+    ou compilé, bibliotheque = None si le fichier est invalide. Un même contenu n'est analysé qu'une fois"""
+    empreinte = hashlib.sha256(contenu).hexdigest()
+    with _BIBLIOTHEQUES_VERROU:
+        if empreinte in _BIBLIOTHEQUES:
+            _BIBLIOTHEQUES.move_to_end(empreinte)
+            return _BIBLIOTHEQUES[empreinte]
+    if contenu[:len(SIGNATURE_BINAIRE)] == SIGNATURE_BINAIRE:
+        try:
+            resultat = (_lire_binaire(contenu, empreinte), "✅ Valid compiled library")
+        except (ValueError, KeyError, TypeError) as e:
+            resultat = (None, f"❌ Invalid compiled library: {e}")
+    else:
+        alphabets, message = _analyser_fichier(contenu)
+        resultat = (None if alphabets is None else Bibliotheque(alphabets, empreinte), message)
+    with _BIBLIOTHEQUES_VERROU:
+        _BIBLIOTHEQUES[empreinte] = resultat
+        while len(_BIBLIOTHEQUES) > _BIBLIOTHEQUES_MAX:
+            _BIBLIOTHEQUES.popitem(last=False)
+    return resultat
+
+def _encoder_lignes(texte, listes, ignorer_vides=True):
+    """Encode un texte (une séquence par ligne) en matrice d'indices de choix, sans boucle Python
+    Retourne (octets, debuts, longueurs, codes, invalides, lettres) : invalides vaut -1 pour une séquence
+    de la bibliothèque, l'indice de la première position invalide, ou len(listes) si la longueur est
+    mauvaise ; lettres est la matrice des codes ASCII des lignes de bonne longueur"""
+    if not isinstance(listes, Bibliotheque):
+        listes = Bibliotheque(listes)
+    n_pos = len(listes)
+    texte = texte.upper().replace(b'\r', b'')
+    if ignorer_vides:
+        texte = texte.translate(None, b' \t')
+    octets = np.frombuffer(texte + b'\n', dtype=np.uint8)
+    fins = np.flatnonzero(octets == ord('\n'))
+    debuts = np.concatenate(([0], fins[:-1] + 1))
+    longueurs = fins - debuts
+    if ignorer_vides:
+        gardees = longueurs > 0
+        debuts, longueurs = debuts[gardees], longueurs[gardees]
+
+    codes = np.zeros((len(debuts), n_pos), dtype=np.uint8)
+    invalides = np.full(len(debuts), n_pos, dtype=np.int64)
+    longueur_ok = longueurs == n_pos
+    # Lettres des lignes de bonne longueur : simple vue si toutes les lignes sont régulières
+    if longueur_ok.all() and (debuts == np.arange(len(debuts)) * (n_pos + 1)).all():
+        lettres = octets[:len(debuts) * (n_pos + 1)].reshape(len(debuts), n_pos + 1)[:, :n_pos]
+    else:
+        lettres = octets[debuts[longueur_ok, None] + np.arange(n_pos)]
+    # Indices via la table inverse (positions x 256), une colonne à la fois
+    indices = np.empty(lettres.shape, dtype=np.int16)
+    for pos_idx in range(n_pos):
+        indices[:, pos_idx] = listes.table_inverse[pos_idx].take(lettres[:, pos_idx])
+    hors = indices < 0
+    if hors.any():
+        invalides[longueur_ok] = np.where(hors.any(axis=1), hors.argmax(axis=1), -1)
+        codes[longueur_ok] = np.where(hors, 0, indices)
+    else:
+        invalides[longueur_ok] = -1
+        codes[longueur_ok] = indices
+    return octets, debuts, longueurs, codes, invalides, lettres
+
+def encoder_sequences(sequences, listes):
+    """Encode des chaînes en matrice d'indices de choix de la bibliothèque (tables inverses)
+    Retourne (codes, valides) : valides[i] est faux si la séquence i n'appartient pas à la bibliothèque"""
+    if len(sequences) == 0:
+        return np.zeros((0, len(listes)), dtype=np.uint8), np.zeros(0, dtype=bool)
+    _, _, _, codes, invalides, _ = _encoder_lignes("\n".join(sequences).encode('utf-8'), listes, ignorer_vides=False)
+    return codes, invalides == -1
+
+def verifier_sequences(sequences, listes, exclusion=None):
+    """Vérifie en masse l'appartenance de séquences à la bibliothèque
+    sequences : liste de chaînes, ou contenu (octets) d'un fichier à une séquence par ligne
+    Retourne un DataFrame : Sequence, In library, Rank (1 = première séquence par ordre
+    alphabétique), Invalid position (première position invalide, 1 = première), Error
+    exclusion : colonne Excluded en plus (séquence de la bibliothèque présente dans l'exclusion)"""
+    if not isinstance(listes, Bibliotheque):
+        listes = Bibliotheque(listes)
+    n_pos = len(listes)
+    if isinstance(sequences, (bytes, bytearray)):
+        texte, ignorer_vides = bytes(sequences), True
+    else:
+        texte, ignorer_vides = "\n".join(sequences).encode('utf-8'), False
+    if len(sequences) == 0:
+        texte = b''  # aucune ligne (et non une ligne vide)
+    octets, debuts, longueurs, codes, invalides, lettres = _encoder_lignes(texte, listes, ignorer_vides)
+    if len(sequences) == 0:
+        debuts, longueurs, codes, invalides = debuts[:0], longueurs[:0], codes[:0], invalides[:0]
+        lettres = lettres[:0]
+    valides = invalides == -1
+    longueur_ok = longueurs == n_pos
+
+    # Chaînes : colonne Arrow sur le tampon des lettres si toutes les lignes ont la bonne longueur,
+    # sinon vue de taille fixe pour celles-ci et décodage ligne à ligne pour les autres
+    lettres = np.ascontiguousarray(lettres)
+    textes = None
+    if longueur_ok.all():
+        try:
+            import pyarrow as pa
+            decalages = np.arange(len(lettres) + 1, dtype=np.int64) * n_pos
+            colonne = pa.Array.from_buffers(pa.large_string(), len(lettres), [None, pa.py_buffer(decalages), pa.py_buffer(lettres)])
+            textes = pd.Series(colonne, dtype=pd.ArrowDtype(colonne.type))
+        except ImportError:
+            pass
+    if textes is None:
+        textes = np.empty(len(debuts), dtype=object)
+        if n_pos:
+            textes[longueur_ok] = lettres.view(f'S{n_pos}').ravel().astype(str)
+        for i in np.flatnonzero(~longueur_ok):
+            textes[i] = bytes(octets[debuts[i]:debuts[i] + longueurs[i]]).decode('utf-8', 'replace')
+
+    # Rangs : un produit scalaire des indices par les multiplicateurs de la base mixte
+    rangs_valides = EnsembleSequences(codes[valides], listes).rangs() + 1
+    if listes.total < 2**63:
+        rangs = pd.arrays.IntegerArray(np.zeros(len(debuts), dtype=np.int64), ~valides)
+        rangs[valides] = rangs_valides
+    else:
+        rangs = np.full(len(debuts), None, dtype=object)
+        rangs[valides] = rangs_valides
+    hors_position = ~valides & longueur_ok
+    positions = pd.arrays.IntegerArray(np.where(hors_position, invalides + 1, 0), ~hors_position)
+
+    erreurs = np.full(len(debuts), None, dtype=object)
+    for i in np.flatnonzero(hors_position):
+        erreurs[i] = f"Position {invalides[i] + 1}: '{textes[i][invalides[i]]}' is not an option"
+    for i in np.flatnonzero(~longueur_ok):
+        erreurs[i] = f"Length {longueurs[i]} instead of {n_pos}"
+    colonnes = {'Sequence': textes, 'In library': valides, 'Rank': rangs}
+    if exclusion is not None:
+        exclues = np.zeros(len(debuts), dtype=bool)
+        exclues[valides] = exclusion.contient(rangs_valides - 1)
+        colonnes['Excluded'] = exclues
+    colonnes.update({'Invalid position': positions, 'Error': erreurs})
+    return pd.DataFrame(colonnes)
+
+def valider_fichier_sequences(uploaded_file):
+    """
+    Valide le format du fichier de séquences
+    Retourne (valid, message)
+    """
+    bibliotheque, message = charger_bibliotheque(uploaded_file.getvalue())
+    return bibliotheque is not None, message
+
+# Ensembles d'exclusion enregistrés : tableau trié des écarts entre rangs, compressé (numpy .npz)
+# Version 2 : écarts en chiffres int64 de base 2**62, pour les bibliothèques de 2**63 séquences ou plus
+EXTENSION_EXCLUSION = '.psxexcl'
+VERSION_EXCLUSION = 2
+BASE_ECARTS = 2**62
+
+def empreinte_alphabets(listes):
+    """Empreinte SHA-256 des alphabets de chaque position : identifie l'espace des rangs,
+    quel que soit le format du fichier de bibliothèque"""
+    return hashlib.sha256(json.dumps([list(pos) for pos in listes]).encode()).hexdigest()
+
+class Exclusion:
+    """Séquences à écarter de toutes les générations et recherches (déjà synthétisées, déjà testées...)
+    Stockées comme tableau trié de rangs dans la bibliothèque identifiée par empreinte_alphabets
+    (int64, ou entiers Python en dtype object comme EnsembleSequences.rangs au-delà de 2**63 séquences)"""
+
+    def __init__(self, rangs, empreinte):
+        rangs = np.asarray(rangs)
+        self.rangs = np.unique(rangs if rangs.dtype == object else rangs.astype(np.int64))
+        self.empreinte = empreinte
+        self._restreints = collections.OrderedDict()  # rangs exclus par sous-espace (motif)
+
+    def __len__(self):
+        return len(self.rangs)
+
+    def __repr__(self):
+        return f"Exclusion({len(self):,} sequences)"
+
+    def verifier(self, listes):
+        """Vérifie que l'ensemble a été construit pour cette bibliothèque"""
+        if self.empreinte != empreinte_alphabets(listes):
+            raise ValueError("The exclusion set was built for another library")
+
+    def union(self, autre):
+        """Ensemble des séquences exclues par l'un ou l'autre (même bibliothèque)"""
+        if autre.empreinte != self.empreinte:
+            raise ValueError("The exclusion set was built for another library")
+        return Exclusion(np.concatenate([self.rangs, autre.rangs]), self.empreinte)
+
+    def contient(self, rangs):
+        """Masque des rangs exclus"""
+        return _appartient(rangs, self.rangs)
+
+    def rangs_restreints(self, restreintes, listes):
+        """Rangs exclus dans le sous-espace d'un motif à positions fixes (listes restreintes), triés"""
+        if all(len(sous) == len(pos) for sous, pos in zip(restreintes, listes)):
+            return self.rangs
+        cle = tuple(map(tuple, restreintes))
+        if cle not in self._restreints:
+            codes, _ = _restreindre(decoder_rangs(self.rangs, listes), restreintes, listes)
+            self._restreints[cle] = np.sort(EnsembleSequences(codes, restreintes).rangs())
+            if len(self._restreints) > 16:
+                self._restreints.popitem(last=False)
+        return self._restreints[cle]
+
+    def sauvegarder(self, destination):
+        """Enregistre l'ensemble (chemin ou fichier binaire) : écarts entre rangs consécutifs, compressés"""
+        with contextlib.ExitStack() as pile:
+            f = pile.enter_context(open(destination, 'wb')) if isinstance(destination, (str, os.PathLike)) else destination
+            ecarts = np.diff(self.rangs, prepend=0)
+            if self.rangs.dtype != object:
+                np.savez_compressed(f, version=np.array(1), empreinte=np.array(self.empreinte), ecarts=ecarts)
+                return
+            # Écarts pouvant dépasser int64 : chiffres de base BASE_ECARTS, poids faible en premier
+            n_chiffres = max([1] + [-(-int(ecart).bit_length() // 62) for ecart in ecarts])
+            chiffres = np.array([[int(ecart) >> (62 * j) & (BASE_ECARTS - 1) for ecart in ecarts] for j in range(n_chiffres)],
+                                dtype=np.int64).reshape(n_chiffres, len(ecarts))
+            np.savez_compressed(f, version=np.array(2), empreinte=np.array(self.empreinte), chiffres=chiffres)
+
+def _appartient(rangs, tries):
+    """Masque des rangs présents dans le tableau trié tries (int64 ou dtype object)"""
+    rangs = np.asarray(rangs).astype(tries.dtype)
+    if len(tries) == 0:
+        return np.zeros(len(rangs), dtype=bool)
+    indices = np.minimum(np.searchsorted(tries, rangs), len(tries) - 1)
+    return tries[indices] == rangs
+
+def _restreindre(codes, restreintes, listes):
+    """Inverse de _recoder : indices de choix dans les listes restreintes des séquences du sous-espace
+    Retourne (codes des séquences du sous-espace, masque de ces séquences)"""
+    restreints = np.empty_like(codes)
+    garder = np.ones(len(codes), dtype=bool)
+    for pos_idx, (restreinte, pos) in enumerate(zip(restreintes, listes)):
+        correspondance = np.full(len(pos), -1, dtype=np.int16)
+        correspondance[[pos.index(aa) for aa in restreinte]] = np.arange(len(restreinte))
+        colonne = correspondance[codes[:, pos_idx]]
+        garder &= colonne >= 0
+        restreints[:, pos_idx] = colonne
+    return restreints[garder], garder
+
+def construire_exclusion(sequences, listes):
+    """Construit un ensemble d'exclusion à partir de séquences (liste de chaînes, ou contenu d'un
+    fichier à une séquence par ligne) ; les séquences hors bibliothèque sont ignorées
+    Retourne (Exclusion, nombre de séquences ignorées)"""
+    if not isinstance(listes, Bibliotheque):
+        listes = Bibliotheque(listes)
+    if isinstance(sequences, (bytes, bytearray)):
+        _, _, _, codes, invalides, _ = _encoder_lignes(bytes(sequences), listes)
+        codes, valides = codes[invalides == -1], invalides == -1
+    else:
+        codes, valides = encoder_sequences(sequences, listes)
+        codes = codes[valides]
+    return Exclusion(EnsembleSequences(codes, listes).rangs(), empreinte_alphabets(listes)), int((~valides).sum())
+
+def lire_exclusion(contenu, listes):
+    """Lit un ensemble d'exclusion : fichier enregistré (Exclusion.sauvegarder) ou liste de séquences
+    Retourne (Exclusion, nombre de séquences ignorées)"""
+    if not isinstance(listes, Bibliotheque):
+        listes = Bibliotheque(listes)
+    if not contenu.startswith(b'PK'):
+        return construire_exclusion(contenu, listes)
+    with np.load(io.BytesIO(contenu), allow_pickle=False) as archive:
+        if int(archive['version']) > VERSION_EXCLUSION:
+            raise ValueError(f"Exclusion file version {int(archive['version'])} is not supported")
+        if 'chiffres' in archive.files:
+            chiffres = archive['chiffres'].astype(object)
+            ecarts = sum((chiffres[j] * BASE_ECARTS**j for j in range(len(chiffres))), np.zeros(chiffres.shape[1], dtype=object))
+        else:
+            ecarts = archive['ecarts']
+        exclusion = Exclusion(np.cumsum(ecarts), str(archive['empreinte']))
+    exclusion.verifier(listes)
+    return exclusion, 0
+
+def _rangs_exclus(exclusion, listes=None, restreintes=None):
+    """Rangs exclus triés dans l'espace parcouru (None sans exclusion)"""
+    if exclusion is None or len(exclusion) == 0:
+        return None
+    if restreintes is None:
+        return exclusion.rangs
+    return exclusion.rangs_restreints(restreintes, listes)
+
+def _rangs_libres(indices, exclus):
+    """Rangs des séquences non exclues n° indices (0 = première non exclue)
+    Le k-ième rang exclu est précédé de exclus[k] - k rangs libres"""
+    if exclus is None or len(exclus) == 0:
+        return np.asarray(indices, dtype=np.int64)
+    indices = np.asarray(indices).astype(exclus.dtype)
+    return indices + np.searchsorted(exclus - np.arange(len(exclus)), indices, side='right')
+
+def _indice_libre(rang, exclus):
+    """Nombre de séquences non exclues de rang inférieur à rang"""
+    if exclus is None:
+        return rang
+    return rang - int(np.searchsorted(exclus, rang))
+
+def compter_libres(listes, exclusion=None, debut=0):
+    """Nombre de séquences non exclues de rang supérieur ou égal à debut"""
+    exclus = _rangs_exclus(exclusion)
+    return calcul_total(listes) - (0 if exclus is None else len(exclus)) - _indice_libre(debut, exclus)
+
+def decoder_libres(debut, n, listes, exclus=None):
+    """Décode les séquences non exclues n° [debut, debut+n) (ordre lexicographique)"""
+    if exclus is None or len(exclus) == 0:
+        return decoder_bloc(debut, n, listes)
+    fin = min(debut + n, calcul_total(listes) - len(exclus))
+    return decoder_rangs(_rangs_libres(debut + np.arange(max(0, fin - debut)).astype(exclus.dtype), exclus), listes)
 
 def calcul_total(listes):
     """Calcule le nombre total de sequences possibles"""
+    if isinstance(listes, Bibliotheque):
+        return listes.total
     total = 1
     for pos in listes:
         total *= len(pos)
     return total
     print(total)
 
-def generer_aleatoires(n,listes):
-    """Génère n sequences aléatoires uniques - VERSION RAPIDE"""
-    sequences = set()
-    max_attempts = n * 10  # Pour éviter une boucle infinie si n est proche du total
-    attempts = 0
-    
-    while len(sequences) < n and attempts < max_attempts:
-        seq = ''.join(random.choice(pos) for pos in listes)
-        sequences.add(seq)
-        attempts += 1
-    
-    return sorted(list(sequences))
-
-def generer_premieres(n,listes):
-    """Génère les n premières sequences - VERSION RAPIDE"""
-    sequences = []
-    
-    # Calculer les multiplicateurs pour chaque position
-    multipliers = [1]
-    for i in range(len(listes) - 1, 0, -1):
-        multipliers.insert(0, multipliers[0] * len(listes[i]))
-    
-    # Générer directement la n-ième sequence sans itérer sur toutes les précédentes
-    for index in range(n):
-        seq = []
-        remaining = index
-        for pos_idx, mult in enumerate(multipliers):
-            choice_idx = remaining // mult
-            seq.append(listes[pos_idx][choice_idx])
-            remaining = remaining % mult
-        sequences.append(''.join(seq))
-    
-    return sequences
+def echantillonner_codes(n, listes, seed=None, exclus=None):
+    """Tire n séquences distinctes uniformément (sans remise)
+    exclus : rangs triés à ne jamais tirer (les n séquences sont tirées parmi les autres)
+    Retourne la matrice d'indices de choix, triée par rang"""
+    total = calcul_total(listes)
+    if exclus is not None and len(exclus) and total < 2**63:
+        return _echantillonner_libres(n, listes, total - len(exclus), exclus, np.random.default_rng(seed))
+    if exclus is not None and n > total - len(exclus):
+        raise ValueError(f"Cannot draw {n:,} distinct sequences from the {total - len(exclus):,} non-excluded ones")
+    if n > total:
+        raise ValueError(f"Cannot draw {n:,} distinct sequences from a library of {total:,}")
+    rng = np.random.default_rng(seed)
+
+    # Régime dense : permutation partielle de l'espace des rangs (tient en mémoire car total < 2n)
+    if 2 * n > total:
+        rangs = np.sort(rng.choice(total, size=n, replace=False))
+        return decoder_rangs(rangs, listes)
+
+    # Régime clairsemé : un rang uniforme = un choix uniforme indépendant à chaque position.
+    # On élimine les doublons (rares) et les exclus, et on complète jusqu'à obtenir exactement n séquences
+    cle = np.dtype((np.void, len(listes)))
+    uniques = np.zeros((0, len(listes)), dtype=np.uint8)
+    while len(uniques) < n:
+        manquants = n - len(uniques)
+        tirage = np.empty((manquants, len(listes)), dtype=np.uint8)
+        for pos_idx, pos in enumerate(listes):
+            tirage[:, pos_idx] = rng.integers(0, len(pos), size=manquants, dtype=np.uint8)
+        # Trier les lignes comme des octets revient à les trier par rang
+        lignes = np.concatenate([uniques, tirage]).view(cle).ravel()
+        uniques = _sans_rangs_exclus(np.unique(lignes).view(np.uint8).reshape(-1, len(listes)), listes, exclus)
+    return uniques
+
+def _echantillonner_libres(n, listes, libres, exclus, rng):
+    """Tirage uniforme de n séquences parmi les libres (non exclues) : indices libres
+    distincts tirés puis convertis en rangs"""
+    if n > libres:
+        raise ValueError(f"Cannot draw {n:,} distinct sequences from the {libres:,} non-excluded ones")
+    if 2 * n > libres:
+        indices = rng.choice(libres, size=n, replace=False)
+    else:
+        indices = np.zeros(0, dtype=np.int64)
+        while len(indices) < n:
+            indices = np.unique(np.concatenate([indices, rng.integers(0, libres, size=n - len(indices))]))
+    return decoder_rangs(np.sort(_rangs_libres(indices, exclus)), listes)
+
+# Tirage par intervalles de rangs : les intervalles sont tirés l'un après l'autre (mémoire bornée par
+# intervalle), le nombre de séquences de chacun suivant la loi d'un tirage sans remise global
+TAILLE_INTERVALLE_ALEATOIRE = 100000
+
+def _decouper_espace(listes, libres, k, exclus=None):
+    """Découpe les libres séquences (non exclues) en k intervalles contigus de rangs
+    Retourne (espaces, tailles) ; espace : ('libres', debut, fin) indices libres, ou ('prefixes', n_prefixe, debut, fin)
+    rangs de préfixe (n_prefixe premières positions) quand les rangs complets dépassent int64"""
+    if libres < 2**63:
+        bornes = [libres * i // k for i in range(k + 1)]
+        espaces = [('libres', debut, fin) for debut, fin in zip(bornes, bornes[1:])]
+        return espaces, [fin - debut for debut, fin in zip(bornes, bornes[1:])]
+    n_prefixe, n_prefixes = 0, 1
+    while n_prefixes < k and n_prefixe < len(listes):
+        n_prefixes *= len(listes[n_prefixe])
+        n_prefixe += 1
+    bornes = [n_prefixes * i // k for i in range(k + 1)]
+    espaces = [('prefixes', n_prefixe, debut, fin) for debut, fin in zip(bornes, bornes[1:])]
+    # Taille d'un intervalle : ses séquences moins ses rangs exclus
+    rangs = [borne * (calcul_total(listes) // n_prefixes) for borne in bornes]
+    exclus_avant = [0] * len(rangs) if exclus is None else [int(np.searchsorted(exclus, rang)) for rang in rangs]
+    return espaces, [(fin - debut) - (e_fin - e_debut)
+                     for debut, fin, e_debut, e_fin in zip(rangs, rangs[1:], exclus_avant, exclus_avant[1:])]
+
+def _repartir(n, tailles, rng):
+    """Nombre de séquences de chaque intervalle dans un tirage uniforme sans remise de n séquences
+    Loi hypergéométrique multivariée exacte (numpy la limite à 10^9 séquences : au-delà, chaque séquence
+    est retenue avec une probabilité p, puis n sont gardées parmi les retenues, ce qui reste exact ;
+    n est traité par morceaux, un tirage sans remise en plusieurs fois restant un tirage sans remise)
+    Au-delà de 2**63 séquences, loi multinomiale (écart de l'ordre de n² / total)"""
+    total = sum(tailles)
+    if total >= 2**63:
+        return rng.multinomial(n, np.array([taille / total for taille in tailles])).tolist()
+    restants = np.array(tailles, dtype=np.int64)
+    comptes = np.zeros(len(tailles), dtype=np.int64)
+    while n > 0:
+        morceau = min(n, 5 * 10**8)
+        if restants.sum() < 10**9:
+            tires = rng.multivariate_hypergeometric(restants, morceau)
+        else:
+            # Sachant leur nombre, les séquences retenues forment un sous-ensemble uniforme
+            p = min(1.0, (morceau + 5 * math.sqrt(morceau) + 10) / restants.sum())
+            retenues = rng.binomial(restants, p)
+            while not morceau <= retenues.sum() < 10**9:
+                retenues = rng.binomial(restants, p)
+            tires = rng.multivariate_hypergeometric(retenues, morceau)
+        comptes += tires
+        restants -= tires
+        n -= morceau
+    return comptes.tolist()
+
+def _tirer_distincts(rng, debut, fin, n):
+    """n entiers distincts tirés uniformément dans [debut, fin), triés (int64)"""
+    if 2 * n > fin - debut:
+        return debut + np.sort(rng.choice(fin - debut, size=n, replace=False))
+    tirage = np.zeros(0, dtype=np.int64)
+    while len(tirage) < n:
+        tirage = np.unique(np.concatenate([tirage, rng.integers(debut, fin, size=n - len(tirage))]))
+    return tirage
+
+def _tirer_prefixes(rng, listes, n_prefixe, debut, fin, n, exclus=None):
+    """n séquences distinctes uniformes dont le préfixe (n_prefixe premières positions) a un rang
+    dans [debut, fin) : espaces trop grands pour des rangs int64, les suffixes sont tirés position par position
+    exclus : rangs triés (dtype object) des séquences à rejeter"""
+    cle = np.dtype((np.void, len(listes)))
+    uniques = np.zeros((0, len(listes)), dtype=np.uint8)
+    while len(uniques) < n:
+        manquants = n - len(uniques)
+        tirage = np.empty((manquants, len(listes)), dtype=np.uint8)
+        tirage[:, :n_prefixe] = decoder_rangs(rng.integers(debut, fin, size=manquants), listes[:n_prefixe])
+        for pos_idx in range(n_prefixe, len(listes)):
+            tirage[:, pos_idx] = rng.integers(0, len(listes[pos_idx]), size=manquants, dtype=np.uint8)
+        lignes = np.concatenate([uniques, tirage]).view(cle).ravel()
+        uniques = np.unique(lignes).view(np.uint8).reshape(-1, len(listes))
+        uniques = _sans_rangs_exclus(uniques, listes, exclus)
+    return uniques
+
+def _sans_rangs_exclus(codes, listes, exclus):
+    """Retire les séquences dont le rang est exclu (rejet après tirage, pour les espaces
+    trop grands pour tirer des indices libres)"""
+    if exclus is None or len(exclus) == 0:
+        return codes
+    return codes[~_appartient(EnsembleSequences(codes, listes).rangs(), exclus)]
+
+def _tirer_intervalle(rng, listes, espace, n, exclus=None):
+    """n séquences distinctes uniformes d'un intervalle de _decouper_espace, triées par rang"""
+    if espace[0] == 'libres':
+        return decoder_rangs(_rangs_libres(_tirer_distincts(rng, espace[1], espace[2], n), exclus), listes)
+    return _tirer_prefixes(rng, listes, *espace[1:], n, exclus=exclus)
+
+def generer_aleatoires(n,listes,seed=None,exclusion=None):
+    """Génère exactement n sequences aléatoires uniques (tirage uniforme sans remise), dans l'ordre des rangs
+    exclusion : Exclusion dont les séquences ne sont jamais tirées
+    Rassemble les blocs de iterer_aleatoires : une même graine donne le même échantillon"""
+    blocs = [lot.codes for lot in iterer_aleatoires(n, listes, seed, exclusion=exclusion)]
+    return EnsembleSequences(np.concatenate(blocs) if blocs else np.empty((0, len(listes)), dtype=np.uint8), listes)
+
+def iterer_aleatoires(n, listes, seed=None, taille_bloc=100000, exclusion=None):
+    """Comme generer_aleatoires, mais produit les séquences par blocs dans l'ordre des rangs
+    L'espace est découpé en intervalles de rangs d'environ TAILLE_INTERVALLE_ALEATOIRE séquences tirées,
+    tirés l'un après l'autre : la mémoire ne dépend pas de n"""
+    exclus = _rangs_exclus(exclusion)
+    libres = calcul_total(listes) - (0 if exclus is None else len(exclus))
+    if n > libres:
+        raise ValueError(f"Cannot draw {n:,} distinct sequences from {libres:,} available ones")
+    rng = np.random.default_rng(seed)
+    espaces, tailles = _decouper_espace(listes, libres, max(1, -(-n // TAILLE_INTERVALLE_ALEATOIRE)), exclus)
+    for espace, compte in zip(espaces, _repartir(n, tailles, rng)):
+        if compte:
+            yield from iterer_sequences(_tirer_intervalle(rng, listes, espace, compte, exclus), listes, taille_bloc)
+
+METHODES_DIVERSITE = ['maxmin', 'equilibre']
+
+def _selection_maxmin(candidats, n, rng):
+    """Sélection gloutonne max-min : chaque nouvelle séquence est le candidat le plus éloigné
+    (distance de Hamming) des séquences déjà choisies. Les colonnes sont stockées par position
+    pour que chaque mise à jour des distances soit une suite de comparaisons contiguës
+    Retourne les indices choisis et la distance de chacun aux précédents au moment du choix"""
+    n_pos = candidats.shape[1]
+    colonnes = np.ascontiguousarray(candidats.T)
+    type_distance = np.uint8 if n_pos < 255 else np.uint16
+    distances = np.full(len(candidats), n_pos + 1, dtype=type_distance)
+    nouvelles = np.empty_like(distances)
+    choisis = np.empty(n, dtype=np.int64)
+    ecarts = np.empty(n, dtype=np.int64)
+    j = int(rng.integers(len(candidats)))
+    for i in range(n):
+        choisis[i], ecarts[i] = j, distances[j]
+        nouvelles[:] = 0
+        for pos_idx in range(n_pos):
+            nouvelles += colonnes[pos_idx] != colonnes[pos_idx, j]
+        np.minimum(distances, nouvelles, out=distances)
+        j = int(distances.argmax())
+    return choisis, ecarts
+
+def _plan_equilibre(n, listes, rng, exclusion=None):
+    """Plan équilibré : à chaque position, les options apparaissent autant de fois les unes
+    que les autres (à une près), dans un ordre aléatoire propre à chaque position.
+    Les lignes en double (ou exclues) sont corrigées par échanges dans une colonne, ce qui garde l'équilibre"""
+    codes = np.empty((n, len(listes)), dtype=np.uint8)
+    for pos_idx, pos in enumerate(listes):
+        colonne = np.tile(np.arange(len(pos), dtype=np.uint8), -(-n // len(pos)))
+        colonne[n // len(pos) * len(pos):] = rng.permutation(len(pos))[:len(colonne) - n // len(pos) * len(pos)]
+        codes[:, pos_idx] = rng.permutation(colonne[:n])
+    cle = np.dtype((np.void, len(listes)))
+    for _ in range(1000):
+        _, premiers = np.unique(codes.view(cle).ravel(), return_index=True)
+        doubles = np.setdiff1d(np.arange(n), premiers)
+        if exclusion is not None:
+            # Les séquences exclues sont corrigées comme les doublons
+            doubles = np.union1d(doubles, np.flatnonzero(exclusion.contient(EnsembleSequences(codes, listes).rangs())))
+        if len(doubles) == 0:
+            return codes
+        for i in doubles:
+            pos_idx, autre = rng.integers(len(listes)), rng.integers(n)
+            codes[[i, autre], pos_idx] = codes[[autre, i], pos_idx]
+    raise ValueError("Could not build a balanced design without duplicates, use the max-min method")
+
+def _distance_moyenne(codes, listes):
+    """Distance de Hamming moyenne entre toutes les paires, exacte à partir des effectifs
+    de chaque option par position : (n² - somme des effectifs²) / 2 paires diffèrent à une position"""
+    n = len(codes)
+    differences = sum((n * n - (np.bincount(codes[:, pos_idx], minlength=len(pos)).astype(np.float64) ** 2).sum()) / 2
+                      for pos_idx, pos in enumerate(listes))
+    return differences / (n * (n - 1) / 2)
+
+def _distance_minimale(codes, listes, taille_bloc=2048):
+    """Distance de Hamming minimale entre toutes les paires : produit matriciel des encodages
+    one-hot (nombre de positions identiques), par blocs de lignes"""
+    n, n_pos = codes.shape
+    decalages = np.concatenate([[0], np.cumsum([len(pos) for pos in listes])])
+    one_hot = np.zeros((n, decalages[-1]), dtype=np.float32)
+    one_hot[np.arange(n)[:, None], decalages[:-1] + codes] = 1
+    identiques = 0
+    for debut in range(0, n - 1, taille_bloc):
+        bloc = one_hot[debut:debut + taille_bloc]
+        communes = bloc @ one_hot[debut:].T
+        # Seules les paires (i, j) avec j > i comptent
+        communes[np.tril_indices(len(bloc), m=communes.shape[1])] = -1
+        identiques = max(identiques, int(communes.max()))
+        if identiques == n_pos - 1:
+            break
+    return n_pos - identiques
+
+def distances_hamming(codes, listes):
+    """Distance de Hamming minimale et moyenne entre les séquences (None s'il y en a moins de deux)"""
+    if len(codes) < 2:
+        return None, None
+    return _distance_minimale(codes, listes), _distance_moyenne(codes, listes)
+
+def echantillonner_diversifie(n, listes, seed=None, methode='maxmin', taille_pool=None, exclusion=None):
+    """Tire n séquences distinctes aussi éloignées que possible les unes des autres (Hamming)
+    methode : 'maxmin' (sélection gloutonne dans un tirage uniforme de taille_pool candidats,
+    4n par défaut) ou 'equilibre' (plan équilibré par position, sans candidats)
+    exclusion : les séquences exclues ne sont jamais choisies
+    Retourne la matrice d'indices de choix triée par rang, la distance minimale et la distance moyenne"""
+    exclus = _rangs_exclus(exclusion)
+    total = calcul_total(listes) - (0 if exclus is None else len(exclus))
+    if n > total:
+        raise ValueError(f"Cannot draw {n:,} distinct sequences from {total:,} available ones")
+    if methode not in METHODES_DIVERSITE:
+        raise ValueError(f"Unknown diversity method '{methode}'")
+    rng = np.random.default_rng(seed)
+    if n == 0:
+        return np.zeros((0, len(listes)), dtype=np.uint8), None, None
+
+    if methode == 'maxmin':
+        taille_pool = min(total, max(n, 4 * n if taille_pool is None else taille_pool))
+        candidats = echantillonner_codes(taille_pool, listes, rng, exclus)
+        # Ordre aléatoire : les égalités de distance ne favorisent pas les petits rangs
+        ordre = rng.permutation(len(candidats))
+        choisis, ecarts = _selection_maxmin(candidats[ordre], n, rng)
+        codes = candidats[np.sort(ordre[choisis])]
+        # La distance minimale est la plus petite distance au moment d'un choix
+        minimum = int(ecarts[1:].min()) if n > 1 else None
+        moyenne = _distance_moyenne(codes, listes) if n > 1 else None
+    else:
+        codes = _plan_equilibre(n, listes, rng, None if exclus is None else exclusion)
+        cle = np.dtype((np.void, len(listes)))
+        codes = np.sort(codes.view(cle).ravel()).view(np.uint8).reshape(-1, len(listes))
+        minimum, moyenne = distances_hamming(codes, listes)
+    return codes, minimum, moyenne
+
+def generer_diversifiees(n, listes, seed=None, methode='maxmin', taille_pool=None, exclusion=None):
+    """Comme generer_aleatoires, mais en maximisant la distance de Hamming entre les séquences
+    Retourne (EnsembleSequences, distance minimale, distance moyenne)"""
+    codes, minimum, moyenne = echantillonner_diversifie(n, listes, seed, methode, taille_pool, exclusion)
+    return EnsembleSequences(codes, listes), minimum, moyenne
+
+def calcul_multiplicateurs(listes):
+    """Calcule le poids de chaque position dans le rang (base mixte, dernière position = 1)"""
+    if isinstance(listes, Bibliotheque):
+        return list(listes.multiplicateurs)
+    multipliers = [1] * len(listes)
+    for i in range(len(listes) - 2, -1, -1):
+        multipliers[i] = multipliers[i + 1] * len(listes[i + 1])
+    return multipliers
+
+def decoder_bloc(start, n, listes):
+    """Décode les rangs [start, start+n) en une matrice uint8 d'indices de choix (n x positions)
+    Le rang de départ est décomposé une seule fois, les suivants sont obtenus par addition
+    vectorisée avec propagation de la retenue (aucune limite sur la taille de la bibliothèque)"""
+    total = calcul_total(listes)
+    n = max(0, min(n, total - start))
+    codes = np.zeros((n, len(listes)), dtype=np.uint8)
+    if n == 0:
+        return codes
+
+    # Chiffres du rang de départ (entiers Python : pas de dépassement)
+    chiffres = []
+    remaining = start
+    for mult in calcul_multiplicateurs(listes):
+        choice_idx, remaining = divmod(remaining, mult)
+        chiffres.append(choice_idx)
+
+    # Addition de 0..n-1 en partant de la dernière position
+    retenue = np.arange(n, dtype=np.int64)
+    for pos_idx in range(len(listes) - 1, -1, -1):
+        if not retenue.any():
+            # Plus de retenue : les positions restantes sont celles du rang de départ
+            codes[:, :pos_idx + 1] = chiffres[:pos_idx + 1]
+            break
+        retenue, codes[:, pos_idx] = np.divmod(retenue + chiffres[pos_idx], len(listes[pos_idx]))
+    return codes
+
+def decoder_rangs(rangs, listes):
+    """Décode un tableau de rangs quelconques en matrice uint8 d'indices de choix"""
+    # Les rangs au-delà de 2**63 restent des entiers Python (dtype object)
+    rangs = np.asarray(rangs)
+    if rangs.dtype != object:
+        rangs = rangs.astype(np.int64)
+    codes = np.zeros((len(rangs), len(listes)), dtype=np.uint8)
+    for pos_idx in range(len(listes) - 1, -1, -1):
+        codes[:, pos_idx] = rangs % len(listes[pos_idx])
+        rangs = rangs // len(listes[pos_idx])
+    return codes
+
+def codes_vers_sequences(codes, listes):
+    """Convertit une matrice d'indices de choix en liste de séquences (chaînes)"""
+    if len(codes) == 0:
+        return []
+    if len(listes) == 0:
+        return [''] * len(codes)
+    return _lettres(codes, listes).view(f'S{len(listes)}').ravel().astype(str).tolist()
+
+def _lettres(codes, listes):
+    """Matrice uint8 (séquences x positions) des codes ASCII correspondant aux indices de choix"""
+    # Table (positions x choix) des codes ASCII, indexée en une seule fois
+    if isinstance(listes, Bibliotheque):
+        table = listes.table_lettres
+    else:
+        table = np.full((len(listes), max((len(pos) for pos in listes), default=1)), ord('-'), dtype=np.uint8)
+        for pos_idx, pos in enumerate(listes):
+            table[pos_idx, :len(pos)] = [ord(aa) for aa in pos]
+    largeur = table.shape[1]
+    decalages = np.arange(len(listes), dtype=np.intp) * largeur
+    return np.take(table.ravel(), codes + decalages)
+
+def _recoder(codes, restreintes, listes):
+    """Convertit des indices de choix pris dans des listes restreintes en indices de la bibliothèque"""
+    recodes = np.empty_like(codes)
+    for pos_idx, (restreinte, pos) in enumerate(zip(restreintes, listes)):
+        correspondance = np.array([pos.index(aa) for aa in restreinte], dtype=np.uint8)
+        recodes[:, pos_idx] = correspondance[codes[:, pos_idx]]
+    return recodes
+
+class EnsembleSequences:
+    """Ensemble de séquences stocké de façon compacte : matrice uint8 (séquences x positions)
+    des indices de choix, accompagnée des alphabets de la bibliothèque
+    Les chaînes ne sont construites qu'à la demande (itération, indexation, sequences())"""
+
+    def __init__(self, codes, listes):
+        self.listes = listes
+        codes = np.ascontiguousarray(codes, dtype=np.uint8)
+        # Sans position, reshape(-1, 0) est indéterminé : le nombre de séquences est la première dimension
+        self.codes = codes.reshape(-1, len(listes)) if len(listes) else codes.reshape(len(codes), 0)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, cle):
+        # Un entier donne une chaîne, une tranche ou un masque donne un EnsembleSequences
+        if isinstance(cle, (int, np.integer)):
+            return codes_vers_sequences(self.codes[cle:cle + 1 or None], self.listes)[0]
+        return EnsembleSequences(self.codes[cle], self.listes)
+
+    def __iter__(self):
+        for bloc in iterer_sequences(self.codes, self.listes):
+            yield from bloc.sequences()
+
+    def __repr__(self):
+        return f"EnsembleSequences({len(self)} sequences x {len(self.listes)} positions)"
+
+    def sequences(self):
+        """Liste des séquences sous forme de chaînes"""
+        return codes_vers_sequences(self.codes, self.listes)
+
+    def rangs(self):
+        """Rang lexicographique de chaque séquence dans la bibliothèque (produit scalaire des indices)"""
+        multipliers = calcul_multiplicateurs(self.listes)
+        if calcul_total(self.listes) < 2**63:
+            return self.codes.astype(np.int64) @ np.array(multipliers, dtype=np.int64)
+        # Au-delà de 2**63 : produits scalaires int64 par groupes de positions consécutives
+        # (chaque rang partiel tient sur 63 bits), combinés ensuite en entiers Python
+        rangs = np.zeros(len(self.codes), dtype=object)
+        fin = len(self.listes)
+        while fin > 0:
+            debut, taille = fin, 1
+            while debut > 0 and taille * len(self.listes[debut - 1]) < 2**63:
+                debut -= 1
+                taille *= len(self.listes[debut])
+            partiel = self.codes[:, debut:fin].astype(np.int64) @ np.array(calcul_multiplicateurs(self.listes[debut:fin]), dtype=np.int64)
+            rangs = rangs + partiel.astype(object) * multipliers[fin - 1]
+            fin = debut
+        return rangs
+
+    def lettres(self):
+        """Matrice uint8 (séquences x positions) des codes ASCII des acides aminés"""
+        return _lettres(self.codes, self.listes)
+
+    def to_numpy(self):
+        """Matrice des indices de choix (sans copie)"""
+        return self.codes
+
+    def to_arrow(self):
+        """Colonne Arrow de chaînes construite directement sur le tampon des lettres (sans objets Python)"""
+        import pyarrow as pa
+        lettres = self.lettres()
+        decalages = np.arange(len(self) + 1, dtype=np.int64) * len(self.listes)
+        return pa.Array.from_buffers(pa.large_string(), len(self),
+                                     [None, pa.py_buffer(decalages), pa.py_buffer(lettres)])
+
+    def to_pandas(self, index=None):
+        """Table pandas (colonne Sequence), adossée à Arrow lorsque pyarrow est disponible"""
+        try:
+            colonne = self.to_arrow()
+            colonne = pd.Series(colonne, dtype=pd.ArrowDtype(colonne.type), index=index)
+        except ImportError:
+            colonne = pd.Series(self.sequences(), index=index, dtype=object)
+        return pd.DataFrame({'Sequence': colonne})
+
+def iterer_sequences(codes, listes, taille_bloc=100000):
+    """Convertit une matrice d'indices de choix en séquences, bloc par bloc"""
+    for debut in range(0, len(codes), taille_bloc):
+        yield EnsembleSequences(codes[debut:debut + taille_bloc], listes)
+
+def generer_premieres(n,listes,start=0,exclusion=None):
+    """Génère les n premières sequences à partir du rang start (ordre lexicographique)
+    exclusion : les séquences exclues sont sautées, n séquences nouvelles sont toujours produites"""
+    exclus = _rangs_exclus(exclusion)
+    return EnsembleSequences(decoder_libres(_indice_libre(start, exclus), n, listes, exclus), listes)
+
+def iterer_premieres(n, listes, start=0, taille_bloc=100000, exclusion=None):
+    """Comme generer_premieres, mais produit les séquences par blocs (mémoire constante)"""
+    exclus = _rangs_exclus(exclusion)
+    debut = _indice_libre(start, exclus)
+    fin = min(debut + n, calcul_total(listes) - (0 if exclus is None else len(exclus)))
+    for bloc in range(debut, fin, taille_bloc):
+        yield EnsembleSequences(decoder_libres(bloc, min(taille_bloc, fin - bloc), listes, exclus), listes)
+
+def decouper_motif(motif):
+    """Découpe un motif à positions fixes en un élément par position
+    ('-', une lettre, une classe [KR] ou une classe négative [^P])"""
+    return re.findall(r"\[\^?[^\]]*\]|.", motif)
+
+def _accepte(element, aa):
+    """Indique si un acide aminé est autorisé par un élément de motif"""
+    if element == '-':
+        return True
+    if element.startswith('[^'):
+        return aa not in element[2:-1]
+    if element.startswith('['):
+        return aa in element[1:-1]
+    return aa == element
+
+def analyser_motif(motif, listes):
+    """Restreint chaque position aux choix autorisés par le motif
+    Retourne (listes restreintes, erreurs) ; les erreurs sont détaillées position par position"""
+    elements = decouper_motif(motif)
+    if len(elements) != len(listes):
+        return [], [f"The motif must describe exactly {len(listes)} positions ({len(elements)} given)"]
+    restreintes = []
+    errors = []
+    for i, (element, pos) in enumerate(zip(elements, listes)):
+        lettres = element.strip('[^]') if element.startswith('[') else element
+        if element != '-' and not re.fullmatch(r"[A-Z]+", lettres):
+            errors.append(f"Position {i+1}: '{element}' is not a valid amino acid or class")
+            continue
+        # Une lettre (seule ou dans une classe positive) doit exister à cette position
+        if element != '-' and not element.startswith('[^'):
+            invalides = [aa for aa in lettres if aa not in pos]
+            if invalides:
+                errors.append(f"Position {i+1}: '{', '.join(invalides)}' is not valid at this position. Options avalaible: {', '.join(pos)}")
+                continue
+        choix = [aa for aa in pos if _accepte(element, aa)]
+        if not choix:
+            errors.append(f"Position {i+1}: '{element}' excludes every option. Options avalaible: {', '.join(pos)}")
+            continue
+        restreintes.append(choix)
+    return restreintes, errors
 
 def match_motif(seq, motif):
-    """Vérifie si une séquence correspond à un motif (avec - comme wildcard)"""
-    if len(motif) != len(seq):
+    """Vérifie si une séquence correspond à un motif (avec - comme wildcard, [KR] et [^P] comme classes)"""
+    elements = decouper_motif(motif)
+    if len(elements) != len(seq):
         return False
-    for s, m in zip(seq, motif):
-        if m != '-' and s != m:
+    for s, m in zip(seq, elements):
+        if not _accepte(m, s):
             return False
     return True
 
@@ -101,131 +1006,1675 @@ def match_regex_motif(seq, pattern):
     regex_pattern = pattern.replace('*', '.*')
     return re.search(regex_pattern, seq) is not None
 
-def chercher_motif(motif, max_results,listes):
-    """Cherche des sequences correspondant à un motif - VERSION RAPIDE"""
-    sequences = []
-    
-    # Si le motif est juste des underscores, générer aléatoirement
-    if motif == "-" * len(listes):
-        return generer_aleatoires(max_results,listes)
-    
-    # Identifier les listes fixes et leurs valeurs
-    fixed_listes = []
-    variable_listes = []
-    
-    for i, char in enumerate(motif):
-        if char != '-':
-            # Vérifier que le caractère est valide pour cette position
-            if char in listes[i]:
-                fixed_listes.append((i, char))
-            else:
-                return []  # Motif impossible
+def chercher_motif(motif, max_results,listes,aleatoire=False,seed=None,offset=0,exclusion=None):
+    """Cherche des sequences correspondant à un motif - VERSION RAPIDE
+    Les correspondances forment un sous-espace à base mixte énuméré directement, à partir
+    de la correspondance n° offset (pagination)
+    aleatoire=True : tirage uniforme parmi toutes les correspondances plutôt que les premières
+    exclusion : les séquences exclues sont sautées (offset compte les correspondances non exclues)"""
+    restreintes, errors = analyser_motif(motif, listes)
+    if errors:
+        return EnsembleSequences(np.zeros((0, len(listes))), listes)  # Motif impossible
+    exclus = _rangs_exclus(exclusion, listes, restreintes)
+    libres = calcul_total(restreintes) - (0 if exclus is None else len(exclus))
+
+    if aleatoire:
+        codes = echantillonner_codes(min(max_results, libres), restreintes, seed, exclus)
+        return EnsembleSequences(_recoder(codes, restreintes, listes), listes)
+
+    # Les listes restreintes gardent l'ordre de la bibliothèque : même ordre lexicographique
+    codes = decoder_libres(offset, max_results, restreintes, exclus)
+    return EnsembleSequences(_recoder(codes, restreintes, listes), listes)
+
+def iterer_motif(motif, n, listes, aleatoire=False, seed=None, offset=0, taille_bloc=100000, exclusion=None):
+    """Comme chercher_motif, mais produit les correspondances par blocs (mémoire bornée)"""
+    restreintes, errors = analyser_motif(motif, listes)
+    if errors:
+        return
+    exclus = _rangs_exclus(exclusion, listes, restreintes)
+    libres = calcul_total(restreintes) - (0 if exclus is None else len(exclus))
+    if aleatoire:
+        codes = echantillonner_codes(min(n, libres), restreintes, seed, exclus)
+        yield from iterer_sequences(_recoder(codes, restreintes, listes), listes, taille_bloc)
+        return
+    fin = min(offset + n, libres)
+    for debut in range(offset, fin, taille_bloc):
+        codes = decoder_libres(debut, min(taille_bloc, fin - debut), restreintes, exclus)
+        yield EnsembleSequences(_recoder(codes, restreintes, listes), listes)
+
+def compiler_motif_flexible(pattern):
+    """Compile un motif flexible (* = n'importe quelle sous-séquence) en automate fini déterministe
+    Retourne (transitions, etat_final) où transitions[état][acide aminé] donne l'état suivant,
+    ou None si le motif contient autre chose que des lettres et des *"""
+    if not re.fullmatch(r"[A-Z*]*", pattern):
+        return None
+    # Même sémantique que re.search(pattern.replace('*', '.*')) : les segments fixes
+    # doivent apparaître dans l'ordre, sans chevauchement (reconnaissance gloutonne)
+    segments = [seg for seg in pattern.split('*') if seg]
+    etat_final = sum(len(seg) for seg in segments)
+    lettres = [chr(c) for c in range(ord('A'), ord('Z') + 1)]
+
+    transitions = []
+    debut = 0
+    for seg in segments:
+        for k in range(len(seg)):
+            transitions.append({})
+            for aa in lettres:
+                # Plus long préfixe du segment qui termine seg[:k] + aa (automate KMP)
+                lu = seg[:k] + aa
+                suivant = next(j for j in range(len(lu), -1, -1) if lu.endswith(seg[:j]))
+                if suivant == len(seg):
+                    transitions[-1][aa] = debut + len(seg)  # segment reconnu : on passe au suivant
+                else:
+                    transitions[-1][aa] = debut + suivant
+        debut += len(seg)
+    transitions.append({aa: etat_final for aa in lettres})  # état final absorbant
+    return transitions, etat_final
+
+def _tables_automate(listes, automate):
+    """Intersecte l'automate avec les alphabets de chaque position
+    enfants[pos][état] = [(indice du choix, état suivant)] ne menant qu'à des préfixes viables
+    comptes[pos][état] = nombre exact de suffixes acceptés à partir de cet état"""
+    transitions, etat_final = automate
+    etats = range(len(transitions))
+    comptes = [None] * (len(listes) + 1)
+    comptes[len(listes)] = [int(etat == etat_final) for etat in etats]
+    enfants = [None] * len(listes)
+    for pos_idx in range(len(listes) - 1, -1, -1):
+        suivants = comptes[pos_idx + 1]
+        enfants[pos_idx] = [
+            [(i, transitions[etat][aa]) for i, aa in enumerate(listes[pos_idx]) if suivants[transitions[etat][aa]]]
+            for etat in etats
+        ]
+        comptes[pos_idx] = [sum(suivants[etat_suivant] for _, etat_suivant in enfants[pos_idx][etat]) for etat in etats]
+    return enfants, comptes
+
+def _parcourir_automate(listes, automate):
+    """Énumère en ordre lexicographique les indices de choix des séquences acceptées
+    Seuls les préfixes pouvant encore aboutir sont explorés : coût proportionnel à la sortie"""
+    enfants, comptes = _tables_automate(listes, automate)
+    if not comptes[0][0]:
+        return
+    n_pos = len(listes)
+    if n_pos == 0:
+        yield []
+        return
+    codes = [0] * n_pos
+    # Pile : pour chaque position, les choix restants à explorer
+    pile = [iter(enfants[0][0])]
+    while pile:
+        pos_idx = len(pile) - 1
+        choix = next(pile[-1], None)
+        if choix is None:
+            pile.pop()
+            continue
+        codes[pos_idx], etat = choix
+        if pos_idx == n_pos - 1:
+            yield list(codes)
         else:
-            variable_listes.append(i)
-    
-    # Si toutes les listes sont fixes, retourner directement
-    if not variable_listes:
-        return [motif]
-    
-    # Générer seulement les combinaisons possibles pour les listes variables
-    variable_choices = [listes[i] for i in variable_listes]
-    
-    for combo in itertools.product(*variable_choices):
-        if len(sequences) >= max_results:
-            break
-        
-        # Construire la sequence
-        seq = list(motif)
-        for var_idx, pos_idx in enumerate(variable_listes):
-            seq[pos_idx] = combo[var_idx]
-        
-        sequences.append(''.join(seq))
-    
-    return sequences
-
-def chercher_regex_motif(pattern, max_results,listes):
-    """Cherche des séquences correspondant à un motif regex (* = wildcard)"""
-    import re
-    sequences = []
-    
-    # Convertir le pattern utilisateur en regex Python
-    regex_pattern = pattern.replace('*', '.*')
-    
-    # Parcourir toutes les séquences possibles (peut être lent!)
-    # On utilise un générateur pour arrêter dès qu'on a assez de résultats
-    for seq in itertools.product(*listes):
-        if len(sequences) >= max_results:
+            pile.append(iter(enfants[pos_idx + 1][etat]))
+
+def _tirer_rangs(total, n, seed=None):
+    """Tire n rangs distincts uniformément dans [0, total), triés (total peut dépasser 2**63)"""
+    rng = random.Random(seed)
+    if total <= sys.maxsize:
+        return sorted(rng.sample(range(total), n))
+    # Espace gigantesque : les collisions sont négligeables, on rejette simplement les doublons
+    rangs = set()
+    while len(rangs) < n:
+        rangs.add(rng.randrange(total))
+    return sorted(rangs)
+
+def _decoder_rangs_automate(rangs, listes, enfants, comptes):
+    """Décode des rangs pris dans le sous-espace des séquences acceptées par l'automate
+    Chaque position est traitée d'un bloc : recherche du choix par somme cumulée des comptes"""
+    # Entiers Python (dtype object) si le nombre de correspondances dépasse 2**63
+    dtype = np.int64 if comptes[0][0] < 2**63 else object
+    rangs = np.array(rangs, dtype=dtype)
+    codes = np.zeros((len(rangs), len(listes)), dtype=np.uint8)
+    etats = np.zeros(len(rangs), dtype=np.int64)
+    for pos_idx in range(len(listes)):
+        nouveaux = np.empty_like(etats)
+        for etat in np.unique(etats):
+            selection = etats == etat
+            choix = enfants[pos_idx][etat]
+            bornes = np.cumsum(np.array([comptes[pos_idx + 1][suivant] for _, suivant in choix], dtype=dtype))
+            j = np.searchsorted(bornes, rangs[selection], side='right')
+            rangs[selection] -= np.concatenate([np.zeros(1, dtype=dtype), bornes[:-1]])[j]
+            codes[selection, pos_idx] = np.array([i for i, _ in choix])[j]
+            nouveaux[selection] = np.array([suivant for _, suivant in choix])[j]
+        etats = nouveaux
+    return codes
+
+def _scanner_tranche(pattern, listes, debut, fin, max_results, taille_bloc=100000, exclus=None):
+    """Parcourt les rangs [debut, fin) et retourne les indices de choix des max_results premières
+    séquences reconnues par le motif (exécuté dans un processus de travail)
+    exclus : rangs exclus de la tranche, triés (ces séquences ne sont pas retenues)"""
+    regex = re.compile(pattern.replace('*', '.*'))
+    trouves = [np.zeros((0, len(listes)), dtype=np.uint8)]
+    n_trouves = 0
+    for start in range(debut, fin, taille_bloc):
+        codes = decoder_bloc(start, min(taille_bloc, fin - start), listes)
+        exclu = np.zeros(len(codes), dtype=bool)
+        if exclus is not None:
+            exclu[(exclus[np.searchsorted(exclus, start):np.searchsorted(exclus, start + len(codes))] - start).astype(np.int64)] = True
+        lignes = [i for i, seq in enumerate(codes_vers_sequences(codes, listes)) if not exclu[i] and regex.search(seq)]
+        trouves.append(codes[lignes[:max_results - n_trouves]])
+        n_trouves += len(trouves[-1])
+        if n_trouves >= max_results:
             break
-        
-        seq_str = ''.join(seq)
-        if re.search(regex_pattern, seq_str):
-            sequences.append(seq_str)
-    
-    return sequences
-
-def calculer_proprietes(seq):
-    """Calcule quelques propriétés basiques de la sequence"""
-    # Propriétés basiques
-    hydrophobic = sum(1 for aa in seq if aa in ['A', 'L', 'P','V','I'])
-    charged = sum(1 for aa in seq if aa in ['D', 'E', 'K', 'R','H'])
-    polar = sum(1 for aa in seq if aa in ['S','T','N','Q','E','D','K','R','H'])
-    
-    return {
+    return np.concatenate(trouves)
+
+def _contexte_processus():
+    """Démarrage des processus des pools : jamais par fork, le processus parent pouvant avoir
+    d'autres threads (serveur web) dont les verrous seraient copiés dans leur état du moment"""
+    methode = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(methode)
+
+def iterer_tranches_regex(pattern, max_results, listes, n_workers=1, taille_tranche=1000000, exclusion=None):
+    """Parcours exhaustif de l'espace des rangs découpé en tranches contiguës
+    Produit, dans l'ordre des rangs, (rang de fin de la tranche, indices de choix de ses correspondances)
+    Les tranches sont traitées par un pool de processus (n_workers > 1) et fusionnées dans l'ordre
+    des rangs, donc lexicographique : dès que les tranches de tête terminées contiennent
+    max_results correspondances, les tranches restantes sont annulées (de même si le générateur est fermé)"""
+    total = calcul_total(listes)
+    exclus = _rangs_exclus(exclusion)
+
+    def tranches():
+        # Chaque tranche n'emporte que ses propres rangs exclus
+        for debut in range(0, total, taille_tranche):
+            fin = min(debut + taille_tranche, total)
+            yield debut, fin, None if exclus is None else exclus[np.searchsorted(exclus, debut):np.searchsorted(exclus, fin)]
+
+    n_trouves = 0
+    if n_workers <= 1:
+        for debut, fin, exclus_tranche in tranches():
+            codes = _scanner_tranche(pattern, listes, debut, fin, max_results - n_trouves, exclus=exclus_tranche)
+            n_trouves += len(codes)
+            yield fin, codes
+            if n_trouves >= max_results:
+                return
+        return
+
+    # Fenêtre glissante de tranches soumises : la file d'attente reste bornée même pour des
+    # bibliothèques immenses, et les tranches de tête sont toujours les premières traitées
+    en_cours = collections.deque()
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=n_workers, mp_context=_contexte_processus())
+    try:
+        a_soumettre = tranches()
+        while True:
+            tranche = next(a_soumettre, None)
+            if tranche is not None:
+                debut, fin, exclus_tranche = tranche
+                en_cours.append((fin, pool.submit(_scanner_tranche, pattern, listes, debut, fin, max_results, exclus=exclus_tranche)))
+            if not en_cours:
+                return
+            # Fusion des tranches de tête dans l'ordre des rangs : on attend la plus ancienne
+            # seulement si la fenêtre est pleine ou s'il n'y a plus rien à soumettre
+            while en_cours and (en_cours[0][1].done() or len(en_cours) >= 2 * n_workers or tranche is None):
+                fin, future = en_cours.popleft()
+                codes = future.result()[:max_results - n_trouves]
+                n_trouves += len(codes)
+                yield fin, codes
+                if n_trouves >= max_results:
+                    return
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def scanner_regex_tranches(pattern, max_results, listes, n_workers=1, taille_tranche=1000000, exclusion=None):
+    """Comme iterer_tranches_regex, mais retourne toutes les correspondances en une matrice"""
+    resultats = [np.zeros((0, len(listes)), dtype=np.uint8)]
+    resultats += [codes for _, codes in iterer_tranches_regex(pattern, max_results, listes, n_workers, taille_tranche, exclusion)]
+    return np.concatenate(resultats)[:max_results]
+
+def _rangs_automate(codes, listes, enfants, comptes):
+    """Inverse de _decoder_rangs_automate : rang de chaque séquence parmi celles acceptées
+    par l'automate. Retourne (rangs des séquences acceptées, masque des séquences acceptées)"""
+    # Entiers Python (dtype object) si le nombre de correspondances dépasse 2**63
+    dtype = np.int64 if comptes[0][0] < 2**63 else object
+    rangs = np.zeros(len(codes), dtype=dtype)
+    etats = np.zeros(len(codes), dtype=np.int64)
+    acceptees = np.ones(len(codes), dtype=bool)
+    for pos_idx, pos in enumerate(listes):
+        nouveaux = np.zeros_like(etats)
+        for etat in np.unique(etats[acceptees]):
+            selection = acceptees & (etats == etat)
+            choix = enfants[pos_idx][etat]
+            # Pour chaque choix possible : suffixes des choix viables qui le précèdent, état suivant
+            avant = np.full(len(pos), -1, dtype=dtype)
+            suivants = np.zeros(len(pos), dtype=np.int64)
+            cumul = 0
+            for i, suivant in choix:
+                avant[i], suivants[i] = cumul, suivant
+                cumul += comptes[pos_idx + 1][suivant]
+            colonne = codes[selection, pos_idx]
+            rangs[selection] += avant[colonne]
+            nouveaux[selection] = suivants[colonne]
+            acceptees[np.flatnonzero(selection)[avant[colonne] < 0]] = False
+        etats = nouveaux
+    return rangs[acceptees], acceptees
+
+def _exclus_automate(exclusion, listes, enfants, comptes):
+    """Rangs triés, parmi les séquences acceptées par l'automate, des séquences exclues acceptées"""
+    if exclusion is None or len(exclusion) == 0:
+        return None
+    rangs, _ = _rangs_automate(decoder_rangs(exclusion.rangs, listes), listes, enfants, comptes)
+    return np.sort(rangs)
+
+def chercher_regex_motif(pattern, max_results,listes,aleatoire=False,seed=None,n_workers=1,taille_tranche=1000000,exclusion=None):
+    """Cherche des séquences correspondant à un motif regex (* = wildcard)
+    aleatoire=True : tirage uniforme parmi toutes les correspondances plutôt que les premières
+    n_workers, taille_tranche : parcours exhaustif (motifs non compilables en automate) réparti
+    sur plusieurs processus ; le résultat est identique à celui du parcours en série
+    exclusion : les séquences exclues sont sautées"""
+    automate = compiler_motif_flexible(pattern)
+    if automate is None:
+        if aleatoire:
+            raise ValueError("Random matches require a motif made only of amino acids and '*'")
+        # Motif contenant d'autres caractères regex : parcours exhaustif par tranches (peut être lent!)
+        codes = scanner_regex_tranches(pattern, max_results, listes, n_workers, taille_tranche, exclusion)
+        return EnsembleSequences(codes, listes)
+
+    if exclusion is not None and len(exclusion):
+        return EnsembleSequences(np.concatenate([np.zeros((0, len(listes)), dtype=np.uint8)] + [
+            bloc.codes for bloc in iterer_regex_motif(pattern, max_results, listes, aleatoire, seed, exclusion=exclusion)
+        ]), listes)
+
+    if aleatoire:
+        # Rangs uniformes dans [0, nombre de correspondances), décodés via les comptes par préfixe
+        enfants, comptes = _tables_automate(listes, automate)
+        rangs = _tirer_rangs(comptes[0][0], min(max_results, comptes[0][0]), seed)
+        return EnsembleSequences(_decoder_rangs_automate(rangs, listes, enfants, comptes), listes)
+
+    codes = list(itertools.islice(_parcourir_automate(listes, automate), max_results))
+    return EnsembleSequences(np.array(codes, dtype=np.uint8), listes)
+
+def iterer_regex_motif(pattern, n, listes, aleatoire=False, seed=None, taille_bloc=100000, n_workers=1, taille_tranche=1000000, exclusion=None):
+    """Comme chercher_regex_motif, mais produit les correspondances par blocs
+    Le parcours de l'automate est paresseux : rien n'est calculé au-delà du bloc en cours"""
+    automate = compiler_motif_flexible(pattern)
+    if automate is None and not aleatoire:
+        # Parcours exhaustif : les correspondances de chaque tranche sont produites dès sa fusion
+        for _, codes in iterer_tranches_regex(pattern, n, listes, n_workers, taille_tranche, exclusion):
+            yield from iterer_sequences(codes, listes, taille_bloc)
+        return
+    if exclusion is not None and len(exclusion) and automate is not None:
+        # Avec exclusion : séquences non exclues n° 0, 1, ... (ou tirées uniformément parmi elles)
+        # converties en rangs parmi les correspondances, puis décodées
+        enfants, comptes = _tables_automate(listes, automate)
+        exclus = _exclus_automate(exclusion, listes, enfants, comptes)
+        libres = comptes[0][0] - len(exclus)
+        if aleatoire:
+            indices = np.array(_tirer_rangs(libres, min(n, libres), seed), dtype=exclus.dtype)
+        else:
+            indices = np.arange(min(n, libres), dtype=np.int64)
+        for debut in range(0, len(indices), taille_bloc):
+            rangs = _rangs_libres(indices[debut:debut + taille_bloc], exclus)
+            yield EnsembleSequences(_decoder_rangs_automate(rangs, listes, enfants, comptes), listes)
+        return
+    if automate is None or aleatoire:
+        yield from iterer_sequences(chercher_regex_motif(pattern, n, listes, aleatoire, seed, n_workers, taille_tranche).codes,
+                                    listes, taille_bloc)
+        return
+    parcours = itertools.islice(_parcourir_automate(listes, automate), n)
+    while True:
+        codes = list(itertools.islice(parcours, taille_bloc))
+        if not codes:
+            return
+        yield EnsembleSequences(np.array(codes, dtype=np.uint8), listes)
+
+def compter_motif(motif, listes, exclusion=None):
+    """Nombre exact de séquences de la bibliothèque correspondant à un motif à positions fixes
+    (hors séquences exclues)"""
+    restreintes, errors = analyser_motif(motif, listes)
+    if errors:
+        return 0
+    exclus = _rangs_exclus(exclusion, listes, restreintes)
+    return calcul_total(restreintes) - (0 if exclus is None else len(exclus))
+
+def compter_regex_motif(pattern, listes, exclusion=None):
+    """Nombre exact de séquences contenant un motif flexible (* = wildcard), sans énumération
+    (hors séquences exclues). Retourne None si le motif n'est pas compilable en automate"""
+    automate = compiler_motif_flexible(pattern)
+    if automate is None:
+        return None
+    enfants, comptes = _tables_automate(listes, automate)
+    exclus = _exclus_automate(exclusion, listes, enfants, comptes)
+    return comptes[0][0] - (0 if exclus is None else len(exclus))
+
+# Classes d'acides aminés comptées dans les propriétés
+HYDROPHOBES = ['A', 'L', 'P', 'V', 'I']
+CHARGES = ['D', 'E', 'K', 'R', 'H']
+POLAIRES = ['S', 'T', 'N', 'Q', 'E', 'D', 'K', 'R', 'H']
+
+# Masses moyennes des résidus (Da, acide aminé moins une molécule d'eau)
+MASSES_RESIDUS = {
+    'A': 71.0788, 'R': 156.1875, 'N': 114.1038, 'D': 115.0886, 'C': 103.1388,
+    'E': 129.1155, 'Q': 128.1307, 'G': 57.0519, 'H': 137.1411, 'I': 113.1594,
+    'L': 113.1594, 'K': 128.1741, 'M': 131.1926, 'F': 147.1766, 'P': 97.1167,
+    'S': 87.0782, 'T': 101.1051, 'W': 186.2132, 'Y': 163.1760, 'V': 99.1326,
+}
+MASSE_EAU = 18.01528
+
+# Échelle d'hydropathie de Kyte & Doolittle (GRAVY = moyenne sur la séquence)
+HYDROPATHIE = {
+    'A': 1.8, 'R': -4.5, 'N': -3.5, 'D': -3.5, 'C': 2.5, 'Q': -3.5, 'E': -3.5,
+    'G': -0.4, 'H': -3.2, 'I': 4.5, 'L': 3.8, 'K': -3.9, 'M': 1.9, 'F': 2.8,
+    'P': -1.6, 'S': -0.8, 'T': -0.7, 'W': -0.9, 'Y': -1.3, 'V': 4.2,
+}
+
+# pKa (valeurs EMBOSS) des chaînes latérales ionisables et des extrémités
+PKA_POSITIFS = {'K': 10.8, 'R': 12.5, 'H': 6.5}
+PKA_NEGATIFS = {'D': 3.9, 'E': 4.1, 'C': 8.5, 'Y': 10.1}
+PKA_N_TERMINAL = 8.6
+PKA_C_TERMINAL = 3.6
+IONISABLES = list(PKA_POSITIFS) + list(PKA_NEGATIFS)
+
+# Propriétés additives en entiers exacts : masses des résidus exactes au dix-millième, masse de l'eau
+# au cent-millième, hydropathie au dixième ; la charge nette ne dépend que des comptes des résidus ionisables
+ECHELLE_MASSE = 10**4
+ECHELLE_EAU = 10**5
+ECHELLE_HYDROPATHIE = 10
+CLASSES_PROPRIETES = {'Hydrophobics': HYDROPHOBES, 'Charged': CHARGES, 'Polars': POLAIRES, 'Glycines': ['G']}
+
+def _table_positions(listes, valeurs, dtype=np.float64):
+    """Table (positions x choix) de la valeur de chaque acide aminé proposé à chaque position
+    valeurs : dictionnaire acide aminé -> valeur, ou liste d'acides aminés (valeur 1)
+    Pour une Bibliotheque, la table est mémorisée (clé dérivée des valeurs et du type)"""
+    if not isinstance(valeurs, dict):
+        valeurs = {aa: 1 for aa in valeurs}
+    if isinstance(listes, Bibliotheque):
+        cle = 'table_' + hashlib.sha1(repr((np.dtype(dtype).str, sorted(valeurs.items()))).encode()).hexdigest()[:16]
+        table = listes.tables.get(cle)
+        if table is None:
+            table = _table_positions(list(listes), valeurs, dtype)
+            table.flags.writeable = False
+            listes.tables[cle] = table
+        return table
+    largeur = max((len(pos) for pos in listes), default=1)
+    table = np.zeros((len(listes), largeur), dtype=dtype)
+    for pos_idx, pos in enumerate(listes):
+        table[pos_idx, :len(pos)] = [valeurs.get(aa, 0) for aa in pos]
+    return table
+
+def _somme_positions(colonnes, table):
+    """Somme, pour chaque séquence, des valeurs de la table (positions x choix) aux choix effectués
+    colonnes : matrice des choix transposée (une ligne contiguë par position)"""
+    somme = np.zeros(colonnes.shape[1], dtype=table.dtype)
+    for pos_idx, colonne in enumerate(colonnes):
+        somme += table[pos_idx].take(colonne)
+    return somme
+
+def _compter_classes(colonnes, listes, classes):
+    """Compte, pour chaque séquence, les résidus appartenant à chaque classe
+    Plusieurs comptes sont empaquetés dans un même entier 64 bits : une seule passe par groupe"""
+    bits = max(len(listes), 1).bit_length()
+    par_paquet = max(62 // bits, 1)
+    comptes = []
+    for debut in range(0, len(classes), par_paquet):
+        groupe = classes[debut:debut + par_paquet]
+        valeurs = {}
+        for k, classe in enumerate(groupe):
+            for aa in classe:
+                valeurs[aa] = valeurs.get(aa, 0) + (1 << (bits * k))
+        paquets = _somme_positions(colonnes, _table_positions(listes, valeurs, np.int64))
+        comptes += [(paquets >> (bits * k)) & ((1 << bits) - 1) for k in range(len(groupe))]
+    return comptes
+
+def _charge_nette(ph, comptes_ionisables):
+    """Charge nette (Henderson-Hasselbalch) à partir des comptes de résidus ionisables par séquence"""
+    charge = 1 / (1 + 10 ** (ph - PKA_N_TERMINAL)) - 1 / (1 + 10 ** (PKA_C_TERMINAL - ph))
+    for aa, pka in PKA_POSITIFS.items():
+        charge = charge + comptes_ionisables[aa] / (1 + 10 ** (ph - pka))
+    for aa, pka in PKA_NEGATIFS.items():
+        charge = charge - comptes_ionisables[aa] / (1 + 10 ** (pka - ph))
+    return charge
+
+def _dimensions_propriete(propriete):
+    """Valeurs entières par résidu de chaque dimension d'une propriété (un dictionnaire par dimension)
+    La charge nette a une dimension par résidu ionisable (leurs comptes)"""
+    if propriete in CLASSES_PROPRIETES:
+        return [{aa: 1 for aa in CLASSES_PROPRIETES[propriete]}]
+    if propriete == 'Molecular weight':
+        return [{aa: round(masse * ECHELLE_MASSE) for aa, masse in MASSES_RESIDUS.items()}]
+    if propriete == 'GRAVY':
+        return [{aa: round(valeur * ECHELLE_HYDROPATHIE) for aa, valeur in HYDROPATHIE.items()}]
+    if propriete == 'Net charge':
+        return [{aa: 1} for aa in IONISABLES]
+    raise ValueError(f"'{propriete}' is not an additive property (pI cannot be profiled)")
+
+def _valeur_affichee(propriete, sommes, n_pos, ph=7.0):
+    """Valeur d'une propriété telle qu'affichée par calculer_proprietes_lot (même arrondi),
+    à partir des sommes entières de ses dimensions (matrice séquences x dimensions)"""
+    if propriete in CLASSES_PROPRIETES:
+        return sommes[:, 0]
+    if propriete == 'Molecular weight':
+        eau = round(MASSE_EAU * ECHELLE_EAU)
+        return np.round((sommes[:, 0] * (ECHELLE_EAU // ECHELLE_MASSE) + eau) / ECHELLE_EAU, 2)
+    if propriete == 'GRAVY':
+        return np.round(sommes[:, 0] / (ECHELLE_HYDROPATHIE * max(n_pos, 1)), 3)
+    if propriete == 'Net charge':
+        return np.round(_charge_nette(ph, dict(zip(IONISABLES, sommes.T))), 2)
+    raise ValueError(f"'{propriete}' is not an additive property (pI cannot be profiled)")
+
+def _dans_fenetres(sommes, tranches, contraintes, n_pos, ph=7.0):
+    """Masque des sommes entières (séquences x dimensions) dont les valeurs affichées sont dans
+    les fenêtres {propriété: (min, max)} ; tranches : dimensions de chaque propriété"""
+    masque = np.ones(len(sommes), dtype=bool)
+    for propriete, (minimum, maximum) in contraintes.items():
+        valeur = _valeur_affichee(propriete, sommes[:, tranches[propriete]], n_pos, ph)
+        if minimum is not None:
+            masque &= valeur >= minimum
+        if maximum is not None:
+            masque &= valeur <= maximum
+    return masque
+
+def calculer_proprietes_lot(sequences, ph=7.0):
+    """Calcule les propriétés de toutes les séquences d'un EnsembleSequences en une passe
+    (tables de correspondance indexées par la matrice des choix) ; une colonne par propriété"""
+    listes = sequences.listes
+    colonnes = np.ascontiguousarray(sequences.codes.T)
+    hydrophobic, charged, polar, glycine = _compter_classes(colonnes, listes, [HYDROPHOBES, CHARGES, POLAIRES, ['G']])
+
+    # Charge et pI ne dépendent que des comptes de résidus ionisables :
+    # ils ne sont calculés qu'une fois par combinaison distincte de ces comptes
+    comptes = _compter_classes(colonnes, listes, [[aa] for aa in IONISABLES])
+    cles = np.zeros(len(sequences), dtype=np.int64)
+    for compte in comptes:
+        cles = cles * (len(listes) + 1) + compte
+    if (len(listes) + 1) ** len(IONISABLES) < 2**63:
+        _, premiers, inverse = np.unique(cles, return_index=True, return_inverse=True)
+    else:
+        premiers = inverse = slice(None)
+    comptes_ionisables = {aa: compte[premiers] for aa, compte in zip(IONISABLES, comptes)}
+
+    # Point isoélectrique : dichotomie vectorisée (la charge décroît avec le pH)
+    bas = np.zeros(len(comptes_ionisables['K']))
+    haut = np.full(len(bas), 14.0)
+    for _ in range(30):
+        milieu = (bas + haut) / 2
+        positif = _charge_nette(milieu, comptes_ionisables) > 0
+        bas = np.where(positif, milieu, bas)
+        haut = np.where(positif, haut, milieu)
+
+    # Masse et GRAVY sommées en entiers exacts (mêmes valeurs que les recherches sous contraintes)
+    def additive(propriete):
+        somme = _somme_positions(colonnes, _table_positions(listes, _dimensions_propriete(propriete)[0], np.int64))
+        return _valeur_affichee(propriete, somme[:, None], len(listes), ph)
+
+    return pd.DataFrame({
         'Hydrophobics': hydrophobic,
         'Charged': charged,
         'Polars': polar,
-        'Glycines': seq.count('G')
+        'Glycines': glycine,
+        'Molecular weight': additive('Molecular weight'),
+        'Net charge': _valeur_affichee('Net charge', np.stack([comptes_ionisables[aa] for aa in IONISABLES], axis=1),
+                                       len(listes), ph)[inverse],
+        'GRAVY': additive('GRAVY'),
+        'pI': np.round((bas + haut) / 2, 2)[inverse],
+    })
+
+def calculer_proprietes(seq, ph=7.0):
+    """Calcule les propriétés d'une sequence (mêmes tables que calculer_proprietes_lot)"""
+    # Une séquence seule = une bibliothèque d'un seul choix par position
+    sequence = EnsembleSequences(np.zeros((1, len(seq))), [[aa] for aa in seq])
+    return calculer_proprietes_lot(sequence, ph).to_dict('records')[0]
+
+def _charges_residus(ph):
+    """Charge moyenne portée par chaque résidu ionisable, et par les deux extrémités, à un pH donné"""
+    charges = {aa: 1 / (1 + 10 ** (ph - pka)) for aa, pka in PKA_POSITIFS.items()}
+    charges.update({aa: -1 / (1 + 10 ** (pka - ph)) for aa, pka in PKA_NEGATIFS.items()})
+    extremites = 1 / (1 + 10 ** (ph - PKA_N_TERMINAL)) - 1 / (1 + 10 ** (PKA_C_TERMINAL - ph))
+    return charges, extremites
+
+def _propriete_additive(propriete, ph=7.0):
+    """Décrit une propriété comme somme de valeurs par résidu
+    Retourne (valeurs par acide aminé, constante ajoutée)"""
+    if propriete in CLASSES_PROPRIETES:
+        return {aa: 1 for aa in CLASSES_PROPRIETES[propriete]}, 0
+    if propriete == 'Molecular weight':
+        return MASSES_RESIDUS, MASSE_EAU
+    if propriete == 'Net charge':
+        charges, extremites = _charges_residus(ph)
+        return charges, extremites
+    if propriete == 'GRAVY':
+        return HYDROPATHIE, 0  # divisé par la longueur ensuite
+    raise ValueError(f"'{propriete}' is not an additive property (pI cannot be profiled)")
+
+# Propriétés dont la distribution sur toute la bibliothèque peut être calculée exactement
+PROPRIETES_PROFIL = ['Hydrophobics', 'Charged', 'Polars', 'Glycines', 'Molecular weight', 'Net charge', 'GRAVY']
+
+def _comptes_par_valeur(listes, valeurs, propriete, ph, message):
+    """Propriété à une dimension (valeur affichée croissante avec la somme entière) : comptes exacts
+    par valeur affichée. Histogramme dense int64 des sommes des premières positions, combiné par
+    sommes cumulées avec l'histogramme creux des sommes des dernières positions.
+    Toutes les limites sont vérifiées avant la convolution"""
+    choix = [np.unique(valeurs[pos_idx, :len(pos), 0], return_counts=True) for pos_idx, pos in enumerate(listes)]
+    # Préfixe dense : étendue bornée et comptes cumulés représentables en int64
+    n_dense, etendue = 0, 1
+    for entiers, _ in choix:
+        if etendue + int(entiers[-1] - entiers[0]) > LIMITE_ETATS or calcul_total(listes[:n_dense + 1]) >= 2**63:
+            break
+        etendue += int(entiers[-1] - entiers[0])
+        n_dense += 1
+    # Suffixe creux : sommes distinctes et leur nombre d'occurrences
+    suffixe, poids = np.zeros(1, dtype=np.int64), np.ones(1, dtype=np.int64)
+    for entiers, repetitions in choix[n_dense:]:
+        if len(suffixe) * len(entiers) > LIMITE_ETATS or calcul_total(listes[n_dense:]) >= 2**31:
+            raise ValueError(message)
+        suffixe = np.concatenate([suffixe + entier for entier in entiers])
+        poids = np.concatenate([poids * int(repetition) for repetition in repetitions])
+        ordre = np.argsort(suffixe, kind='stable')
+        suffixe = suffixe[ordre]
+        debuts = np.flatnonzero(np.concatenate([[True], suffixe[1:] != suffixe[:-1]]))
+        suffixe, poids = suffixe[debuts], np.add.reduceat(poids[ordre], debuts)
+    # Classes de sommes de même valeur affichée, parcourues par blocs (la valeur croît avec la somme)
+    minimum = sum(int(entiers[0]) for entiers, _ in choix)
+    maximum = sum(int(entiers[-1]) for entiers, _ in choix)
+    if maximum - minimum >= 10 * LIMITE_ETATS:
+        raise ValueError(message)
+    premieres, affichees = [], []
+    for bloc in range(minimum, maximum + 1, 10**6):
+        sommes = np.arange(bloc, min(bloc + 10**6, maximum + 1), dtype=np.int64)
+        valeur = _valeur_affichee(propriete, sommes[:, None], len(listes), ph)
+        nouvelles = np.concatenate([[not affichees or valeur[0] != affichees[-1][-1]], valeur[1:] != valeur[:-1]])
+        premieres.append(sommes[nouvelles])
+        affichees.append(valeur[nouvelles])
+    premieres, affichees = np.concatenate(premieres), np.concatenate(affichees)
+    if len(premieres) * len(suffixe) > 10 * LIMITE_ETATS:
+        raise ValueError(message)
+    # Convolution dense du préfixe
+    comptes = np.ones(1, dtype=np.int64)
+    for entiers, repetitions in choix[:n_dense]:
+        suivants = np.zeros(len(comptes) + int(entiers[-1] - entiers[0]), dtype=np.int64)
+        for entier, repetition in zip(entiers - entiers[0], repetitions):
+            suivants[entier:entier + len(comptes)] += comptes if repetition == 1 else comptes * int(repetition)
+        comptes = suivants
+    debut_dense = sum(int(entiers[0]) for entiers, _ in choix[:n_dense])
+    cumules = np.concatenate([[0], np.cumsum(comptes)])
+    # Comptes par classe : sommes des poids du suffixe fois les écarts de comptes cumulés du préfixe,
+    # en deux moitiés de 32 bits pour rester exacts en int64 (poids totaux < 2**31)
+    hauts, bas = cumules >> 32, cumules & 0xFFFFFFFF
+    total_hauts = np.zeros(len(premieres), dtype=np.int64)
+    total_bas = np.zeros(len(premieres), dtype=np.int64)
+    dernieres = np.concatenate([premieres[1:] - 1, [maximum]])
+    for somme, poid in zip(suffixe, poids):
+        fin = np.clip(dernieres - somme - debut_dense + 1, 0, len(comptes))
+        debut = np.clip(premieres - somme - debut_dense, 0, len(comptes))
+        total_hauts += int(poid) * (hauts[fin] - hauts[debut])
+        total_bas += int(poid) * (bas[fin] - bas[debut])
+    comptes = total_hauts.astype(object) * 2**32 + total_bas.astype(object)
+    non_nuls = comptes != 0
+    if calcul_total(listes) < 2**63:
+        comptes = comptes.astype(np.int64)
+    return affichees[non_nuls], comptes[non_nuls]
+
+def distribution_propriete(listes, propriete, ph=7.0):
+    """Distribution exacte d'une propriété sur toute la bibliothèque, sans énumération :
+    convolution des histogrammes des sommes entières de chaque position (_dimensions_propriete),
+    regroupées par valeur affichée (même arrondi que calculer_proprietes_lot)
+    Retourne un DataFrame (Value, Count, Fraction) ; les comptes sont des entiers exacts"""
+    message = f"Too many distinct values to compute the exact {propriete} distribution of this library"
+    valeurs, _ = _tables_entieres(listes, [propriete])
+    total = calcul_total(listes)
+
+    if valeurs.shape[2] == 1:
+        affichees, comptes = _comptes_par_valeur(listes, valeurs, propriete, ph, message)
+    else:
+        # Charge nette : vecteurs des comptes de résidus ionisables atteignables, suivis de façon creuse
+        origine, multiplicateurs, increments = _codage_etats(listes, valeurs, message)
+        cles = np.array([-origine @ multiplicateurs], dtype=np.int64)
+        comptes = np.ones(1, dtype=np.int64)
+        for pos_idx, increment in enumerate(increments):
+            distincts, repetitions = np.unique(increment, return_counts=True)
+            if len(cles) * len(distincts) > LIMITE_ETATS:
+                raise ValueError(message)
+            cles = np.concatenate([cles + distinct for distinct in distincts])
+            # Entiers Python (dtype object) dès que les comptes peuvent dépasser 2**63
+            dtype = np.int64 if calcul_total(listes[:pos_idx + 1]) < 2**63 else object
+            comptes = np.concatenate([comptes.astype(dtype) * int(repetition) for repetition in repetitions])
+            ordre = np.argsort(cles, kind='stable')
+            cles = cles[ordre]
+            debuts = np.flatnonzero(np.concatenate([[True], cles[1:] != cles[:-1]]))
+            cles, comptes = cles[debuts], np.add.reduceat(comptes[ordre], debuts)
+        affichees = _valeur_affichee(propriete, _decoder_etats(cles, origine, multiplicateurs), len(listes), ph)
+        ordre = np.argsort(affichees, kind='stable')
+        affichees, debuts = np.unique(affichees[ordre], return_index=True)
+        comptes = np.add.reduceat(comptes[ordre], debuts)
+    return pd.DataFrame({
+        'Value': affichees,
+        'Count': comptes,
+        'Fraction': np.array([int(c) / total for c in comptes], dtype=np.float64),
+    })
+
+def resumer_distribution(distribution):
+    """Statistiques descriptives d'une distribution (moyenne, écart-type, min, médiane, max)"""
+    valeurs = distribution['Value'].to_numpy(dtype=np.float64)
+    comptes = [int(c) for c in distribution['Count']]
+    total = sum(comptes)
+    moyenne = sum(v * c for v, c in zip(valeurs, comptes)) / total
+    variance = sum((v - moyenne) ** 2 * c for v, c in zip(valeurs, comptes)) / total
+    cumul = 0
+    for v, c in zip(valeurs, comptes):
+        cumul += c
+        if 2 * cumul >= total:
+            mediane = v
+            break
+    return {
+        'Mean': float(moyenne),
+        'Std': math.sqrt(variance),
+        'Min': float(valeurs[0]),
+        'Median': float(mediane),
+        'Max': float(valeurs[-1]),
     }
 
-def highlight_motif(sequence: str, motif: str) -> str:
-    result = []
-    for aa, m in zip(sequence, motif):
-        if m != '-':  # position du motif
-            result.append(f"<span style='color:red; font-weight:bold'>{aa}</span>")
+def compter_intervalle(distribution, minimum=None, maximum=None):
+    """Nombre exact de séquences dont la propriété est comprise dans [minimum, maximum]"""
+    selection = np.ones(len(distribution), dtype=bool)
+    if minimum is not None:
+        selection &= distribution['Value'].to_numpy() >= minimum
+    if maximum is not None:
+        selection &= distribution['Value'].to_numpy() <= maximum
+    return sum(int(c) for c in distribution['Count'][selection])
+
+def profil_bibliotheque(listes, ph=7.0):
+    """Distributions exactes de toutes les propriétés additives de la bibliothèque
+    Retourne (dictionnaire propriété -> distribution, tableau des statistiques)"""
+    distributions = {propriete: distribution_propriete(listes, propriete, ph) for propriete in PROPRIETES_PROFIL}
+    resume = pd.DataFrame({propriete: resumer_distribution(d) for propriete, d in distributions.items()}).T
+    return distributions, resume
+
+# Nombre maximal de vecteurs de sommes partielles suivis (recherches sous contraintes, distributions)
+LIMITE_ETATS = 20000000
+
+def _tables_entieres(restreintes, proprietes):
+    """Valeurs entières (positions x choix x dimensions) des propriétés données,
+    et tranche des dimensions de chaque propriété"""
+    dimensions, tranches = [], {}
+    for propriete in proprietes:
+        dims = _dimensions_propriete(propriete)
+        tranches[propriete] = slice(len(dimensions), len(dimensions) + len(dims))
+        dimensions += dims
+    valeurs = np.zeros((len(restreintes), max((len(pos) for pos in restreintes), default=1), len(dimensions)), dtype=np.int64)
+    for d, dimension in enumerate(dimensions):
+        for pos_idx, pos in enumerate(restreintes):
+            valeurs[pos_idx, :len(pos), d] = [dimension.get(aa, 0) for aa in pos]
+    return valeurs, tranches
+
+def _sommes_entieres(codes, valeurs):
+    """Sommes entières (séquences x dimensions) des valeurs des choix effectués"""
+    sommes = np.zeros((len(codes), valeurs.shape[2]), dtype=np.int64)
+    for pos_idx in range(codes.shape[1]):
+        sommes += valeurs[pos_idx, codes[:, pos_idx]]
+    return sommes
+
+def _codage_etats(restreintes, valeurs, message):
+    """Code chaque vecteur de sommes partielles par un entier (base mixte couvrant toutes les sommes
+    atteignables). Retourne (origine, multiplicateurs, clé ajoutée par chaque choix de chaque position)"""
+    origine = np.zeros(valeurs.shape[2], dtype=np.int64)
+    etendue = np.zeros(valeurs.shape[2], dtype=np.int64)
+    for pos_idx, pos in enumerate(restreintes):
+        choix = valeurs[pos_idx, :len(pos)]
+        origine += np.minimum(choix.min(axis=0), 0)
+        etendue += choix.max(axis=0) - np.minimum(choix.min(axis=0), 0)
+    tailles = [int(t) + 1 for t in etendue]
+    if math.prod(tailles) >= 2**63:
+        raise ValueError(message)
+    multiplicateurs = np.array([math.prod(tailles[d + 1:]) for d in range(len(tailles))], dtype=np.int64)
+    increments = [valeurs[pos_idx, :len(pos)] @ multiplicateurs for pos_idx, pos in enumerate(restreintes)]
+    return origine, multiplicateurs, increments
+
+def _union_decalee(cles, decalages, limite):
+    """Clés distinctes triées de cles + d pour chaque décalage d, ou None au-delà de limite clés
+    cles est triée : chaque tri stable ne fait que fusionner deux suites déjà triées"""
+    decalages = np.unique(decalages)
+    union = cles + decalages[0]
+    for decalage in decalages[1:]:
+        union = np.sort(np.concatenate([union, cles + decalage]), kind='stable')
+        union = union[np.concatenate([[True], union[1:] != union[:-1]])]
+        if len(union) > limite:
+            return None
+    return union
+
+def _decoder_etats(cles, origine, multiplicateurs):
+    """Vecteurs de sommes (états x dimensions) codés par _codage_etats"""
+    sommes = np.zeros((len(cles), len(multiplicateurs)), dtype=np.int64)
+    for d, multiplicateur in enumerate(multiplicateurs):
+        sommes[:, d], cles = np.divmod(cles, multiplicateur)
+    return sommes + origine
+
+def _tables_contraintes(restreintes, contraintes, ph=7.0):
+    """Prépare la recherche sous contraintes de propriétés, en sommes entières exactes
+    etats[pos] : clés triées des vecteurs de sommes atteignables par les pos premières positions
+    solutions[pos] : nombre de façons de compléter chacun en une séquence dont toutes les valeurs
+    affichées (arrondies comme dans calculer_proprietes_lot) sont dans les fenêtres
+    Retourne (increments, etats, solutions)"""
+    message = "Too many property combinations to track: use fewer or narrower constraints"
+    valeurs, tranches = _tables_entieres(restreintes, list(contraintes))
+    origine, multiplicateurs, increments = _codage_etats(restreintes, valeurs, message)
+    etats = [np.array([-origine @ multiplicateurs], dtype=np.int64)]
+    n_etats = 1
+    for increment in increments:
+        etats.append(_union_decalee(etats[-1], increment, LIMITE_ETATS - n_etats))
+        if etats[-1] is None:
+            raise ValueError(message)
+        n_etats += len(etats[-1])
+
+    sommes = _decoder_etats(etats[-1], origine, multiplicateurs)
+    solutions = [None] * len(restreintes) + [_dans_fenetres(sommes, tranches, contraintes, len(restreintes), ph).astype(np.int64)]
+    for pos_idx in range(len(restreintes) - 1, -1, -1):
+        distincts, repetitions = np.unique(increments[pos_idx], return_counts=True)
+        # Entiers Python (dtype object) seulement là où le nombre de suffixes dépasse 2**63
+        dtype = np.int64 if calcul_total(restreintes[pos_idx:]) < 2**63 else object
+        total = np.zeros(len(etats[pos_idx]), dtype=dtype)
+        for increment, repetition in zip(distincts, repetitions):
+            suivantes = solutions[pos_idx + 1][np.searchsorted(etats[pos_idx + 1], etats[pos_idx] + increment)]
+            total = total + int(repetition) * suivantes.astype(dtype)
+        solutions[pos_idx] = total
+    return increments, etats, solutions
+
+def _suffixes_contraintes(tables, pos_idx, cles):
+    """Nombre de solutions prolongeant chaque clé d'état atteinte après pos_idx positions"""
+    _, etats, solutions = tables
+    indices = np.minimum(np.searchsorted(etats[pos_idx], cles), len(etats[pos_idx]) - 1)
+    return np.where(etats[pos_idx][indices] == cles, solutions[pos_idx][indices], 0)
+
+def _decoder_rangs_contraintes(rangs, restreintes, tables):
+    """Décode des rangs pris dans le sous-espace des séquences respectant les contraintes
+    Toutes les séquences avancent ensemble, position par position"""
+    increments, etats, solutions = tables
+    rangs = np.array(rangs, dtype=solutions[0].dtype)
+    codes = np.zeros((len(rangs), len(restreintes)), dtype=np.uint8)
+    cles = np.full(len(rangs), etats[0][0], dtype=np.int64)
+    for pos_idx, pos in enumerate(restreintes):
+        choisi = np.zeros(len(rangs), dtype=bool)
+        for i in range(len(pos)):
+            candidats = cles + increments[pos_idx][i]
+            n_suffixes = _suffixes_contraintes(tables, pos_idx + 1, candidats)
+            # Le choix i est retenu si le rang tombe dans ses suffixes, sinon on les saute
+            retenu = ~choisi & (rangs < n_suffixes)
+            codes[retenu, pos_idx] = i
+            cles[retenu] = candidats[retenu]
+            rangs = np.where(~choisi & ~retenu, rangs - n_suffixes, rangs)
+            choisi |= retenu
+    return codes
+
+def _rangs_contraintes(codes, restreintes, tables):
+    """Inverse de _decoder_rangs_contraintes : rang de chaque séquence parmi celles qui respectent
+    les contraintes. Retourne (rangs des séquences retenues, masque de ces séquences)"""
+    increments, etats, solutions = tables
+    rangs = np.zeros(len(codes), dtype=solutions[0].dtype)
+    cles = np.full(len(codes), etats[0][0], dtype=np.int64)
+    for pos_idx, pos in enumerate(restreintes):
+        colonne = codes[:, pos_idx]
+        # Les suffixes de chaque choix inférieur au choix effectué sont sautés
+        for i in range(len(pos) - 1):
+            avant = colonne > i
+            if avant.any():
+                rangs[avant] += _suffixes_contraintes(tables, pos_idx + 1, cles[avant] + increments[pos_idx][i])
+        cles += increments[pos_idx][colonne]
+    retenues = _suffixes_contraintes(tables, len(restreintes), cles) > 0
+    return rangs[retenues], retenues
+
+def _exclus_contraintes(exclusion, restreintes, listes, tables):
+    """Rangs triés, parmi les solutions des contraintes, des séquences exclues qui en sont"""
+    if exclusion is None or len(exclusion) == 0:
+        return None
+    codes, _ = _restreindre(decoder_rangs(exclusion.rangs, listes), restreintes, listes)
+    rangs, _ = _rangs_contraintes(codes, restreintes, tables)
+    return np.sort(rangs)
+
+def compter_contraintes(motif, contraintes, listes, ph=7.0, exclusion=None):
+    """Nombre exact de séquences correspondant au motif (positions fixes, None = tout)
+    et dont les propriétés sont dans les fenêtres données {propriété: (min, max)} (hors séquences exclues)"""
+    restreintes, errors = analyser_motif(motif or '-' * len(listes), listes)
+    if errors:
+        return 0
+    tables = _tables_contraintes(restreintes, contraintes, ph)
+    exclus = _exclus_contraintes(exclusion, restreintes, listes, tables)
+    n_match = int(tables[2][0][0])
+    return n_match - (0 if exclus is None else len(exclus))
+
+def chercher_contraintes(motif, contraintes, max_results, listes, aleatoire=False, seed=None, offset=0, ph=7.0, exclusion=None):
+    """Cherche les séquences correspondant au motif (positions fixes, None = tout) et dont les
+    propriétés sont dans les fenêtres données {propriété: (min, max)}
+    Les préfixes ne pouvant plus atteindre les fenêtres ne sont jamais explorés : les séquences
+    sont obtenues directement par leur rang parmi les solutions (ordre lexicographique)
+    exclusion : les séquences exclues sont sautées (offset compte les solutions non exclues)"""
+    restreintes, errors = analyser_motif(motif or '-' * len(listes), listes)
+    if errors:
+        return EnsembleSequences(np.zeros((0, len(listes))), listes)
+    tables = _tables_contraintes(restreintes, contraintes, ph)
+    n_match = int(tables[2][0][0])
+    exclus = _exclus_contraintes(exclusion, restreintes, listes, tables)
+    libres = n_match - (0 if exclus is None else len(exclus))
+    if aleatoire:
+        indices = _tirer_rangs(libres, min(max_results, libres), seed)
+    else:
+        indices = range(offset, min(offset + max_results, libres))
+    rangs = list(indices) if exclus is None else _rangs_libres(list(indices), exclus)
+    codes = _decoder_rangs_contraintes(rangs, restreintes, tables)
+    return EnsembleSequences(_recoder(codes, restreintes, listes), listes)
+
+def lire_pssm(uploaded_file, listes):
+    """
+    Lit une matrice de scores position-spécifique (PSSM) alignée sur les positions de la bibliothèque
+    Format : une ligne d'en-tête avec les acides aminés, puis une ligne de scores par position
+    (séparateurs tabulation, virgule, point-virgule ou espace ; étiquette de position facultative)
+    Retourne (pssm, message) avec pssm = [{acide aminé: score}] par position, ou None si invalide
+    """
+    try:
+        content = uploaded_file.getvalue().decode('utf-8')
+        lines = [re.split(r"[\s,;]+", line.strip()) for line in content.split('\n') if line.strip() and not line.startswith('#')]
+        if len(lines) == 0:
+            return None, "❌ Empty file"
+        entete = [aa.upper() for aa in lines[0]]
+        if entete and entete[0] not in 'ACDEFGHIKLMNPQRSTVWY':
+            entete = entete[1:]  # colonne d'étiquettes de position
+        for aa in entete:
+            if len(aa) != 1 or aa not in 'ACDEFGHIKLMNPQRSTVWY':
+                return None, f"❌ Header: '{aa}' is not an amino acid"
+        if len(entete) != len(set(entete)):
+            return None, "❌ Header: duplicated amino acids"
+        if len(lines) - 1 != len(listes):
+            return None, f"❌ {len(lines) - 1} score rows for {len(listes)} positions"
+
+        pssm = []
+        for i, (line, pos) in enumerate(zip(lines[1:], listes), 1):
+            if len(line) == len(entete) + 1:
+                line = line[1:]
+            if len(line) != len(entete):
+                return None, f"❌ Position {i}: {len(line)} scores for {len(entete)} amino acids"
+            try:
+                scores = dict(zip(entete, map(float, line)))
+            except ValueError:
+                return None, f"❌ Position {i}: scores must be numbers"
+            manquants = [aa for aa in pos if aa not in scores or math.isnan(scores[aa])]
+            if manquants:
+                return None, f"❌ Position {i}: no score for {', '.join(manquants)}"
+            pssm.append(scores)
+        return pssm, "✅ Valid score matrix"
+    except Exception as e:
+        return None, f"❌ Error reading the file: {str(e)}"
+
+def _table_pssm(pssm, listes):
+    """Table (positions x choix) des scores de chaque acide aminé proposé à chaque position"""
+    table = np.full((len(listes), max((len(pos) for pos in listes), default=1)), -np.inf)
+    for pos_idx, (scores, pos) in enumerate(zip(pssm, listes)):
+        table[pos_idx, :len(pos)] = [scores[aa] for aa in pos]
+    return table
+
+def scorer_sequences(sequences, pssm):
+    """Score PSSM (somme des scores par position) de chaque séquence d'un EnsembleSequences"""
+    colonnes = np.ascontiguousarray(sequences.codes.T)
+    return _somme_positions(colonnes, _table_pssm(pssm, sequences.listes))
+
+def _meilleures_independantes(table, listes, k):
+    """k meilleures combinaisons de choix, positions indépendantes, par score décroissant
+    Chaque combinaison est décrite par son rang dans le classement des choix de chaque position ;
+    elle a un parent unique (arbre de recherche), donc le tas n'en contient jamais de doublon"""
+    ordres = [np.argsort(-table[pos_idx, :len(pos)], kind='stable') for pos_idx, pos in enumerate(listes)]
+    ecarts = [table[pos_idx, ordre[0]] - table[pos_idx, ordre] for pos_idx, ordre in enumerate(ordres)]
+    # Positions à plusieurs choix, triées par le coût de leur premier écart au meilleur choix :
+    # déplacer un écart vers la position suivante ne peut alors jamais améliorer le score
+    variables = sorted((pos_idx for pos_idx in range(len(listes)) if len(listes[pos_idx]) > 1), key=lambda p: ecarts[p][1])
+    rangs = []
+    tas = [(0.0, ())]  # (perte par rapport au meilleur score, rangs non nuls des positions variables)
+    while tas and len(rangs) < k:
+        perte, etat = heapq.heappop(tas)
+        rangs.append(etat)
+        # Etat : tuple de (indice dans variables, rang du choix), la dernière entrée est la plus à droite
+        if not etat:
+            if variables:
+                heapq.heappush(tas, (ecarts[variables[0]][1], ((0, 1),)))
+            continue
+        m, r = etat[-1]
+        pos = variables[m]
+        if r + 1 < len(listes[pos]):  # choix suivant à la dernière position modifiée
+            heapq.heappush(tas, (perte + ecarts[pos][r + 1] - ecarts[pos][r], etat[:-1] + ((m, r + 1),)))
+        if m + 1 < len(variables):
+            suivante = variables[m + 1]
+            # Nouvel écart à la position suivante
+            heapq.heappush(tas, (perte + ecarts[suivante][1], etat + ((m + 1, 1),)))
+            if r == 1:  # ou déplacement du premier écart vers la position suivante
+                heapq.heappush(tas, (perte + ecarts[suivante][1] - ecarts[pos][1], etat[:-1] + ((m + 1, 1),)))
+
+    codes = np.tile(np.array([ordre[0] for ordre in ordres], dtype=np.uint8), (len(rangs), 1))
+    for ligne, etat in enumerate(rangs):
+        for m, r in etat:
+            codes[ligne, variables[m]] = ordres[variables[m]][r]
+    return codes
+
+def _meilleures_automate(table, listes, automate, k):
+    """k meilleures séquences reconnues par l'automate, par score décroissant
+    Recherche best-first où chaque préfixe est évalué par son score plus le meilleur score
+    exact atteignable jusqu'à un état final ; les choix frères ne sont empilés qu'au besoin"""
+    enfants, _ = _tables_automate(listes, automate)
+    transitions, etat_final = automate
+    n_etats = len(transitions)
+    # tries[pos][état] = [(meilleur gain restant via ce choix, choix, état suivant)] décroissant
+    meilleur = [0.0 if etat == etat_final else -np.inf for etat in range(n_etats)]
+    tries = [None] * len(listes)
+    for pos_idx in range(len(listes) - 1, -1, -1):
+        tries[pos_idx] = [
+            sorted(((table[pos_idx, i] + meilleur[suivant], i, suivant) for i, suivant in enfants[pos_idx][etat]),
+                   key=lambda choix: -choix[0])
+            for etat in range(n_etats)
+        ]
+        meilleur = [options[0][0] if options else -np.inf for options in tries[pos_idx]]
+
+    codes = []
+    compteur = itertools.count()  # départage les égalités dans l'ordre d'insertion
+    tas = []
+    if tries and tries[0][0]:
+        tas.append((-tries[0][0][0][0], next(compteur), 0, 0, 0, 0.0, ()))
+    while tas and len(codes) < k:
+        _, _, pos_idx, etat, j, acquis, prefixe = heapq.heappop(tas)
+        options = tries[pos_idx][etat]
+        if j + 1 < len(options):  # choix frère suivant pour le même préfixe
+            heapq.heappush(tas, (-(acquis + options[j + 1][0]), next(compteur), pos_idx, etat, j + 1, acquis, prefixe))
+        _, i, suivant = options[j]
+        prefixe = prefixe + (i,)
+        if pos_idx + 1 == len(listes):
+            codes.append(prefixe)
         else:
-            result.append(aa)
+            acquis = acquis + table[pos_idx, i]
+            heapq.heappush(tas, (-(acquis + tries[pos_idx + 1][suivant][0][0]), next(compteur), pos_idx + 1, suivant, 0, acquis, prefixe))
+    return np.array(codes, dtype=np.uint8).reshape(len(codes), len(listes))
+
+def _sans_exclus(meilleures, k, listes, exclusion):
+    """k premiers résultats non exclus d'une recherche ordonnée (meilleures(m) = m premiers résultats)
+    On redemande au moins autant de résultats supplémentaires que d'exclus rencontrés, jusqu'à en avoir k"""
+    if exclusion is None or len(exclusion) == 0:
+        return meilleures(k)
+    m = k
+    while True:
+        codes = meilleures(m)
+        garder = ~exclusion.contient(EnsembleSequences(codes, listes).rangs())
+        if garder.sum() >= k or len(codes) < m:
+            return codes[garder][:k]
+        m = max(2 * m, k + int((~garder).sum()))
+
+def meilleures_sequences(pssm, k, listes, motif=None, flexible=False, exclusion=None):
+    """Retourne les k séquences de la bibliothèque ayant le meilleur score PSSM, par score décroissant,
+    éventuellement filtrées par un motif (positions fixes, ou flexible avec flexible=True)
+    exclusion : les séquences exclues sont sautées
+    Retourne (EnsembleSequences, scores)"""
+    if flexible and motif:
+        automate = compiler_motif_flexible(motif)
+        if automate is None:
+            raise ValueError("Top-K search with a flexible motif requires a motif made only of amino acids and '*'")
+        table = _table_pssm(pssm, listes)
+        codes = _sans_exclus(lambda m: _meilleures_automate(table, listes, automate, m), k, listes, exclusion)
+    else:
+        restreintes, errors = analyser_motif(motif or '-' * len(listes), listes)
+        if errors:
+            codes = np.zeros((0, len(listes)), dtype=np.uint8)
+        else:
+            table = _table_pssm(pssm, restreintes)
+            codes = _sans_exclus(lambda m: _recoder(_meilleures_independantes(table, restreintes, m), restreintes, listes),
+                                 k, listes, exclusion)
+    sequences = EnsembleSequences(codes, listes)
+    return sequences, scorer_sequences(sequences, pssm)
+
+# Matrice de substitution BLOSUM62 (Henikoff & Henikoff, 1992), lignes et colonnes dans l'ordre ci-dessous
+ORDRE_BLOSUM = 'ARNDCQEGHILKMFPSTWYV'
+BLOSUM62_LIGNES = """
+ 4 -1 -2 -2  0 -1 -1  0 -2 -1 -1 -1 -1 -2 -1  1  0 -3 -2  0
+-1  5  0 -2 -3  1  0 -2  0 -3 -2  2 -1 -3 -2 -1 -1 -3 -2 -3
+-2  0  6  1 -3  0  0  0  1 -3 -3  0 -2 -3 -2  1  0 -4 -2 -3
+-2 -2  1  6 -3  0  2 -1 -1 -3 -4 -1 -3 -3 -1  0 -1 -4 -3 -3
+ 0 -3 -3 -3  9 -3 -4 -3 -3 -1 -1 -3 -1 -2 -3 -1 -1 -2 -2 -1
+-1  1  0  0 -3  5  2 -2  0 -3 -2  1  0 -3 -1  0 -1 -2 -1 -2
+-1  0  0  2 -4  2  5 -2  0 -3 -3  1 -2 -3 -1  0 -1 -3 -2 -2
+ 0 -2  0 -1 -3 -2 -2  6 -2 -4 -4 -2 -3 -3 -2  0 -2 -2 -3 -3
+-2  0  1 -1 -3  0  0 -2  8 -3 -3 -1 -2 -1 -2 -1 -2 -2  2 -3
+-1 -3 -3 -3 -1 -3 -3 -4 -3  4  2 -3  1  0 -3 -2 -1 -3 -1  3
+-1 -2 -3 -4 -1 -2 -3 -4 -3  2  4 -2  2  0 -3 -2 -1 -2 -1  1
+-1  2  0 -1 -3  1  1 -2 -1 -3 -2  5 -1 -3 -1  0 -1 -3 -2 -2
+-1 -1 -2 -3 -1  0 -2 -3 -2  1  2 -1  5  0 -2 -1 -1 -1 -1  1
+-2 -3 -3 -3 -2 -3 -3 -3 -1  0  0 -3  0  6 -4 -2 -2  1  3 -1
+-1 -2 -2 -1 -3 -1 -1 -2 -2 -3 -3 -1 -2 -4  7 -1 -1 -4 -3 -2
+ 1 -1  1  0 -1  0  0  0 -1 -2 -2  0 -1 -2 -1  4  1 -3 -2 -2
+ 0 -1  0 -1 -1 -1 -1 -2 -2 -1 -1 -1 -1 -2 -1  1  5 -2 -2  0
+-3 -3 -4 -4 -2 -2 -3 -2 -2 -3 -2 -3 -1  1 -4 -3 -2 11  2 -3
+-2 -2 -2 -3 -2 -1 -2 -3  2 -1 -1 -2 -1  3 -3 -2 -2  2  7 -1
+ 0 -3 -3 -3 -1 -2 -2 -3 -3  3  1 -2  1 -1 -2 -2  0 -3 -1  4
+"""
+BLOSUM62 = {a: dict(zip(ORDRE_BLOSUM, map(int, ligne.split())))
+            for a, ligne in zip(ORDRE_BLOSUM, BLOSUM62_LIGNES.strip().split('\n'))}
+
+MESURES_VOISINS = ['Hamming', 'BLOSUM62']
+
+def _table_voisins(requete, listes, mesure='Hamming'):
+    """Table (positions x choix) du gain de chaque choix pour se rapprocher de la requête :
+    0 / -1 (identique / différent) pour Hamming, score de substitution pour BLOSUM62"""
+    if len(requete) != len(listes):
+        raise ValueError(f"Length {len(requete)} instead of {len(listes)}")
+    if mesure == 'Hamming':
+        return _table_pssm([{aa: -float(aa != q) for aa in pos} for q, pos in zip(requete, listes)], listes)
+    if mesure != 'BLOSUM62':
+        raise ValueError(f"Unknown distance '{mesure}'")
+    inconnus = sorted(set(requete) - set(ORDRE_BLOSUM))
+    if inconnus:
+        raise ValueError(f"'{inconnus[0]}' is not a standard amino acid")
+    return _table_pssm([BLOSUM62[q] for q in requete], listes)
+
+def plus_proches(requete, k, listes, mesure='Hamming', exclusion=None):
+    """k séquences de la bibliothèque les plus proches d'une séquence quelconque (exactes, sans parcours) :
+    la recherche des k meilleures combinaisons s'applique à la table de gains de la requête
+    exclusion : les séquences exclues sont sautées
+    Retourne (EnsembleSequences, distances de Hamming, scores BLOSUM62 ou None)"""
+    requete = requete.upper()
+    table = _table_voisins(requete, listes, mesure)
+    voisins = EnsembleSequences(_sans_exclus(lambda m: _meilleures_independantes(table, listes, m), k, listes, exclusion), listes)
+    colonnes = np.ascontiguousarray(voisins.codes.T)
+    distances = -_somme_positions(colonnes, _table_voisins(requete, listes)).astype(np.int64)
+    scores = _somme_positions(colonnes, table).astype(np.int64) if mesure == 'BLOSUM62' else None
+    return voisins, distances, scores
+
+def plus_proches_lot(requetes, k, listes, mesure='Hamming', exclusion=None):
+    """Plus proches voisins de chaque requête d'une liste, dans un seul DataFrame :
+    Query, Neighbor (1 = le plus proche), Sequence, Distance (Hamming), BLOSUM62 score (si choisi)
+    Les requêtes invalides (longueur, acide aminé inconnu) ont une seule ligne avec l'erreur"""
+    if not isinstance(listes, Bibliotheque):
+        listes = Bibliotheque(listes)
+    tables = []
+    for requete in requetes:
+        try:
+            voisins, distances, scores = plus_proches(requete, k, listes, mesure, exclusion)
+        except ValueError as e:
+            tables.append(pd.DataFrame({'Query': [requete.upper()], 'Error': [str(e)]}))
+            continue
+        df = pd.DataFrame({'Query': requete.upper(), 'Neighbor': np.arange(1, len(voisins) + 1),
+                           'Sequence': voisins.sequences(), 'Distance': distances})
+        if scores is not None:
+            df['BLOSUM62 score'] = scores
+        tables.append(df)
+    colonnes = ['Query', 'Neighbor', 'Sequence', 'Distance'] + (['BLOSUM62 score'] if mesure == 'BLOSUM62' else []) + ['Error']
+    if not tables:
+        return pd.DataFrame(columns=colonnes)
+    resultat = pd.concat(tables, ignore_index=True).reindex(columns=colonnes)
+    for colonne in colonnes[1:-1]:
+        if colonne != 'Sequence':
+            resultat[colonne] = resultat[colonne].astype('Int64')
+    return resultat
+
+# Voisinage mutationnel : séquences de la bibliothèque à distance de Hamming <= d d'un parent
+def _parent_voisinage(parent, restreintes):
+    """Indice du choix identique au parent à chaque position (-1 si sa lettre n'y est pas une option)"""
+    if len(parent) != len(restreintes):
+        raise ValueError(f"The parent has {len(parent)} amino acids instead of {len(restreintes)}")
+    return np.array([pos.index(aa) if aa in pos else -1 for aa, pos in zip(parent, restreintes)], dtype=np.int16)
+
+def _comptes_voisinage(identiques, restreintes, d):
+    """Nombre de séquences à chaque distance 0..d du parent : coefficients du produit des
+    polynômes (identique + différents·x) des positions (entiers exacts)"""
+    comptes = [1] + [0] * d
+    for identique, pos in zip(identiques, restreintes):
+        meme = int(identique >= 0)
+        comptes = [meme * comptes[k] + ((len(pos) - meme) * comptes[k - 1] if k else 0) for k in range(d + 1)]
+    return comptes
+
+def _morceaux_voisinage(identiques, restreintes, listes, d, taille_bloc):
+    """Séquences du voisinage (indices de choix de la bibliothèque), par distance croissante puis
+    par ensemble de positions mutées ; pour chaque ensemble, le produit des choix différents du
+    parent est décodé en base mixte par tranches. Produit (distance, nombre de séquences, générateur de tranches)"""
+    obligatoires = [p for p, identique in enumerate(identiques) if identique < 0]
+    mutables = [p for p, identique in enumerate(identiques) if identique >= 0 and len(restreintes[p]) > 1]
+    # Choix autorisés différents du parent, et parent, convertis une fois pour toutes en indices de la bibliothèque
+    autres = [np.array([pos.index(aa) for i, aa in enumerate(restreinte) if i != identique], dtype=np.uint8)
+              for identique, restreinte, pos in zip(identiques, restreintes, listes)]
+    modele = np.array([pos.index(restreinte[identique]) if identique >= 0 else 0
+                       for identique, restreinte, pos in zip(identiques, restreintes, listes)], dtype=np.uint8)
+    for distance in range(len(obligatoires), d + 1):
+        for ajout in itertools.combinations(mutables, distance - len(obligatoires)):
+            positions = sorted(obligatoires + list(ajout))
+            tailles = [len(autres[p]) for p in positions]
+            n = math.prod(tailles)
+
+            def tranches(positions=positions, tailles=tailles, n=n):
+                for debut in range(0, n, taille_bloc):
+                    indices = np.arange(debut, min(n, debut + taille_bloc), dtype=np.int64)
+                    codes = np.tile(modele, (len(indices), 1))
+                    # La dernière position mutée varie le plus vite
+                    for p, taille in zip(reversed(positions), reversed(tailles)):
+                        codes[:, p] = autres[p][indices % taille]
+                        indices //= taille
+                    yield codes
+
+            yield distance, n, tranches
+
+def iterer_voisinage(parent, d, n, listes, motif=None, contraintes=None, ph=7.0, offset=0, taille_bloc=100000, exclusion=None):
+    """Séquences de la bibliothèque à distance de Hamming au plus d du parent (mutants simples,
+    doubles...), par blocs : distance croissante, puis positions mutées, puis ordre lexicographique
+    motif (positions fixes), contraintes {propriété: (min, max)} : filtres facultatifs
+    offset : nombre de séquences du voisinage (filtré) à sauter"""
+    parent = parent.upper()
+    _parent_voisinage(parent, listes)
+    restreintes, errors = analyser_motif(motif or '-' * len(listes), listes)
+    if errors or n <= 0:
+        return
+    identiques = _parent_voisinage(parent, restreintes)
+    tables = _tables_entieres(listes, list(contraintes)) if contraintes else None
+    filtre = tables is not None or (exclusion is not None and len(exclusion) > 0)
+    en_attente, n_attente = [], 0
+    for _, taille, tranches in _morceaux_voisinage(identiques, restreintes, listes, d, taille_bloc):
+        if not filtre and offset >= taille:
+            offset -= taille  # ensemble de positions entièrement sauté, sans décodage
+            continue
+        for codes in tranches():
+            if tables is not None:
+                valeurs, dims = tables
+                codes = codes[_dans_fenetres(_sommes_entieres(codes, valeurs), dims, contraintes, len(listes), ph)]
+            if exclusion is not None and len(exclusion):
+                codes = codes[~exclusion.contient(EnsembleSequences(codes, listes).rangs())]
+            if offset:
+                saut = min(offset, len(codes))
+                codes, offset = codes[saut:], offset - saut
+            codes = codes[:n]
+            en_attente.append(codes)
+            n_attente += len(codes)
+            n -= len(codes)
+            if n_attente >= taille_bloc or n == 0:
+                yield EnsembleSequences(np.concatenate(en_attente), listes)
+                en_attente, n_attente = [], 0
+            if n == 0:
+                return
+    if n_attente:
+        yield EnsembleSequences(np.concatenate(en_attente), listes)
+
+def chercher_voisinage(parent, d, max_results, listes, motif=None, contraintes=None, ph=7.0, offset=0, exclusion=None):
+    """Comme iterer_voisinage, en un seul EnsembleSequences"""
+    blocs = [bloc.codes for bloc in iterer_voisinage(parent, d, max_results, listes, motif, contraintes, ph, offset, exclusion=exclusion)]
+    return EnsembleSequences(np.concatenate([np.zeros((0, len(listes)), dtype=np.uint8)] + blocs), listes)
+
+def compter_voisinage(parent, d, listes, motif=None, contraintes=None, ph=7.0, exclusion=None):
+    """Nombre exact de séquences de la bibliothèque à chaque distance 0..d du parent (liste)
+    Sans contraintes : produit de polynômes, sans énumération (hors séquences exclues)"""
+    parent = parent.upper()
+    _parent_voisinage(parent, listes)
+    restreintes, errors = analyser_motif(motif or '-' * len(listes), listes)
+    if errors:
+        return [0] * (d + 1)
+    identiques = _parent_voisinage(parent, restreintes)
+    if contraintes:
+        comptes = np.zeros(d + 1, dtype=np.int64)
+        for bloc in iterer_voisinage(parent, d, calcul_total(restreintes), listes, motif, contraintes, ph, exclusion=exclusion):
+            comptes += np.bincount(distances_parent(bloc.codes, parent, listes), minlength=d + 1)
+        return [int(c) for c in comptes]
+    comptes = _comptes_voisinage(identiques, restreintes, d)
+    exclus = _rangs_exclus(exclusion)
+    if exclus is not None:
+        codes, _ = _restreindre(decoder_rangs(exclus, listes), restreintes, listes)
+        distances = (codes != identiques).sum(axis=1)
+        comptes = [c - int(e) for c, e in zip(comptes, np.bincount(distances[distances <= d], minlength=d + 1))]
+    return comptes
+
+def distances_parent(codes, parent, listes):
+    """Distance de Hamming de chaque séquence (matrice d'indices de choix) au parent"""
+    return (codes != _parent_voisinage(parent.upper(), listes)).sum(axis=1)
+
+class Tache:
+    """Opération longue exécutée en arrière-plan par un exécuteur partagé, suivie depuis l'interface
+    etapes : générateur de (avancement, EnsembleSequences du bloc ou None), exécuté dans le thread
+    de travail ; sa valeur de retour éventuelle est conservée dans details
+    a_faire, unite : avancement final attendu et ce qu'il compte ('sequences' ou 'ranks scanned')
+    L'annulation est prise en compte entre deux étapes ; les blocs déjà produits restent disponibles
+    exporter() fait écrire l'export par la tâche elle-même, bloc par bloc, dans le thread de travail"""
+
+    def __init__(self, etapes, a_faire, unite, listes):
+        self.a_faire = a_faire
+        self.unite = unite
+        self.listes = listes
+        self.avancement = 0
+        self.n_resultats = 0
+        self.etat = 'queued'  # puis 'running', 'done', 'cancelled' ou 'failed'
+        self.erreur = None
+        self.details = None
+        self.future = None
+        self.export = None  # chemin de l'export écrit par la tâche (voir exporter)
+        self._etapes = etapes
+        self._options_export = None
+        self._garder = None  # nombre de séquences conservées en mémoire (None : toutes)
+        self._n_gardes = 0
+        self._interrompue = False
+        self._blocs = []
+        self._annulation = threading.Event()
+        self._verrou = threading.Lock()
+
+    def __repr__(self):
+        return f"Tache({self.etat}, {self.avancement:,}/{self.a_faire:,} {self.unite}, {self.n_resultats:,} results)"
+
+    def soumettre(self, executeur):
+        """Confie la tâche à l'exécuteur (elle attend un thread libre si tous sont occupés)"""
+        self.future = executeur.submit(self._executer)
+        return self
+
+    def exporter(self, format_export='csv', premier=1, proprietes=False, ph=7.0, destination=None, garder=None):
+        """Fait écrire toutes les séquences produites dans un export (exporter_sequences) au fil des blocs ;
+        une tâche annulée laisse l'export des blocs déjà produits. Seules les garder premières séquences
+        restent en mémoire pour l'affichage (toutes par défaut). Retourne la tâche"""
+        self._options_export = dict(format_export=format_export, premier=premier, proprietes=proprietes,
+                                    ph=ph, destination=destination)
+        self._garder = garder
+        return self
+
+    def _lots(self):
+        # Blocs produits par les étapes, jusqu'à la fin ou l'annulation
+        while True:
+            try:
+                avancement, bloc = next(self._etapes)
+            except StopIteration as fin:
+                self.details = fin.value
+                return
+            with self._verrou:
+                self.avancement = avancement
+                if bloc is not None and len(bloc):
+                    n_garder = len(bloc) if self._garder is None else min(len(bloc), self._garder - self._n_gardes)
+                    if n_garder > 0:
+                        self._blocs.append(bloc.codes[:n_garder])
+                        self._n_gardes += n_garder
+                    self.n_resultats += len(bloc)
+            if bloc is not None and len(bloc):
+                yield bloc
+            if self._annulation.is_set():
+                self._etapes.close()  # libère les ressources du générateur (ex. pool de processus)
+                self._interrompue = True
+                return
+
+    def _executer(self):
+        if self._annulation.is_set():
+            self.etat = 'cancelled'
+            return
+        self.etat = 'running'
+        try:
+            if self._options_export is None:
+                collections.deque(self._lots(), maxlen=0)
+            else:
+                self.export = exporter_sequences(self._lots(), **self._options_export)
+            # L'état n'est final qu'une fois l'export fermé
+            self.etat = 'cancelled' if self._interrompue else 'done'
+        except Exception as e:
+            self.erreur = str(e)
+            self.etat = 'failed'
+
+    def annuler(self):
+        """Demande l'arrêt de la tâche ; si elle attend encore un thread, elle ne démarrera pas"""
+        self._annulation.set()
+        if self.future is not None and self.future.cancel():
+            self.etat = 'cancelled'
+
+    @property
+    def active(self):
+        return self.etat in ('queued', 'running')
+
+    def fraction(self):
+        """Avancement entre 0 et 1"""
+        return 1.0 if self.a_faire == 0 else min(1.0, self.avancement / self.a_faire)
+
+    def resultats(self, n=None):
+        """Séquences produites jusqu'ici et conservées (les n premières si n est donné), dans l'ordre de production"""
+        with self._verrou:
+            blocs = list(self._blocs)
+        codes, n_codes = [np.zeros((0, len(self.listes)), dtype=np.uint8)], 0
+        for bloc in blocs:
+            if n is not None and n_codes >= n:
+                break
+            codes.append(bloc)
+            n_codes += len(bloc)
+        return EnsembleSequences(np.concatenate(codes)[:n], self.listes)
+
+def _etapes_lots(lots, details=None):
+    """Étapes d'une tâche à partir de lots de séquences : l'avancement compte les séquences produites"""
+    fait = 0
+    for bloc in lots:
+        fait += len(bloc)
+        yield fait, bloc
+    return details() if details is not None else None
+
+def tache_aleatoires(n, listes, seed=None, taille_bloc=100000, exclusion=None):
+    """Tâche produisant les séquences de generer_aleatoires par blocs"""
+    return Tache(_etapes_lots(iterer_aleatoires(n, listes, seed, taille_bloc, exclusion)), n, 'sequences', listes)
+
+def tache_premieres(n, listes, start=0, taille_bloc=100000, exclusion=None):
+    """Tâche produisant les séquences de generer_premieres par blocs"""
+    n = max(0, min(n, compter_libres(listes, exclusion, start)))
+    return Tache(_etapes_lots(iterer_premieres(n, listes, start, taille_bloc, exclusion)), n, 'sequences', listes)
+
+def tache_diversifiees(n, listes, seed=None, methode='maxmin', taille_pool=None, exclusion=None):
+    """Tâche de generer_diversifiees (une seule étape) ; details = (distance minimale, distance moyenne)"""
+    def etapes():
+        sequences, minimum, moyenne = generer_diversifiees(n, listes, seed, methode, taille_pool, exclusion)
+        yield n, sequences
+        return minimum, moyenne
+    return Tache(etapes(), n, 'sequences', listes)
+
+def tache_motif(motif, n, listes, aleatoire=False, seed=None, offset=0, contraintes=None, ph=7.0, taille_bloc=100000, exclusion=None):
+    """Tâche de recherche par motif à positions fixes (contraintes de propriétés facultatives)
+    details = nombre exact de correspondances dans toute la bibliothèque"""
+    if contraintes:
+        def etapes():
+            sequences = chercher_contraintes(motif, contraintes, n, listes, aleatoire, seed, offset, ph, exclusion)
+            yield len(sequences), sequences
+            return compter_contraintes(motif, contraintes, listes, ph, exclusion)
+        return Tache(etapes(), n, 'sequences', listes)
+    n_match = compter_motif(motif, listes, exclusion)
+    lots = iterer_motif(motif, n, listes, aleatoire, seed, offset, taille_bloc, exclusion)
+    a_faire = min(n, max(0, n_match - (0 if aleatoire else offset)))
+    return Tache(_etapes_lots(lots, lambda: n_match), a_faire, 'sequences', listes)
+
+def tache_regex_motif(pattern, n, listes, aleatoire=False, seed=None, n_workers=1, taille_tranche=1000000, taille_bloc=100000, exclusion=None):
+    """Tâche de recherche par motif flexible ; details = nombre exact de correspondances (ou None)
+    Le parcours exhaustif (motifs non compilables) rend compte des rangs parcourus, tranche par tranche"""
+    if compiler_motif_flexible(pattern) is None:
+        # Erreurs signalées immédiatement plutôt qu'à l'exécution de la tâche
+        if aleatoire:
+            raise ValueError("Random matches require a motif made only of amino acids and '*'")
+        try:
+            re.compile(pattern.replace('*', '.*'))
+        except re.error as e:
+            raise ValueError(f"Invalid motif: {e}")
+
+        def etapes():
+            for fin, codes in iterer_tranches_regex(pattern, n, listes, n_workers, taille_tranche, exclusion):
+                yield fin, EnsembleSequences(codes, listes)
+        return Tache(etapes(), calcul_total(listes), 'ranks scanned', listes)
+    n_match = compter_regex_motif(pattern, listes, exclusion)
+    lots = iterer_regex_motif(pattern, n, listes, aleatoire, seed, taille_bloc, n_workers, taille_tranche, exclusion)
+    return Tache(_etapes_lots(lots, lambda: n_match), min(n, n_match) if n_match is not None else n, 'sequences', listes)
+
+def tache_voisinage(parent, d, n, listes, motif=None, contraintes=None, ph=7.0, taille_bloc=100000, exclusion=None):
+    """Tâche d'énumération du voisinage mutationnel d'un parent (iterer_voisinage)
+    details = nombres exacts de séquences à chaque distance 0..d"""
+    _parent_voisinage(parent.upper(), listes)
+    lots = iterer_voisinage(parent, d, n, listes, motif, contraintes, ph, taille_bloc=taille_bloc, exclusion=exclusion)
+    if contraintes:
+        # Le décompte sous contraintes parcourt tout le voisinage : fait dans la tâche, après les résultats
+        return Tache(_etapes_lots(lots, lambda: compter_voisinage(parent, d, listes, motif, contraintes, ph, exclusion)),
+                     n, 'sequences', listes)
+    comptes = compter_voisinage(parent, d, listes, motif, exclusion=exclusion)
+    return Tache(_etapes_lots(lots, lambda: comptes), min(n, sum(comptes)), 'sequences', listes)
+
+SURLIGNAGE = "<span style='color:red; font-weight:bold'>{}</span>"
+
+@functools.lru_cache(maxsize=64)
+def _positions_motif(motif):
+    """Positions fixées par un motif à positions fixes (calculées une fois par motif)"""
+    return tuple(i for i, m in enumerate(decouper_motif(motif)) if m != '-')
+
+def highlight_motif(sequence: str, motif: str) -> str:
+    result = list(sequence)
+    for i in _positions_motif(motif):
+        if i < len(result):  # position du motif
+            result[i] = SURLIGNAGE.format(result[i])
     return "".join(result)
 
+@functools.lru_cache(maxsize=64)
+def _compiler_surlignage(pattern):
+    """Compile une fois le motif flexible : chaque segment fixe (entre les *) devient un groupe,
+    les * des correspondances minimales (chaque segment est pris à sa première occurrence)
+    Retourne (regex compilée, numéros des groupes des segments)"""
+    segments = [seg for seg in pattern.split('*') if seg]
+    groupes = []
+    numero = 1
+    for seg in segments:
+        groupes.append(numero)
+        numero += 1 + re.compile(seg).groups  # groupes éventuels du segment lui-même
+    regex = '.*?'.join(f"({seg})" for seg in segments)
+    return re.compile(regex), tuple(groupes)
+
 def highlight_motif_regex(sequence: str, pattern: str) -> str:
     """Colore uniquement les lettres fixes du pattern selon le regex"""
-    # Convertir le pattern en regex
-    regex_pattern = pattern.replace('*', '.*')
-    
-    match = re.search(regex_pattern, sequence)
+    regex, groupes = _compiler_surlignage(pattern)
+    match = regex.search(sequence) if groupes else None
     if not match:
         return sequence
-    
-    matched_part = match.group()
-    match_start = match.start()
-    
-    # Extraire les segments fixes (entre les *)
-    fixed_segments = [seg for seg in pattern.split('*') if seg]
-    
-    if not fixed_segments:
-        return sequence
-    
-    # Trouver chaque segment dans le match
-    positions_to_color = []
-    search_from = 0
-    
-    for segment in fixed_segments:
-        pos = matched_part.find(segment, search_from)
-        if pos != -1:
-            # Ajouter toutes les positions du segment
-            for i in range(len(segment)):
-                absolute_pos = match_start + pos + i
-                positions_to_color.append(absolute_pos)
-            search_from = pos + len(segment)
-    
-    # Construire le résultat
-    result = ""
+
+    # Construction par tranches : texte brut entre les segments, segments colorés lettre par lettre
+    result = []
     last_pos = 0
-    
-    for pos in sorted(set(positions_to_color)):
-        result += sequence[last_pos:pos]
-        result += f"<span style='color:red; font-weight:bold'>{sequence[pos]}</span>"
-        last_pos = pos + 1
-    
-    result += sequence[last_pos:]
-    
-    return result
+    for groupe in groupes:
+        debut, fin = match.span(groupe)
+        result.append(sequence[last_pos:debut])
+        result.extend(SURLIGNAGE.format(aa) for aa in sequence[debut:fin])
+        last_pos = max(last_pos, fin)
+    result.append(sequence[last_pos:])
+    return "".join(result)
+
+# Formats d'export : extension du fichier et type MIME
+FORMATS_EXPORT = {
+    'csv': ('.csv', 'text/csv'),
+    'csv.gz': ('.csv.gz', 'application/gzip'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    # Matrices de caractéristiques pour l'apprentissage automatique (voir exporter_caracteristiques)
+    'onehot.npy': ('.onehot.npy', 'application/octet-stream'),
+    'descriptors.npy': ('.descriptors.npy', 'application/octet-stream'),
+}
+
+def exporter_sequences(lots, format_export='csv', premier=1, taille_bloc=100000, proprietes=False, ph=7.0, destination=None,
+                       colonnes=None):
+    """Écrit des lots de séquences (EnsembleSequences ou listes de chaînes) au fil de l'eau
+    dans un fichier temporaire, ou dans destination (chemin, ou flux texte ouvert pour le CSV)
+    Les lignes sont numérotées (N°) à partir de premier ; proprietes=True ajoute les colonnes
+    de calculer_proprietes_lot aux lots EnsembleSequences. colonnes : {nom: valeurs} ajoutées
+    après la séquence, une valeur par séquence de l'ensemble des lots (ignorées par les
+    matrices .npy). Retourne le chemin du fichier"""
+    extension, _ = FORMATS_EXPORT[format_export]
+    if destination is None:
+        fd, chemin = tempfile.mkstemp(suffix=extension)
+        os.close(fd)
+    elif isinstance(destination, (str, os.PathLike)):
+        chemin = destination
+    elif format_export != 'csv':
+        raise ValueError("Only CSV can be written to an open stream")
+    else:
+        chemin = None
+
+    if format_export.endswith('.npy'):
+        exporter_caracteristiques(lots, chemin, format_export[:-len('.npy')], ph, taille_bloc=taille_bloc)
+        return chemin
+
+    def tables():
+        # Découpe les lots trop gros pour garder une mémoire bornée à l'écriture
+        numero = premier
+        for lot in lots:
+            for debut in range(0, len(lot), taille_bloc):
+                bloc = lot[debut:debut + taille_bloc]
+                numeros = pd.RangeIndex(numero, numero + len(bloc), name='N°')
+                if isinstance(bloc, EnsembleSequences):
+                    df = bloc.to_pandas(index=numeros)
+                else:
+                    df = pd.DataFrame({'Sequence': bloc}, index=numeros)
+                for nom, valeurs in (colonnes or {}).items():
+                    df[nom] = valeurs[numero - premier:numero - premier + len(bloc)]
+                if proprietes and isinstance(bloc, EnsembleSequences):
+                    df = df.join(calculer_proprietes_lot(bloc, ph).set_index(numeros))
+                yield df
+                numero += len(bloc)
+
+    if format_export == 'parquet':
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export requires pyarrow (pip install pyarrow)")
+        writer = None
+        try:
+            for df in tables():
+                table = pa.Table.from_pandas(df.reset_index(), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(chemin, table.schema)
+                writer.write_table(table.cast(writer.schema))
+            if writer is None:
+                writer = pq.ParquetWriter(chemin, pa.schema([('N°', pa.int64()), ('Sequence', pa.large_string())]))
+        finally:
+            if writer is not None:
+                writer.close()
+        return chemin
+
+    @contextlib.contextmanager
+    def ouvrir(chemin):
+        if format_export != 'csv.gz':
+            with open(chemin, 'w', newline='', encoding='utf-8') as f:
+                yield f
+            return
+        # En-tête gzip sans date ni nom de fichier : le même contenu donne toujours le même fichier
+        with open(chemin, 'wb') as brut, gzip.GzipFile(filename='', mode='wb', fileobj=brut, mtime=0) as compresse, \
+                io.TextIOWrapper(compresse, newline='', encoding='utf-8') as f:
+            yield f
+    with (ouvrir(chemin) if chemin is not None else contextlib.nullcontext(destination)) as f:
+        entete = True
+        for df in tables():
+            df.to_csv(f, header=entete)
+            entete = False
+        if entete:
+            f.write('N°,Sequence\n')
+    return chemin
+
+# Génération massive : tranches indépendantes (une graine dérivée par tranche), écrites en parallèle
+def _generer_tranche(listes, graine, n, espace, exclus, destination, format_export, premier, taille_bloc, proprietes, ph):
+    """Tire et écrit une tranche de la génération massive (exécuté dans un processus de travail)
+    espace : ('libres', debut, fin) indices libres, ('prefixes', n_prefixe, debut, fin), ou None (toute la bibliothèque)"""
+    rng = np.random.default_rng(graine)
+    if espace is None:
+        codes = echantillonner_codes(n, listes, rng, exclus)
+    else:
+        codes = _tirer_intervalle(rng, listes, espace, n, exclus)
+    exporter_sequences(iterer_sequences(codes, listes, taille_bloc), format_export, premier, taille_bloc, proprietes, ph, destination)
+    return destination, len(codes)
+
+def generer_massif(n, listes, destination, seed=None, n_workers=1, n_tranches=None, unique=True, format_export='csv',
+                   taille_bloc=100000, proprietes=False, ph=7.0, exclusion=None):
+    """Génère n séquences aléatoires en n_tranches fichiers (racine_00000.ext, racine_00001.ext...)
+    écrits par n_workers processus. Chaque tranche a son propre générateur, dérivé de seed par
+    SeedSequence.spawn : la même graine et le même nombre de tranches donnent toujours des fichiers
+    identiques à l'octet près, quel que soit le nombre de processus
+    unique=True : l'espace des rangs (hors exclusion) est découpé en intervalles contigus, un par tranche,
+    et le nombre de séquences de chaque tranche suit la loi d'un tirage sans remise global (_repartir) :
+    les séquences sont distinctes dans tout le lot, triées par rang d'un fichier à l'autre
+    unique=False : chaque tranche est un tirage uniforme indépendant de toute la bibliothèque (séquences
+    distinctes dans une tranche, doublons possibles d'une tranche à l'autre)
+    Retourne la liste des (fichier, nombre de séquences)"""
+    extension, _ = FORMATS_EXPORT[format_export]
+    racine = destination[:-len(extension)] if destination.endswith(extension) else destination
+    n_tranches = n_tranches or n_workers
+    exclus = _rangs_exclus(exclusion)
+    libres = calcul_total(listes) - (0 if exclus is None else len(exclus))
+    racine_graines = np.random.SeedSequence(seed)
+    graines = racine_graines.spawn(n_tranches)
+    rng = np.random.default_rng(racine_graines)
+
+    if not unique:
+        comptes = [n // n_tranches + (i < n % n_tranches) for i in range(n_tranches)]
+        espaces = [None] * n_tranches
+        if comptes[0] > libres:
+            raise ValueError(f"Cannot draw {comptes[0]:,} distinct sequences per shard from {libres:,} available ones")
+    else:
+        if n > libres:
+            raise ValueError(f"Cannot draw {n:,} distinct sequences from {libres:,} available ones")
+        espaces, tailles = _decouper_espace(listes, libres, n_tranches, exclus)
+        comptes = _repartir(n, tailles, rng)
+
+    if os.path.dirname(racine):
+        os.makedirs(os.path.dirname(racine), exist_ok=True)
+    fichiers = [f"{racine}_{i:05d}{extension}" for i in range(n_tranches)]
+    premiers = np.concatenate([[1], 1 + np.cumsum(comptes)[:-1]]).tolist()
+    arguments = [(listes, graine, compte, espace, exclus, fichier, format_export, premier, taille_bloc, proprietes, ph)
+                 for graine, compte, espace, fichier, premier in zip(graines, comptes, espaces, fichiers, premiers)]
+    if n_workers <= 1:
+        return [_generer_tranche(*args) for args in arguments]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers, mp_context=_contexte_processus()) as pool:
+        return list(pool.map(_generer_tranche, *zip(*arguments)))
+
+# Encodages des séquences pour l'apprentissage automatique : une matrice (séquences x positions x caractéristiques)
+ENCODAGES = ['onehot', 'descriptors']
+# Taille fixe de l'en-tête des fichiers .npy écrits au fil de l'eau (réécrit à la fin avec le nombre de lignes)
+TAILLE_ENTETE_NPY = 128
+
+def table_caracteristiques(listes, encodage='onehot', ph=7.0):
+    """Vecteur de caractéristiques de chaque choix de chaque position (positions x choix x caractéristiques)
+    onehot : indicatrice de l'acide aminé parmi ACIDES_AMINES (uint8)
+    descriptors : contribution du résidu à chaque propriété de PROPRIETES_PROFIL (float32), tirée des
+    tables de calculer_proprietes ; leur somme sur les positions donne la propriété de la séquence
+    (à la constante près : eau, extrémités, et division par la longueur pour GRAVY)"""
+    largeur = max((len(pos) for pos in listes), default=1)
+    if encodage == 'onehot':
+        table = np.zeros((len(listes), largeur, len(ACIDES_AMINES)), dtype=np.uint8)
+        for pos_idx, pos in enumerate(listes):
+            for i, aa in enumerate(pos):
+                if aa in ACIDES_AMINES:
+                    table[pos_idx, i, ACIDES_AMINES.index(aa)] = 1
+    elif encodage == 'descriptors':
+        table = np.zeros((len(listes), largeur, len(PROPRIETES_PROFIL)), dtype=np.float32)
+        for d, propriete in enumerate(PROPRIETES_PROFIL):
+            par_residu, _ = _propriete_additive(propriete, ph)
+            for pos_idx, pos in enumerate(listes):
+                table[pos_idx, :len(pos), d] = [par_residu.get(aa, 0) for aa in pos]
+    else:
+        raise ValueError(f"Unknown encoding '{encodage}', choose among {', '.join(ENCODAGES)}")
+    return table
+
+def caracteristiques(sequences, encodage='onehot', ph=7.0, table=None):
+    """Matrice de caractéristiques (séquences x positions x caractéristiques) d'un EnsembleSequences :
+    une seule indexation de la table par la matrice des choix"""
+    if table is None:
+        table = table_caracteristiques(sequences.listes, encodage, ph)
+    decalages = np.arange(table.shape[0], dtype=np.intp) * table.shape[1]
+    return np.take(table.reshape(-1, table.shape[2]), sequences.codes + decalages, axis=0)
+
+def _entete_npy(dtype, forme):
+    """En-tête .npy (format 1.0) de TAILLE_ENTETE_NPY octets"""
+    dictionnaire = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False,
+                         'shape': tuple(forme)}).encode('latin1')
+    longueur = TAILLE_ENTETE_NPY - 10
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', longueur) + dictionnaire.ljust(longueur - 1) + b'\n'
+
+def exporter_caracteristiques(lots, destination, encodage='onehot', ph=7.0, taille_shard=None, taille_bloc=100000):
+    """Écrit la matrice de caractéristiques de lots d'EnsembleSequences dans un fichier .npy, bloc par bloc
+    (mémoire indépendante du nombre de séquences) ; np.load(chemin, mmap_mode='r') le relit sans le charger
+    taille_shard : un fichier de taille_shard lignes au plus par tranche (racine_00000.npy, racine_00001.npy...)
+    Retourne la liste des fichiers écrits"""
+    racine = destination[:-len('.npy')] if destination.endswith('.npy') else destination
+    fichiers = []
+    table = f = None
+    lignes = 0
+
+    def ouvrir():
+        # En-tête provisoire, réécrit à la fermeture
+        nonlocal f, lignes
+        fichiers.append(destination if not taille_shard else f"{racine}_{len(fichiers):05d}.npy")
+        f = open(fichiers[-1], 'wb')
+        f.write(_entete_npy(table.dtype, (0,) + table.shape[::2]))
+        lignes = 0
+
+    def fermer():
+        f.seek(0)
+        f.write(_entete_npy(table.dtype, (lignes,) + table.shape[::2]))
+        f.close()
+
+    try:
+        for lot in lots:
+            if not isinstance(lot, EnsembleSequences):
+                raise ValueError("Feature export requires library sequences")
+            if table is None:
+                table = table_caracteristiques(lot.listes, encodage, ph)
+                ouvrir()
+            for debut in range(0, len(lot), taille_bloc):
+                bloc = lot[debut:debut + taille_bloc]
+                while len(bloc):
+                    if taille_shard and lignes == taille_shard:
+                        fermer()
+                        ouvrir()
+                    place = len(bloc) if not taille_shard else min(len(bloc), taille_shard - lignes)
+                    f.write(caracteristiques(bloc[:place], table=table).data)
+                    lignes += place
+                    bloc = bloc[place:]
+        if table is None:
+            # Aucune séquence : un fichier de 0 ligne
+            table = table_caracteristiques([], encodage, ph)
+            ouvrir()
+    finally:
+        if f is not None:
+            fermer()
+    return fichiers
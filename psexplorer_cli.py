@@ -0,0 +1,418 @@
+"""
+Interface en ligne de commande de Peptide Sequence Explorer (sans navigateur)
+Les résultats sont écrits au fil de l'eau, bloc par bloc, sur la sortie standard ou dans un fichier
+
+Exemples :
+    python psexplorer_cli.py random positions.txt -n 1000000 --seed 42 -o random.csv.gz
+    python psexplorer_cli.py random positions.txt -n 10000 --diverse maxmin -o diverse.csv
+    python psexplorer_cli.py first positions.txt -n 100 --start 1001
+    python psexplorer_cli.py bulk positions.txt -n 1000000000 --seed 7 --workers 8 --shards 64 -o bulk/run.parquet
+    python psexplorer_cli.py motif positions.txt "A--[KR]-----------" -n 500 --properties
+    python psexplorer_cli.py motif -n 500 -- positions.txt "---[KR]-----------"   (motif commençant par '-')
+    python psexplorer_cli.py motif positions.txt --batch motifs.txt --count
+    python psexplorer_cli.py regex positions.txt "*K*S*" -n 1000 -o hits.parquet
+    python psexplorer_cli.py random positions.txt -n 100000000 --seed 1 -o train.onehot.npy --shard-rows 10000000
+    python psexplorer_cli.py properties positions.txt sequences.txt
+    python psexplorer_cli.py check positions.txt sequences.txt -o check.csv
+    python psexplorer_cli.py nearest positions.txt sequences.txt -k 5 --distance BLOSUM62
+    python psexplorer_cli.py neighborhood positions.txt AKGLASKPADSTRKLMNPQR -d 3 -o mutants.parquet
+    python psexplorer_cli.py compile positions.txt library.psxlib --random 1000000 --seed 1
+    python psexplorer_cli.py exclude positions.txt synthesized.txt -o done.psxexcl --add previous.psxexcl
+    python psexplorer_cli.py random positions.txt -n 5000 --exclude done.psxexcl -o new_batch.csv
+"""
+import argparse
+import contextlib
+import gzip
+import itertools
+import os
+import sys
+import numpy as np
+import pandas as pd
+from functions import *
+
+
+def charger(chemin):
+    """Analyse le fichier de positions (une seule fois par exécution) ; les fichiers compilés
+    sont projetés en mémoire plutôt que lus"""
+    bibliotheque, message = ouvrir_bibliotheque(chemin)
+    if bibliotheque is None:
+        sys.exit(f"{chemin}: {message}")
+    return bibliotheque
+
+def charger_exclusion(args, bibliotheque):
+    """Ensemble d'exclusion donné par --exclude (liste de séquences ou fichier enregistré), ou None"""
+    if not getattr(args, 'exclude', None):
+        return None
+    with open(args.exclude, 'rb') as f:
+        exclusion, n_ignorees = lire_exclusion(f.read(), bibliotheque)
+    if n_ignorees:
+        print(f"{args.exclude}: {n_ignorees:,} sequence(s) not in the library ignored", file=sys.stderr)
+    return exclusion
+
+def format_sortie(args):
+    """Format d'export demandé, ou déduit de l'extension du fichier de sortie"""
+    if args.format:
+        return args.format
+    for format_export, (extension, _) in sorted(FORMATS_EXPORT.items(), key=lambda f: -len(f[1][0])):
+        if args.output.endswith(extension):
+            return format_export
+    return 'csv'
+
+def ecrire(lots, args, premier=1):
+    """Écrit les lots de séquences au fil de l'eau dans la sortie demandée"""
+    format_export = format_sortie(args)
+    if args.output == '-':
+        if format_export != 'csv':
+            sys.exit("error: only CSV can be written to standard output, use -o FILE")
+        exporter_sequences(lots, 'csv', premier, args.block_size, args.properties, args.ph, destination=sys.stdout)
+    elif format_export.endswith('.npy') and args.shard_rows:
+        fichiers = exporter_caracteristiques(lots, args.output, format_export[:-len('.npy')], args.ph, args.shard_rows, args.block_size)
+        print(f"{len(fichiers)} shard(s) written: {fichiers[0]} ... {fichiers[-1]}", file=sys.stderr)
+    else:
+        exporter_sequences(lots, format_export, premier, args.block_size, args.properties, args.ph, destination=args.output)
+
+def lire_lignes(chemin):
+    """Lignes non vides d'un fichier (ou de l'entrée standard avec '-'), hors commentaires #"""
+    f = sys.stdin if chemin == '-' else open(chemin, encoding='utf-8')
+    with f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line.upper()
+
+def executer_lot(args, bibliotheque, chercher, compter):
+    """Exécute un ou plusieurs motifs (--batch) sur une même bibliothèque déjà analysée
+    chercher(motif) produit les correspondances par blocs, compter(motif) leur nombre exact"""
+    motifs = lire_lignes(args.batch) if args.batch else [args.motif.upper()]
+    if args.count:
+        sortie = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+        with sortie:
+            sortie.write('Motif,Count\n')
+            for motif in motifs:
+                n_match = compter(motif)
+                sortie.write(f"{motif},{'' if n_match is None else n_match}\n")
+        return
+    if not args.batch:
+        ecrire(chercher(motifs[0]), args, 1 if getattr(args, 'random', False) else getattr(args, 'start', 1))
+        return
+
+    # Mode lot : une seule table CSV, la première colonne indique le motif de chaque ligne
+    format_export = format_sortie(args)
+    if format_export not in ('csv', 'csv.gz'):
+        sys.exit("error: batch results are written as CSV or compressed CSV")
+    if args.output == '-':
+        sortie = sys.stdout
+    else:
+        sortie = (gzip.open if format_export == 'csv.gz' else open)(args.output, 'wt', newline='', encoding='utf-8')
+    with sortie:
+        entete = True
+        for motif in motifs:
+            numero = 1
+            for bloc in chercher(motif):
+                numeros = pd.RangeIndex(numero, numero + len(bloc), name='N°')
+                df = bloc.to_pandas(index=numeros)
+                if args.properties:
+                    df = df.join(calculer_proprietes_lot(bloc, args.ph).set_index(numeros))
+                df.insert(0, 'Motif', motif)
+                df.to_csv(sortie, header=entete)
+                entete = False
+                numero += len(bloc)
+        if entete:
+            sortie.write('N°,Motif,Sequence\n')
+
+def commande_random(args):
+    bibliotheque = charger(args.library)
+    exclusion = charger_exclusion(args, bibliotheque)
+    if args.diverse:
+        codes, minimum, moyenne = echantillonner_diversifie(args.n, bibliotheque, args.seed, args.diverse, args.pool, exclusion)
+        if minimum is not None:
+            print(f"Pairwise Hamming distance: minimum {minimum}, mean {moyenne:.3f}", file=sys.stderr)
+        ecrire(iterer_sequences(codes, bibliotheque, args.block_size), args)
+    else:
+        ecrire(iterer_aleatoires(args.n, bibliotheque, args.seed, args.block_size, exclusion), args)
+
+def commande_bulk(args):
+    if args.output == '-':
+        sys.exit("error: bulk generation writes one file per shard, use -o FILE")
+    if args.shard_rows:
+        sys.exit("error: bulk generation shards by --shards, not --shard-rows")
+    bibliotheque = charger(args.library)
+    exclusion = charger_exclusion(args, bibliotheque)
+    # Sans --seed, la graine tirée est affichée pour pouvoir reproduire le lot
+    seed = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+    if args.seed is None:
+        print(f"Seed: {seed}", file=sys.stderr)
+    fichiers = generer_massif(args.n, bibliotheque, args.output, seed, args.workers, args.shards, not args.allow_duplicates,
+                              format_sortie(args), args.block_size, args.properties, args.ph, exclusion)
+    for fichier, n_sequences in fichiers:
+        print(f"{fichier}: {n_sequences:,} sequences", file=sys.stderr)
+
+def commande_first(args):
+    bibliotheque = charger(args.library)
+    exclusion = charger_exclusion(args, bibliotheque)
+    ecrire(iterer_premieres(args.n, bibliotheque, args.start - 1, args.block_size, exclusion), args, args.start)
+
+def commande_motif(args):
+    bibliotheque = charger(args.library)
+    exclusion = charger_exclusion(args, bibliotheque)
+
+    def chercher(motif):
+        _, errors = analyser_motif(motif, bibliotheque)
+        for error in errors:
+            print(f"{motif}: {error}", file=sys.stderr)
+        return iterer_motif(motif, args.n, bibliotheque, args.random, args.seed, args.start - 1, args.block_size, exclusion)
+
+    executer_lot(args, bibliotheque, chercher, lambda motif: compter_motif(motif, bibliotheque, exclusion))
+
+def commande_regex(args):
+    bibliotheque = charger(args.library)
+    exclusion = charger_exclusion(args, bibliotheque)
+
+    def chercher(pattern):
+        return iterer_regex_motif(pattern, args.n, bibliotheque, args.random, args.seed, args.block_size,
+                                  args.workers, args.shard_size, exclusion)
+
+    executer_lot(args, bibliotheque, chercher, lambda pattern: compter_regex_motif(pattern, bibliotheque, exclusion))
+
+def commande_properties(args):
+    bibliotheque = charger(args.library)
+    args.properties = True
+
+    def lots():
+        # Lecture par blocs : les séquences hors bibliothèque sont signalées puis ignorées
+        lignes = lire_lignes(args.sequences)
+        numero = 1
+        while True:
+            bloc = list(itertools.islice(lignes, args.block_size))
+            if not bloc:
+                return
+            codes, valides = encoder_sequences(bloc, bibliotheque)
+            for i in np.flatnonzero(~valides):
+                print(f"Sequence {numero + i} ({bloc[i]}): not in the library, skipped", file=sys.stderr)
+            numero += len(bloc)
+            yield EnsembleSequences(codes[valides], bibliotheque)
+
+    ecrire(lots(), args)
+
+def commande_check(args):
+    bibliotheque = charger(args.library)
+    exclusion = charger_exclusion(args, bibliotheque)
+    sortie = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    with sortie:
+        # Vérification par blocs : appartenance, rang et première position invalide de chaque séquence
+        lignes = lire_lignes(args.sequences)
+        numero = 1
+        while True:
+            bloc = list(itertools.islice(lignes, args.block_size))
+            if not bloc:
+                break
+            df = verifier_sequences(bloc, bibliotheque, exclusion)
+            df.index = pd.RangeIndex(numero, numero + len(bloc), name='N°')
+            df.to_csv(sortie, header=numero == 1)
+            numero += len(bloc)
+        if numero == 1:
+            sortie.write(','.join(['N°'] + list(verifier_sequences([], bibliotheque, exclusion).columns)) + '\n')
+
+def commande_nearest(args):
+    bibliotheque = charger(args.library)
+    exclusion = charger_exclusion(args, bibliotheque)
+    sortie = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    with sortie:
+        # Requêtes traitées par blocs : les résultats sont écrits au fil de l'eau
+        lignes = lire_lignes(args.sequences)
+        entete = True
+        while True:
+            bloc = list(itertools.islice(lignes, args.block_size))
+            if not bloc:
+                break
+            plus_proches_lot(bloc, args.k, bibliotheque, args.distance, exclusion).to_csv(sortie, header=entete, index=False)
+            entete = False
+        if entete:
+            plus_proches_lot([], args.k, bibliotheque, args.distance).to_csv(sortie, index=False)
+
+def commande_neighborhood(args):
+    bibliotheque = charger(args.library)
+    exclusion = charger_exclusion(args, bibliotheque)
+    if args.count:
+        # Nombre exact de membres de la bibliothèque à chaque distance du parent
+        comptes = compter_voisinage(args.parent, args.d, bibliotheque, args.motif, exclusion=exclusion)
+        sortie = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+        with sortie:
+            sortie.write('Mutations,Count\n')
+            for distance, n_voisins in enumerate(comptes):
+                sortie.write(f"{distance},{n_voisins}\n")
+        return
+    ecrire(iterer_voisinage(args.parent, args.d, args.n, bibliotheque, args.motif, offset=args.start - 1,
+                            taille_bloc=args.block_size, exclusion=exclusion), args, args.start)
+
+def commande_exclude(args):
+    bibliotheque = charger(args.library)
+    with open(args.sequences, 'rb') if args.sequences != '-' else contextlib.nullcontext(sys.stdin.buffer) as f:
+        exclusion, n_ignorees = construire_exclusion(f.read(), bibliotheque)
+    if n_ignorees:
+        print(f"{args.sequences}: {n_ignorees:,} sequence(s) not in the library ignored", file=sys.stderr)
+    if args.add:
+        args.exclude = args.add
+        exclusion = exclusion.union(charger_exclusion(args, bibliotheque))
+    exclusion.sauvegarder(args.output)
+    print(f"{len(exclusion):,} excluded sequences written to {args.output}", file=sys.stderr)
+
+def commande_compile(args):
+    bibliotheque = charger(args.library)
+    codes = None
+    if args.first:
+        codes = decoder_bloc(0, args.first, bibliotheque)
+    elif args.random:
+        codes = generer_aleatoires(args.random, bibliotheque, args.seed).codes
+    compiler_bibliotheque(bibliotheque, args.output, codes)
+
+def commande_decompile(args):
+    bibliotheque = charger(args.library)
+    texte = bibliotheque_vers_texte(bibliotheque)
+    if args.output == '-':
+        sys.stdout.write(texte)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(texte)
+
+def commande_stored(args):
+    bibliotheque = charger(args.library)
+    if bibliotheque.codes is None:
+        sys.exit(f"{args.library}: no stored sequences (see the compile command)")
+    ecrire(iterer_sequences(bibliotheque.codes, bibliotheque, args.block_size), args)
+
+def analyseur():
+    """Construit l'analyseur des arguments de la ligne de commande"""
+    commun = argparse.ArgumentParser(add_help=False)
+    commun.add_argument('library', help=f"position file (one line of amino acids per position) or compiled library ({EXTENSION_BINAIRE})")
+    commun.add_argument('-o', '--output', default='-', help="output file (default: standard output, CSV only)")
+    commun.add_argument('--format', choices=list(FORMATS_EXPORT), help="output format (default: from the file extension)")
+    commun.add_argument('--properties', action='store_true', help="add the property columns")
+    commun.add_argument('--ph', type=float, default=7.0, help="pH used for the net charge (default: 7.0)")
+    commun.add_argument('--block-size', type=int, default=100000, help="sequences per written block (default: 100000)")
+    commun.add_argument('--shard-rows', type=int,
+                        help="feature formats (.onehot.npy, .descriptors.npy): one file per N rows, OUTPUT_00000.npy, OUTPUT_00001.npy...")
+    # Séquences à écarter des générations et recherches
+    exclure = argparse.ArgumentParser(add_help=False)
+    exclure.add_argument('--exclude', metavar='FILE',
+                         help=f"sequences never generated nor returned: one sequence per line, or an exclusion set ({EXTENSION_EXCLUSION})")
+
+    parser = argparse.ArgumentParser(
+        prog='psexplorer_cli.py',
+        description="Peptide Sequence Explorer: headless generation, search and property calculation"
+    )
+    commandes = parser.add_subparsers(dest='command', required=True)
+
+    random_parser = commandes.add_parser('random', parents=[commun, exclure], help="uniform random sequences (no duplicates)")
+    random_parser.add_argument('-n', type=int, required=True, help="number of sequences")
+    random_parser.add_argument('--seed', type=int, help="seed for a reproducible draw")
+    random_parser.add_argument('--diverse', choices=METHODES_DIVERSITE,
+                               help="maximize the pairwise Hamming distance: greedy max-min over a uniform candidate pool, "
+                                    "or a per-position balanced design (the distances are printed on standard error)")
+    random_parser.add_argument('--pool', type=int, help="candidates for --diverse maxmin (default: 4 x N)")
+    random_parser.set_defaults(fonction=commande_random)
+
+    bulk_parser = commandes.add_parser('bulk', parents=[commun, exclure],
+                                       help="large uniform random draw written in parallel shards, OUTPUT_00000.csv, OUTPUT_00001.csv...")
+    bulk_parser.add_argument('-n', type=int, required=True, help="number of sequences")
+    bulk_parser.add_argument('--seed', type=int, help="seed for a reproducible draw (default: random, printed on standard error)")
+    bulk_parser.add_argument('--workers', type=int, default=1, help="processes writing the shards (does not change the output)")
+    bulk_parser.add_argument('--shards', type=int, help="number of output files (default: --workers); same seed and shards, same files")
+    bulk_parser.add_argument('--allow-duplicates', action='store_true',
+                             help="draw each shard independently: faster split, duplicates possible across shards")
+    bulk_parser.set_defaults(fonction=commande_bulk)
+
+    first_parser = commandes.add_parser('first', parents=[commun, exclure], help="sequences in alphabetical order")
+    first_parser.add_argument('-n', type=int, required=True, help="number of sequences")
+    first_parser.add_argument('--start', type=int, default=1, help="rank of the first sequence (default: 1)")
+    first_parser.set_defaults(fonction=commande_first)
+
+    for nom, aide, fonction in [('motif', "fixed position motif search ('-', letters, [KR], [^P])", commande_motif),
+                                ('regex', "flexible motif search ('*' = any subsequence)", commande_regex)]:
+        motif_parser = commandes.add_parser(
+            nom, parents=[commun, exclure], help=aide,
+            epilog="A motif starting with '-' must follow '--' together with the library: -- LIBRARY MOTIF"
+        )
+        motif_parser.add_argument('motif', nargs='?', help="motif to search")
+        motif_parser.add_argument('--batch', help="file with one motif per line, run against the same library")
+        motif_parser.add_argument('-n', type=int, default=100, help="maximum matches per motif (default: 100)")
+        motif_parser.add_argument('--random', action='store_true', help="uniform sample of the matches instead of the first ones")
+        motif_parser.add_argument('--seed', type=int, help="seed for --random")
+        motif_parser.add_argument('--count', action='store_true', help="only write the exact number of matches of each motif")
+        if nom == 'motif':
+            motif_parser.add_argument('--start', type=int, default=1, help="rank of the first match (default: 1)")
+        else:
+            motif_parser.add_argument('--workers', type=int, default=1, help="processes for the exhaustive scan of regex motifs")
+            motif_parser.add_argument('--shard-size', type=int, default=1000000, help="sequences per shard of the exhaustive scan")
+        motif_parser.set_defaults(fonction=fonction)
+
+    compile_parser = commandes.add_parser('compile', help=f"compile a position file to the binary format ({EXTENSION_BINAIRE})")
+    compile_parser.add_argument('library', help="position file (text or compiled)")
+    compile_parser.add_argument('output', help=f"compiled library file (e.g. library{EXTENSION_BINAIRE})")
+    stockage = compile_parser.add_mutually_exclusive_group()
+    stockage.add_argument('--first', type=int, help="also store the first N sequences, encoded")
+    stockage.add_argument('--random', type=int, help="also store N random sequences, encoded")
+    compile_parser.add_argument('--seed', type=int, help="seed for --random")
+    compile_parser.set_defaults(fonction=commande_compile)
+
+    decompile_parser = commandes.add_parser('decompile', help="write a library back as a text position file")
+    decompile_parser.add_argument('library', help="compiled library file")
+    decompile_parser.add_argument('-o', '--output', default='-', help="text position file (default: standard output)")
+    decompile_parser.set_defaults(fonction=commande_decompile)
+
+    stored_parser = commandes.add_parser('stored', parents=[commun], help="sequences stored in a compiled library")
+    stored_parser.set_defaults(fonction=commande_stored)
+
+    properties_parser = commandes.add_parser('properties', parents=[commun], help="properties of given sequences")
+    properties_parser.add_argument('sequences', nargs='?', default='-', help="file with one sequence per line (default: standard input)")
+    properties_parser.set_defaults(fonction=commande_properties)
+
+    check_parser = commandes.add_parser('check', parents=[exclure], help="membership, rank and first invalid position of given sequences")
+    check_parser.add_argument('library', help=f"position file or compiled library ({EXTENSION_BINAIRE})")
+    check_parser.add_argument('sequences', nargs='?', default='-', help="file with one sequence per line (default: standard input)")
+    check_parser.add_argument('-o', '--output', default='-', help="CSV output file (default: standard output)")
+    check_parser.add_argument('--block-size', type=int, default=100000, help="sequences checked per block (default: 100000)")
+    check_parser.set_defaults(fonction=commande_check)
+
+    nearest_parser = commandes.add_parser('nearest', parents=[exclure], help="closest library members of given sequences")
+    nearest_parser.add_argument('library', help=f"position file or compiled library ({EXTENSION_BINAIRE})")
+    nearest_parser.add_argument('sequences', nargs='?', default='-', help="file with one sequence per line (default: standard input)")
+    nearest_parser.add_argument('-k', type=int, default=10, help="neighbors per sequence (default: 10)")
+    nearest_parser.add_argument('--distance', choices=MESURES_VOISINS, default='Hamming', help="distance (default: Hamming)")
+    nearest_parser.add_argument('-o', '--output', default='-', help="CSV output file (default: standard output)")
+    nearest_parser.add_argument('--block-size', type=int, default=1000, help="sequences searched per block (default: 1000)")
+    nearest_parser.set_defaults(fonction=commande_nearest)
+
+    neighborhood_parser = commandes.add_parser('neighborhood', parents=[commun, exclure],
+                                               help="library members within D mutations of a parent sequence, by increasing distance")
+    neighborhood_parser.add_argument('parent', help="parent sequence (does not need to be in the library)")
+    neighborhood_parser.add_argument('-d', type=int, default=1, help="maximum Hamming distance to the parent (default: 1)")
+    neighborhood_parser.add_argument('-n', type=int, default=10000000, help="maximum number of sequences (default: 10000000)")
+    neighborhood_parser.add_argument('--start', type=int, default=1, help="rank of the first sequence in the neighborhood (default: 1)")
+    neighborhood_parser.add_argument('--motif', help="fixed position motif the neighbors must also match")
+    neighborhood_parser.add_argument('--count', action='store_true', help="only write the exact number of members at each distance")
+    neighborhood_parser.set_defaults(fonction=commande_neighborhood)
+
+    exclude_parser = commandes.add_parser('exclude', help=f"build an exclusion set ({EXTENSION_EXCLUSION}) from a list of sequences")
+    exclude_parser.add_argument('library', help=f"position file or compiled library ({EXTENSION_BINAIRE})")
+    exclude_parser.add_argument('sequences', nargs='?', default='-', help="file with one sequence per line (default: standard input)")
+    exclude_parser.add_argument('-o', '--output', required=True, help=f"exclusion set file (e.g. done{EXTENSION_EXCLUSION})")
+    exclude_parser.add_argument('--add', metavar='FILE', help="existing exclusion set (or sequence list) merged into the new one")
+    exclude_parser.set_defaults(fonction=commande_exclude)
+    return parser
+
+def main(argv=None):
+    parser = analyseur()
+    args = parser.parse_args(argv)
+    if args.command in ('motif', 'regex') and (args.motif is None) == (args.batch is None):
+        parser.error("give either a motif or --batch FILE")
+    try:
+        args.fonction(args)
+    except BrokenPipeError:
+        # Sortie fermée par le lecteur (ex. | head) : arrêt silencieux
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    except (ValueError, ImportError, OSError) as e:
+        sys.exit(f"error: {e}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Vérifications par force brute : chaque recherche exacte est comparée, sur de petites
+bibliothèques aléatoires énumérées en entier, au résultat du filtre naïf correspondant
+Lancer avec : python -m pytest -q"""
+import itertools
+import random
+import re
+
+import numpy as np
+import pytest
+
+from functions import *
+
+AUTRES_MOTIFS = ['*K*', 'A*', '*A', '*AA*', '*ACA*', '*L*A*', '*KK*K*', '**', '']
+
+
+def bibliotheques(graine, nombre=12, max_positions=6):
+    """Petites bibliothèques aléatoires (1 à 5 options par position), avec toutes leurs séquences
+    dans l'ordre des rangs"""
+    rng = random.Random(graine)
+    for _ in range(nombre):
+        listes = Bibliotheque([sorted(rng.sample(ACIDES_AMINES, rng.randint(1, 5)))
+                               for _ in range(rng.randint(1, max_positions))])
+        yield listes, [''.join(p) for p in itertools.product(*listes)], rng
+
+
+def exclusion_aleatoire(toutes, listes, rng):
+    """Exclusion d'environ une séquence sur cinq, et l'ensemble des séquences exclues"""
+    exclues = [s for s in toutes if rng.random() < 0.2]
+    return construire_exclusion(exclues, listes)[0], set(exclues)
+
+
+def hamming(a, b):
+    return sum(x != y for x, y in zip(a, b))
+
+
+@pytest.mark.parametrize('graine', range(3))
+def test_automate_contre_re_search(graine):
+    for listes, toutes, rng in bibliotheques(graine):
+        motifs = AUTRES_MOTIFS + ['*' + rng.choice(toutes)[:2] + '*', rng.choice(toutes)]
+        exclusion, exclues = exclusion_aleatoire(toutes, listes, rng)
+        for motif in motifs:
+            regex = re.compile(motif.replace('*', '.*'))
+            attendues = [s for s in toutes if regex.search(s)]
+            assert compter_regex_motif(motif, listes) == len(attendues), motif
+            assert chercher_regex_motif(motif, 10**6, listes).sequences() == attendues, motif
+            restantes = [s for s in attendues if s not in exclues]
+            assert compter_regex_motif(motif, listes, exclusion) == len(restantes), motif
+            assert chercher_regex_motif(motif, 10**6, listes, exclusion=exclusion).sequences() == restantes, motif
+
+
+@pytest.mark.parametrize('taille_tranche', [7, 1000000])
+def test_parcours_exhaustif_contre_re_search(taille_tranche):
+    for listes, toutes, _ in bibliotheques(3, nombre=6):
+        for motif in ['*[KR]{2}*', '*[^A]C*', '^[DE]']:
+            regex = re.compile(motif.replace('*', '.*'))
+            attendues = [s for s in toutes if regex.search(s)]
+            trouvees = chercher_regex_motif(motif, 10**6, listes, taille_tranche=taille_tranche).sequences()
+            assert trouvees == attendues, motif
+            assert chercher_regex_motif(motif, 3, listes, taille_tranche=taille_tranche).sequences() == attendues[:3]
+
+
+@pytest.mark.parametrize('graine', range(3))
+def test_meilleures_contre_tri_des_scores(graine):
+    for listes, toutes, rng in bibliotheques(graine):
+        pssm = [{aa: float(rng.randint(-5, 5)) for aa in ACIDES_AMINES} for _ in listes]
+        scores = np.array([sum(p[aa] for p, aa in zip(pssm, s)) for s in toutes])
+        k = rng.randint(1, 30)
+        sequences, obtenus = meilleures_sequences(pssm, k, listes)
+        assert np.allclose(obtenus, np.sort(scores)[::-1][:k])
+        assert len(set(sequences.sequences())) == len(sequences)
+        assert np.allclose([scores[toutes.index(s)] for s in sequences.sequences()], obtenus)
+        for motif in ['*K*', 'A*', '*L*A*']:
+            regex = re.compile(motif.replace('*', '.*'))
+            gardes = [i for i, s in enumerate(toutes) if regex.search(s)]
+            _, obtenus = meilleures_sequences(pssm, k, listes, motif, flexible=True)
+            assert np.allclose(obtenus, np.sort(scores[gardes])[::-1][:k]), motif
+
+
+@pytest.mark.parametrize('graine', range(3))
+def test_voisinage_contre_filtre_hamming(graine):
+    for listes, toutes, rng in bibliotheques(graine):
+        parent = ''.join(rng.choice(ACIDES_AMINES) for _ in listes)
+        exclusion, exclues = exclusion_aleatoire(toutes, listes, rng)
+        for d in range(len(listes) + 1):
+            for exclu in [None, exclusion]:
+                attendues = [s for s in toutes if hamming(s, parent) <= d and (exclu is None or s not in exclues)]
+                trouvees = chercher_voisinage(parent, d, 10**6, listes, exclusion=exclu).sequences()
+                assert sorted(trouvees) == sorted(attendues) and len(set(trouvees)) == len(trouvees)
+                distances = [hamming(s, parent) for s in trouvees]
+                assert distances == sorted(distances)
+                assert compter_voisinage(parent, d, listes, exclusion=exclu) == \
+                    [sum(hamming(s, parent) == k for s in attendues) for k in range(d + 1)]
+                for offset in [0, 3]:
+                    blocs = iterer_voisinage(parent, d, 5, listes, offset=offset, taille_bloc=2, exclusion=exclu)
+                    assert sum((bloc.sequences() for bloc in blocs), []) == trouvees[offset:offset + 5]
+
+
+@pytest.mark.parametrize('graine', range(2))
+def test_distributions_et_contraintes_contre_force_brute(graine):
+    for listes, toutes, rng in bibliotheques(graine, nombre=8):
+        ph = rng.choice([4.2, 7.0, 9.9])
+        proprietes = calculer_proprietes_lot(EnsembleSequences(decoder_bloc(0, len(toutes), listes), listes), ph)
+        for propriete in PROPRIETES_PROFIL:
+            distribution = distribution_propriete(listes, propriete, ph)
+            attendue = proprietes[propriete].value_counts().sort_index()
+            assert np.array_equal(distribution['Value'].to_numpy(), attendue.index.to_numpy()), propriete
+            assert [int(c) for c in distribution['Count']] == attendue.tolist(), propriete
+        for propriete in ['Net charge', 'Molecular weight', 'GRAVY', 'Hydrophobics']:
+            valeurs = sorted(set(proprietes[propriete]))
+            bas, haut = valeurs[len(valeurs) // 3], valeurs[2 * len(valeurs) // 3]
+            dans = (proprietes[propriete] >= bas) & (proprietes[propriete] <= haut)
+            attendues = set(np.array(toutes)[dans.to_numpy()])
+            contraintes = {propriete: (bas, haut)}
+            assert set(chercher_contraintes(None, contraintes, 10**6, listes, ph=ph).sequences()) == attendues, propriete
+            assert compter_contraintes(None, contraintes, listes, ph=ph) == len(attendues), propriete
+
+
+def test_aleatoires_meme_echantillon_par_blocs():
+    listes = Bibliotheque([list('ACDEFGHIK')] * 5)
+    for n in [0, 1, 1000, 50000]:
+        tirage = generer_aleatoires(n, listes, seed=n)
+        blocs = iterer_aleatoires(n, listes, seed=n, taille_bloc=777)
+        assert tirage.sequences() == sum((bloc.sequences() for bloc in blocs), [])
+        assert len(set(tirage.sequences())) == n and tirage.sequences() == sorted(tirage.sequences())
+
+
+def test_rangs_aller_retour():
+    for listes in [Bibliotheque([list('ACD'), list('KR'), list('G'), list('STE')]),
+                   Bibliotheque([list(ACIDES_AMINES)] * 20)]:
+        total = calcul_total(listes)
+        rangs = sorted({0, 1, total // 3, total // 2, total - 1})
+        sequences = decoder_rangs(np.array(rangs, dtype=np.int64 if total < 2**63 else object), listes)
+        assert EnsembleSequences(sequences, listes).rangs().tolist() == rangs